@@ -0,0 +1,39 @@
+import numpy as np
+
+from wledcast.capture.ambilight import EdgeLayout, EdgeSampler, zone_weights
+
+
+def test_strip_order_follows_start_corner_and_direction():
+    layout = EdgeLayout(2, 1, 2, 1, start="bottom-left")
+    assert layout.order() == [
+        ("left", 0),
+        ("top", 0),
+        ("top", 1),
+        ("right", 0),
+        ("bottom", 0),
+        ("bottom", 1),
+    ]
+
+    layout = EdgeLayout(2, 1, 2, 1, corner_mode="separate", start="top-left", clockwise=False)
+    assert layout.order()[:4] == [("top-left", 0), ("left", 0), ("bottom-left", 0), ("bottom", 1)]
+    assert len(layout.order()) == layout.led_count == 10
+
+
+def test_zone_weights_average_fractional_pixels():
+    weights = zone_weights(0, 3, 2, 3)
+    np.testing.assert_allclose(weights, [[2 / 3, 1 / 3, 0], [0, 1 / 3, 2 / 3]])
+
+
+def test_edges_are_sampled_into_their_leds():
+    img = np.zeros((90, 160, 3), dtype=np.uint8)
+    img[:9, :80] = (255, 0, 0)  # top left half
+    img[:9, 80:] = (0, 255, 0)  # top right half
+    img[:, 151:] = (0, 0, 255)  # right edge
+    sampler = EdgeSampler(EdgeLayout(2, 1, 0, 0, depth=0.1, start="top-left"))
+
+    strip = sampler.sample(img)
+
+    assert strip.shape == (1, 3, 3)
+    assert tuple(strip[0, 0]) == (255, 0, 0)
+    assert tuple(strip[0, 1]) == (0, 255, 0)
+    assert tuple(strip[0, 2]) == (0, 0, 255)
@@ -0,0 +1,32 @@
+import numpy as np
+
+from wledcast.capture.change_detector import ChangeDetector
+
+
+def test_static_frames_are_skipped():
+    """Identical frames are only let through once per keepalive interval."""
+    detector = ChangeDetector(keepalive=60)
+    img = np.random.randint(0, 256, size=(64, 64, 3), dtype=np.uint8)
+
+    assert detector.has_changed(img)
+    assert not detector.has_changed(img.copy())
+
+
+def test_keepalive_lets_static_frames_through():
+    detector = ChangeDetector(keepalive=0)
+    img = np.zeros((64, 64, 3), dtype=np.uint8)
+
+    assert detector.has_changed(img)
+    assert detector.has_changed(img)
+
+
+def test_changes_and_resizes_are_detected():
+    detector = ChangeDetector(keepalive=60, stride=8)
+    img = np.zeros((64, 64, 3), dtype=np.uint8)
+    assert detector.has_changed(img)
+
+    changed = img.copy()
+    changed[8, 16] = 255
+    assert detector.has_changed(changed)
+
+    assert detector.has_changed(np.zeros((64, 32, 3), dtype=np.uint8))
@@ -0,0 +1,62 @@
+import json
+import os
+from multiprocessing import Pool
+
+from wledcast.filter_config import FilterConfig
+
+worker_filters = None
+
+
+def init_worker(filters: FilterConfig):
+    global worker_filters
+    worker_filters = filters
+
+
+def worker_snapshot():
+    return worker_filters.snapshot()
+
+
+def test_new_file_is_created_from_defaults(tmp_path):
+    path = tmp_path / "wledcast" / "filter.json"
+    filters = FilterConfig(str(path))
+
+    saved = json.loads(path.read_text())
+    assert saved["version"] == filters.version == 1
+    assert saved["filters"]["brightness"] == filters.current()["brightness"]
+
+
+def test_version_only_moves_when_filters_change(tmp_path):
+    filters = FilterConfig(str(tmp_path / "filter.json"))
+    version, values = filters.snapshot()
+
+    assert not filters.update(values)
+    assert filters.version == version
+    assert filters.update({"brightness": 0.5, "sharpen": None})
+    assert filters.version == version + 1
+    assert filters.current()["brightness"] == 0.5
+    assert filters.current()["sharpen"] is None
+
+
+def test_external_changes_are_reloaded(tmp_path):
+    path = tmp_path / "filter.json"
+    filters = FilterConfig(str(path))
+    version = filters.version
+
+    assert not filters.reload()
+    path.write_text(json.dumps({"version": 10, "filters": {"contrast": 2.0}}))
+    # Make sure the modification time moves on filesystems with coarse timestamps
+    os.utime(path, ns=(filters.mtime + 10**9, filters.mtime + 10**9))
+
+    assert filters.reload()
+    assert filters.version == 10 > version
+    assert filters.current()["contrast"] == 2.0
+
+
+def test_workers_see_updates_without_being_sent_filters(tmp_path):
+    filters = FilterConfig(str(tmp_path / "filter.json"))
+    with Pool(1, init_worker, (filters,)) as pool:
+        filters.update({"saturation": 1.5})
+        version, values = pool.apply(worker_snapshot)
+
+    assert version == filters.version
+    assert values["saturation"] == 1.5
@@ -0,0 +1,107 @@
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from wledcast.capture.filters import AutoLevels, FilterStages, SharedLevels
+
+filters = {
+    "saturation": 1.3,
+    "brightness": 0.3,
+    "contrast": 1.2,
+    "sharpen": 0.1,
+    "balance_r": 1.0,
+    "balance_g": 0.7,
+    "balance_b": 0.45,
+}
+
+
+def frame() -> np.ndarray:
+    return np.random.default_rng(1).integers(0, 256, (32, 64, 3), dtype=np.uint8)
+
+
+def test_stages_match_the_allocating_filters():
+    img = frame()
+    stages = FilterStages()
+
+    brightened = cv2.addWeighted(img, 0.3, np.zeros_like(img), 0.7, 0)
+    contrasted = cv2.addWeighted(
+        brightened, 1.2, np.full_like(brightened, np.mean(brightened)), -0.2, 0
+    )
+    kernel = np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]]) * 0.1
+    kernel[1, 1] += 1
+    sharpened = cv2.filter2D(contrasted, -1, kernel)
+    expected = (sharpened * np.array([1.0, 0.7, 0.45])).astype(np.uint8)
+
+    result = stages.apply(img.copy(), {**filters, "saturation": None})
+
+    assert np.abs(result.astype(int) - expected).max() <= 1
+
+
+def test_saturation_blends_towards_luma():
+    stages = FilterStages()
+    img = np.array([[[200, 40, 40], [90, 90, 90]]], dtype=np.uint8)
+
+    gray = img.copy()
+    stages.saturation(gray, 0.0)
+    assert (gray[0, 0] == gray[0, 0, 0]).all(), "no saturation should leave the luma"
+    assert abs(int(gray[0, 0, 0]) - round(0.2126 * 200 + 0.7874 * 40)) <= 1
+
+    vivid = img.copy()
+    stages.saturation(vivid, 1.5)
+    assert vivid[0, 0, 0] > 200 and vivid[0, 0, 1] < 40
+    assert (vivid[0, 1] == 90).all(), "grays have no colour to change"
+
+
+def test_steady_state_frames_do_not_allocate():
+    stages = FilterStages()
+    img = frame()
+    stages.apply(img.copy(), filters)  # builds kernels, tables and buffers
+    work = img.copy()
+
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        for _ in range(10):
+            np.copyto(work, img)
+            stages.apply(work, filters)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    # A frame is 6 KiB, anything left is small Python objects like cv2.mean's tuple
+    assert peak - baseline < 1024
+
+
+def test_auto_levels_lift_dark_frames_and_keep_their_table_while_steady():
+    stages = FilterStages()
+    stages.auto = AutoLevels(SharedLevels())
+    dark = np.random.default_rng(2).integers(10, 60, (16, 16, 3), dtype=np.uint8)
+    dark[..., 2] //= 2  # a blue cast
+    auto = {"saturation": None, "brightness": None, "contrast": None, "sharpen": None,
+            "balance_r": None, "auto_exposure": 1.0, "auto_balance": 1.0}
+
+    result = stages.apply(dark.copy(), auto)
+    means = result.reshape(-1, 3).mean(axis=0)
+    assert means.mean() > 2 * dark.mean()
+    assert means.max() - means.min() < 5, "gray world should even out the channels"
+
+    lut = stages.auto.lut
+    stages.apply(dark.copy(), auto)
+    assert stages.auto.lut is lut, "the table is only rebuilt when the levels move"
+
+
+def test_workers_share_one_set_of_auto_levels():
+    # Each worker gets every other frame, the levels still move as one
+    shared = SharedLevels()
+    workers = [AutoLevels(shared), AutoLevels(shared)]
+    rng = np.random.default_rng(3)
+    dark = rng.integers(10, 60, (16, 16, 3), dtype=np.uint8)
+    bright = rng.integers(150, 250, (16, 16, 3), dtype=np.uint8)
+
+    workers[0](dark.copy(), 1.0, 1.0)
+    workers[1](bright.copy(), 1.0, 1.0)
+    workers[0](dark.copy(), 1.0, 1.0)
+
+    assert workers[0].low == shared.values[0]
+    assert workers[1].low > workers[0].low
@@ -0,0 +1,34 @@
+from collections import namedtuple
+
+from wledcast.capture.geometry import capture_resolution, fit_to_window, keep_on_desktop
+
+Rect = namedtuple("Rect", "left top right bottom")
+Size = namedtuple("Size", "width height")
+Box = namedtuple("Box", "left top width height")
+
+desktop = Rect(0, 0, 1920, 1080)
+window = Rect(100, 50, 1700, 950)
+
+
+def test_regions_capture_the_whole_window():
+    # A 60x2 output would otherwise crop the box to a thin band across the middle
+    regions = [{"area": [0, 0, 1, 0.1], "output": [0, 0, 60, 1]}]
+    resolution = capture_resolution(Size(60, 2), regions, None)
+
+    assert resolution is None
+    assert fit_to_window(window, desktop, 10, resolution) == (100, 50, 1590, 890)
+
+
+def test_plain_output_crops_to_its_aspect_ratio():
+    resolution = capture_resolution(Size(32, 32), None, None)
+
+    left, top, width, height = fit_to_window(window, desktop, 10, resolution)
+
+    assert width == height == 890
+    assert (left, top) == (100 + 1590 // 2 - 890 // 2, 50)
+
+
+def test_moved_boxes_stay_on_the_desktop():
+    # A window dragged past the right and top edges
+    assert keep_on_desktop(Box(1800, -40, 400, 300), desktop, 10) == (1510, 10)
+    assert keep_on_desktop(Box(200, 100, 400, 300), desktop, 10) == (200, 100)
@@ -0,0 +1,63 @@
+from wledcast.wled.health import HealthMonitor
+from wledcast.wled.sender import DeviceStats
+
+
+class FakeDevice:
+    def __init__(self, host: str, protocol: str = "ddp"):
+        self.host = host
+        self.protocol = protocol
+        self.paused = False
+        self.next_due = 0.0
+        self.last_send_time = 0.0
+        self.stats = DeviceStats()
+        self.keepalives = 0
+
+    def keepalive(self):
+        self.keepalives += 1
+
+
+class FakeSender:
+    def __init__(self, devices: list[FakeDevice]):
+        self.devices = devices
+
+
+def test_device_is_paused_when_it_stops_answering_and_resumed_when_it_is_back():
+    device = FakeDevice("10.0.0.1")
+    monitor = HealthMonitor(FakeSender([device]), None)
+
+    monitor.update(device, {"ver": "0.15.0"})
+    monitor.update(device, None)
+    assert not device.paused, "one missed probe isn't enough"
+    monitor.update(device, None)
+    assert device.paused and not device.stats.as_dict()["reachable"]
+
+    monitor.update(device, {"ver": "0.15.0"})
+    assert not device.paused
+    assert device.keepalives == 1, "the last frame should be resent on resuming"
+
+
+def test_devices_without_http_are_judged_by_socket_errors():
+    device = FakeDevice("10.0.0.2", "e131")
+    monitor = HealthMonitor(FakeSender([device]), None)
+
+    for _ in range(2):
+        device.stats.errors += 3
+        monitor.update(device, None)
+    assert device.paused
+
+    monitor.update(device, None)
+    assert not device.paused
+    # Straight after resuming, one more error pauses it again
+    device.stats.errors += 1
+    monitor.update(device, None)
+    assert device.paused
+
+
+def test_last_info_is_kept_for_the_rate_controller():
+    device = FakeDevice("10.0.0.3")
+    monitor = HealthMonitor(FakeSender([device]), None)
+
+    monitor.update(device, {"leds": {"fps": 42}})
+    assert monitor.info("10.0.0.3") == {"leds": {"fps": 42}}
+    monitor.update(device, None)
+    assert monitor.info("10.0.0.3") is None
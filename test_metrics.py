@@ -0,0 +1,27 @@
+from wledcast.metrics import StageTimes, prometheus_text
+
+
+def test_stage_times_are_split_per_stage():
+    stage_times = StageTimes()
+    for i in range(10):
+        stage_times.record(0.0, 0.01, 0.03, 0.04 + i * 0.001)
+
+    summary = stage_times.summary()
+
+    assert summary["capture"]["p50"] == 0.01
+    assert summary["process"]["count"] == 10
+    assert round(summary["total"]["p95"], 3) == 0.049
+
+
+def test_prometheus_text_has_a_sample_per_device():
+    stats = {"sent": 5, "dropped": 1, "decimated": 0, "errors": 0, "fps": 30.0, "send_seconds": 0.0001,
+             "latch_seconds": 0.0002, "skew_seconds": 0.0}
+    text = prometheus_text(
+        StageTimes().summary(), {"10.0.0.1": stats, "10.0.0.2": stats}, 30, 2
+    )
+
+    assert 'wledcast_frames_sent_total{host="10.0.0.1"} 5' in text
+    assert 'wledcast_frames_dropped_total{host="10.0.0.2"} 1' in text
+    assert 'wledcast_stage_seconds_count{stage="process"} 0' in text
+    assert text.count("# TYPE wledcast_device_fps gauge") == 1
+    assert text.endswith("wledcast_filters_version 2\n")
@@ -66,16 +66,12 @@ def test_ddp_packet_structure():
         
         # Test the new conversion method
         byte_data = rgb_array.flatten().tobytes()
-        writer._send_ddp_data(byte_data)
+        packets = writer.packets(byte_data)
         
-        # Verify socket.sendto was called
-        assert mock_socket_instance.sendto.called, "sendto should have been called"
+        # A frame this small fits in one packet
+        assert len(packets) == 1, "one packet should have been built"
+        packet_data = bytes(packets[0])
         
-        # Get the packet that was sent
-        call_args = mock_socket_instance.sendto.call_args
-        packet_data, address = call_args[0]
-        
-        print(f"    ✓ Packet sent to {address}")
         print(f"    ✓ Packet length: {len(packet_data)} bytes")
         
         # Verify DDP header structure (first 10 bytes)
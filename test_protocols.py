@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from wledcast.wled.pixel_writer import (
+    ArtNetWriter,
+    DnrgbWriter,
+    DrgbWriter,
+    E131Writer,
+    PixelWriter,
+    UdpWriter,
+)
+from wledcast.wled.sender import parse_device
+
+
+def frame(leds: int) -> bytes:
+    return np.arange(leds * 3, dtype=np.uint32).astype(np.uint8).tobytes()
+
+
+def test_ddp_packets_reuse_their_buffers_and_push_on_the_last():
+    writer = PixelWriter("127.0.0.1")
+    first = writer.packets(frame(500))
+    buffers, sequence = [id(packet) for packet in first], first[0][1]
+    second = writer.packets(frame(500))
+
+    assert [id(packet) for packet in second] == buffers
+    assert [packet[0] & 0x01 for packet in second] == [0, 1]
+    assert int.from_bytes(second[1][4:8], "big") == 1200
+    assert second[0][1] == sequence + 1
+    writer.close_socket()
+
+
+def test_dnrgb_splits_frames_into_489_led_chunks():
+    writer = DnrgbWriter("127.0.0.1")
+    data = frame(600)
+    packets = writer.packets(data)
+
+    assert [len(packet) for packet in packets] == [4 + 489 * 3, 4 + 111 * 3]
+    assert packets[1][:4] == bytes([4, 2, 489 >> 8, 489 & 0xFF])
+    assert bytes(packets[1][4:]) == data[489 * 3 :]
+    writer.close_socket()
+
+
+def test_drgb_falls_back_to_dnrgb_for_long_strips():
+    writer = DrgbWriter("127.0.0.1")
+    assert [packet[0] for packet in writer.packets(frame(490))] == [2]
+    assert [packet[0] for packet in writer.packets(frame(491))] == [4, 4]
+    writer.close_socket()
+
+
+def test_e131_and_artnet_send_170_leds_per_universe():
+    e131 = E131Writer("127.0.0.1", universe=3)
+    packets = e131.packets(frame(171))
+    assert [int.from_bytes(packet[113:115], "big") for packet in packets] == [3, 4]
+    assert int.from_bytes(packets[1][123:125], "big") == 1 + 3
+    assert len(packets[1]) == 126 + 3
+    e131.close_socket()
+
+    artnet = ArtNetWriter("127.0.0.1")
+    packets = artnet.packets(frame(171))
+    assert [int.from_bytes(packet[14:16], "little") for packet in packets] == [1, 2]
+    # ArtDmx data is padded to an even length
+    assert int.from_bytes(packets[1][16:18], "big") == 4
+    assert len(packets[1]) == 18 + 4
+    artnet.close_socket()
+
+
+def test_parse_device_reads_the_protocol():
+    assert parse_device("10.0.0.5@e131:2@170x1").protocol == "e131"
+    assert parse_device("10.0.0.5@e131:2").universe == 2
+    spec = parse_device({"host": "10.0.0.5", "protocol": "artnet", "universe": 0})
+    assert (spec.protocol, spec.universe) == ("artnet", 0)
+
+
+def test_writers_without_a_header_fail_when_created():
+    class NoHeaderWriter(UdpWriter):
+        port = 1234
+
+    with pytest.raises(TypeError):
+        NoHeaderWriter("127.0.0.1")
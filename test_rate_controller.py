@@ -0,0 +1,102 @@
+from argparse import Namespace
+
+from wledcast.metrics import StageTimes
+from wledcast.wled.rate_controller import DeviceRate, RateController
+from wledcast.wled.sender import DeviceStats
+
+
+class FakeDevice:
+    def __init__(self, host: str):
+        self.host = host
+        self.fps = None
+        self.explicit_fps = False
+        self.protocol = "ddp"
+        self.paused = False
+        self.stats = DeviceStats()
+
+
+class FakeSender:
+    def __init__(self, hosts: list[str]):
+        self.devices = [FakeDevice(host) for host in hosts]
+
+
+def test_device_rate_backs_off_when_the_device_falls_behind():
+    rate = DeviceRate("10.0.0.1", 40)
+    stats = DeviceStats()
+    stats.sent = 80
+
+    rate.update(stats, 2.0, 40, device_fps=25, min_fps=5, max_fps=60)
+
+    assert rate.loss > 0.3
+    assert rate.ceiling == 32
+
+
+def test_device_rate_probes_higher_while_healthy():
+    rate = DeviceRate("10.0.0.1", 30)
+    stats = DeviceStats()
+    for _ in range(DeviceRate.healthy_periods_needed):
+        stats.sent += 60
+        rate.update(stats, 2.0, 30, device_fps=None, min_fps=5, max_fps=60)
+
+    assert rate.ceiling == 30 + DeviceRate.increase
+
+
+def test_devices_get_their_own_rate_and_the_fastest_sets_the_capture_rate():
+    conf_args = Namespace(fps=40, min_fps=5, max_fps=60, workers=3, executor="process")
+    sender = FakeSender(["fast", "slow"])
+    stage_times = StageTimes()
+    controller = RateController(sender, stage_times, conf_args)
+    for device in sender.devices:
+        device.stats.sent = 80
+    for _ in range(80):
+        stage_times.record(0.0, 0.001, 0.002, 0.003)
+    controller.last_update -= 2.0
+
+    controller.update({"fast": 40, "slow": 20})
+
+    fast, slow = sender.devices
+    assert slow.fps == round(min(40, 80 / 2.0) * DeviceRate.backoff)
+    assert fast.fps == conf_args.fps == 40
+    assert controller.state()["devices"]["fast"]["loss"] == 0.0
+
+
+def test_pipeline_ceiling_comes_from_stage_times_not_frames_produced():
+    conf_args = Namespace(fps=40, min_fps=5, max_fps=60, workers=2, executor="process")
+    sender = FakeSender(["device"])
+    stage_times = StageTimes()
+    controller = RateController(sender, stage_times, conf_args)
+    sender.devices[0].stats.sent = 80
+    # Few frames, as when the picture is static, but each takes 40ms in two workers
+    for _ in range(5):
+        stage_times.record(0.0, 0.030, 0.040, 0.041)
+    controller.last_update -= 2.0
+
+    controller.update({})
+
+    assert controller.pipeline_ceiling == 50
+    assert conf_args.fps == 40
+
+    # Nothing produced, eg. the followed window is hidden, keeps the ceiling
+    controller.last_update -= 2.0
+    controller.update({})
+    assert controller.pipeline_ceiling == 50
+
+
+def test_devices_given_their_own_rate_keep_it():
+    conf_args = Namespace(fps=40, min_fps=5, max_fps=60, workers=3, executor="process")
+    sender = FakeSender(["fixed", "adaptive"])
+    fixed, adaptive = sender.devices
+    fixed.fps, fixed.explicit_fps = 50, True
+    stage_times = StageTimes()
+    controller = RateController(sender, stage_times, conf_args)
+    for device in sender.devices:
+        device.stats.sent = 80
+    for _ in range(80):
+        stage_times.record(0.0, 0.001, 0.002, 0.003)
+    controller.last_update -= 2.0
+
+    controller.update({"fixed": 20, "adaptive": 20})
+
+    assert fixed.fps == 50
+    assert adaptive.fps < 40
+    assert conf_args.fps == 50
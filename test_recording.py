@@ -0,0 +1,47 @@
+import numpy as np
+
+from wledcast.recording import FrameRecorder, RecordingReader
+
+
+def record(path, compress=False, close=True):
+    recorder = FrameRecorder(str(path), compress)
+    frames = [np.full((2, 3, 3), i, dtype=np.uint8) for i in range(5)]
+    for i, frame in enumerate(frames):
+        recorder.record("10.0.0.1" if i % 2 == 0 else "10.0.0.2", frame)
+    if close:
+        recorder.close()
+    else:
+        recorder.filled.put(None)
+        recorder.thread.join()
+        recorder.file.close()
+    return frames
+
+
+def test_frames_read_back_from_the_memory_map(tmp_path, monkeypatch):
+    frames = record(tmp_path / "rec.wledrec")
+    # The trailer has the index and the hosts, closed recordings are never scanned
+    monkeypatch.setattr(RecordingReader, "scan", None)
+    reader = RecordingReader(str(tmp_path / "rec.wledrec"))
+
+    assert len(reader) == 5
+    assert reader.hosts == ["10.0.0.1", "10.0.0.2"]
+    timestamp, host, frame = reader.frame(3)
+    assert host == "10.0.0.2"
+    assert np.array_equal(frame, frames[3])
+    assert not frame.flags.owndata, "uncompressed frames should be views of the file"
+    assert reader.seek(timestamp) <= 3
+    reader.close()
+
+
+def test_compressed_recordings_and_recordings_without_index(tmp_path):
+    frames = record(tmp_path / "zlib.wledrec", compress=True)
+    reader = RecordingReader(str(tmp_path / "zlib.wledrec"))
+    assert all(np.array_equal(frame, expected) for (_, _, frame), expected in zip(reader, frames))
+    reader.close()
+
+    record(tmp_path / "crashed.wledrec", close=False)
+    with open(tmp_path / "crashed.wledrec", "ab") as f:
+        f.write(b"\x01\x00")  # a record cut off mid-header
+    reader = RecordingReader(str(tmp_path / "crashed.wledrec"))
+    assert len(reader) == 5
+    reader.close()
@@ -0,0 +1,146 @@
+import asyncio
+import socket
+import time
+
+import numpy as np
+
+from wledcast.wled.sender import AsyncSender, Device, DeviceSpec, parse_device
+
+
+def test_pending_frame_is_replaced_by_newer_one():
+    """Only the latest frame waits to be sent, older ones are counted as dropped."""
+    device = Device("127.0.0.1")
+    first = np.zeros((2, 2, 3), dtype=np.uint8)
+    second = np.ones((2, 2, 3), dtype=np.uint8)
+
+    device.submit(first)
+    device.submit(second)
+
+    assert device.pending is second
+    assert device.stats.dropped == 1
+    device.writer.close_socket()
+
+
+def test_frames_are_sent_to_every_device():
+    receivers = []
+    for _ in range(2):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(1)
+        receivers.append(receiver)
+
+    async def send():
+        sender = AsyncSender(["127.0.0.1", "127.0.0.1"])
+        for device, receiver in zip(sender.devices, receivers):
+            device.writer.port = receiver.getsockname()[1]
+        await sender.open()
+        sender.submit(np.full((4, 4, 3), 7, dtype=np.uint8))
+        await asyncio.sleep(0.1)
+        stats = sender.stats()
+        await sender.close()
+        return stats
+
+    stats = asyncio.run(send())
+
+    for receiver in receivers:
+        packet = receiver.recv(2000)
+        assert packet[0] & 0x01, "single packet frame should have the PUSH flag"
+        assert packet[10:] == bytes([7]) * 48
+        receiver.close()
+    assert stats["127.0.0.1"]["sent"] == 1
+
+
+def test_set_hosts_keeps_sockets_of_dropped_devices():
+    async def run():
+        sender = AsyncSender(["127.0.0.1"])
+        await sender.open()
+        first = sender.devices[0]
+
+        await sender.set_hosts(["127.0.0.2"])
+        assert [device.host for device in sender.devices] == ["127.0.0.2"]
+        assert sender.idle == {"127.0.0.1": first}
+
+        await sender.set_hosts(["127.0.0.1", "127.0.0.2"])
+        assert sender.devices[0] is first
+        assert not first.transport.is_closing()
+        assert sender.idle == {}
+        await sender.close()
+
+    asyncio.run(run())
+
+
+def test_set_hosts_and_fps_keep_device_defaults():
+    async def run():
+        sender = AsyncSender(
+            ["127.0.0.1@8x8", "127.0.0.2@60fps"], fps=30, resolve=lambda host: (16, 4)
+        )
+        await sender.open()
+        first, second = sender.devices
+        assert (first.fps, second.fps, sender.capture_fps()) == (30, 60, 60)
+
+        # Only devices without their own frame rate follow the cast's
+        assert sender.set_fps(20) == 60
+        assert (first.fps, second.fps) == (20, 60)
+
+        # Resolutions not given are resolved, rather than dropped
+        await sender.set_hosts(["127.0.0.1", "127.0.0.3"])
+        assert [device.resolution for device in sender.devices] == [(16, 4), (16, 4)]
+        assert [device.fps for device in sender.devices] == [20, 20]
+        await sender.close()
+
+    asyncio.run(run())
+
+
+def test_parse_device():
+    assert parse_device("10.0.0.5") == DeviceSpec("10.0.0.5")
+    assert parse_device("10.0.0.5@20fps@32x16") == DeviceSpec("10.0.0.5", 20, (32, 16))
+    assert parse_device({"host": "10.0.0.5", "resolution": "8x8"}) == DeviceSpec(
+        "10.0.0.5", None, (8, 8)
+    )
+    assert parse_device("10.0.0.5@0,8,16,8").crop == (0, 8, 16, 8)
+
+
+def test_device_keeps_to_its_own_frame_rate():
+    device = Device("127.0.0.1", fps=20)
+    frame = np.zeros((4, 4, 3), dtype=np.uint8)
+    # Offered at 60fps for one second
+    started = time.monotonic()
+    accepted = 0
+    for i in range(60):
+        while time.monotonic() < started + i / 60:
+            time.sleep(0.001)
+        if device.due():
+            accepted += 1
+
+    assert 19 <= accepted <= 21
+    device.writer.close_socket()
+
+
+def test_sync_push_latches_devices_after_all_data_is_sent():
+    receivers = []
+    for _ in range(2):
+        receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        receiver.bind(("127.0.0.1", 0))
+        receiver.settimeout(1)
+        receivers.append(receiver)
+
+    async def send():
+        sender = AsyncSender(["127.0.0.1", "127.0.0.1"], sync="push", sync_delay=0.05)
+        for device, receiver in zip(sender.devices, receivers):
+            device.writer.port = receiver.getsockname()[1]
+        await sender.open()
+        sender.submit(np.full((4, 4, 3), 7, dtype=np.uint8))
+        await asyncio.sleep(0.1)
+        stats = sender.stats()
+        await sender.close()
+        return stats
+
+    stats = asyncio.run(send())
+
+    for receiver in receivers:
+        data, push = receiver.recv(2000), receiver.recv(2000)
+        assert not data[0] & 0x01, "data should wait for the push packet"
+        assert push[0] & 0x11 == 0x11, "push packet should carry a timecode"
+        assert len(push) == 14 and push[1] == data[1]
+        receiver.close()
+    assert max(device["skew_seconds"] for device in stats.values()) < 0.01
@@ -1,14 +1,23 @@
 import asyncio
+import functools
 import logging
+import sys
 from multiprocessing import Event
+from typing import Union
 
-from wxasync import WxAsyncApp
+from wxasync import StartCoroutine, WxAsyncApp
 
-from wledcast import config
+from wledcast import benchmark, config, recording
+from wledcast.api import ControlApi
+from wledcast.switcher import ProfileSwitcher
 from wledcast.capture import capture_screen
-from wledcast.model import Box, Size
+from wledcast.capture.displays import topology
+from wledcast.capture.window_tracker import WindowTracker
+from wledcast.model import Box, SharedBox, Size
 from wledcast.ui import gui, keyboard, terminal
+from wledcast.ui.preview import PreviewWindow
 from wledcast.wled import caster, discovery
+from wledcast.wled.sender import DeviceSpec, parse_device
 
 logging.basicConfig(
     level=logging.INFO if config.args.debug else logging.ERROR,
@@ -17,29 +26,84 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-async def async_main(selected_wled_host: str, led_matrix_shape: Size, capture_box: Box):
+async def async_main(
+    selected_wled_hosts: list[DeviceSpec],
+    led_matrix_shape: Size,
+    capture_box: SharedBox,
+    window=None,
+):
+    # window is the one selected at startup, if any, followed as it moves
     app = WxAsyncApp()
 
     logger.info("Starting GUI")
     border = gui.TransparentWindow(None, "wledcast", capture_box)
-    border.Show()
+    # The border only means something when casting the screen
+    border.Show(config.args.source == "screen")
     app.SetTopWindow(border)
 
+    preview = PreviewWindow(border, caster.latest_sent_frame)
+    if config.args.live_preview:
+        preview.Toggle()
+
     stop_event = Event()
+    tracker = None
+    if config.args.source == "screen" and config.args.follow_interval > 0:
+        # Keep the capture box on the window as it moves
+        target_resolution = capture_screen.target_resolution(led_matrix_shape)
+        tracker = WindowTracker(
+            capture_box,
+            lambda followed: capture_screen.get_capture_box(followed, target_resolution),
+            border.RequestGeometryUpdate,
+            config.args.follow_interval,
+            config.args.capture_window,
+        )
+        if capture_screen.followable(window):
+            tracker.follow(window)
+        StartCoroutine(tracker.run(stop_event), border)
+
+    switcher = ProfileSwitcher(
+        config.profiles,
+        config.profile_name,
+        capture_box,
+        led_matrix_shape,
+        config.args,
+        border,
+        tracker,
+    )
+
     logger.info("Setting up keybinds")
     keyboard.setup_keybinds(app, border, capture_box, stop_event)
 
     logger.info("Starting teminal interface")
-    terminal.start_async(caster.frame_times, capture_box, stop_event, border)
+    terminal.start_async(
+        caster.frame_times,
+        caster.device_stats,
+        capture_box,
+        stop_event,
+        border,
+        preview.Toggle,
+        switcher,
+    )
+
+    if config.args.api_port is not None:
+        api = ControlApi(switcher, config.args.api_host, config.args.api_port)
+        StartCoroutine(api.serve(stop_event), border)
+
+    # Casting has started, from now on monitor changes are picked up as they happen
+    topology.watch()
+
+    # Pick up changes to the filter file made while casting
+    StartCoroutine(config.filters.watch(stop_event), border)
 
     logger.info("Starting casting")
     caster.start_async(
-        selected_wled_host,
+        selected_wled_hosts,
         capture_box,
         led_matrix_shape,
         config.args,
         stop_event,
         border,
+        device_resolution,
     )
 
     await app.MainLoop()
@@ -49,48 +113,136 @@ async def async_main(selected_wled_host: str, led_matrix_shape: Size, capture_bo
     app.Destroy()
 
 
-def main():
+def replay():
+    # Send a recording instead of casting, headless, nothing is captured
+    reader = recording.RecordingReader(config.args.replay)
+    hosts = None
     if config.args.host is not None:
-        selected_wled_host = config.args.host
-    else:
-        # Discover WLED instances
-        wled_instances = discovery.discover(config.args.search_timeout)
-        if len(wled_instances) == 0:
-            return 1
-
-        # Ask user which WLED instance to cast to
-        selected_wled_host = (
-            discovery.select_instance(wled_instances)
-            if len(wled_instances) > 1
-            else wled_instances[0]
+        hosts = [parse_device(host) for host in config.args.host]
+    logger.info(
+        f"Replaying {len(reader)} frames, {reader.duration:.1f}s, recorded from {', '.join(reader.hosts)}"
+    )
+    if config.args.benchmark is not None:
+        benchmark.run_replay(reader, hosts, config.args)
+        return
+    try:
+        asyncio.run(
+            recording.replay(
+                reader, hosts, Event(), config.args.replay_speed, config.args.loop
+            )
         )
+    except KeyboardInterrupt:
+        pass
+
 
+def output_resolution() -> Union[Size, None]:
+    # The resolution every device gets, None to ask each one
     if (
         config.args.output_resolution is not None
         and len(config.args.output_resolution.split("x")) == 2
     ):
         w, h = config.args.output_resolution.split("x")
-        led_matrix_shape = Size(int(w), int(h))
+        return Size(int(w), int(h))
+    if config.edge_layout is not None:
+        # The strip around the screen
+        return Size(config.edge_layout.led_count, 1)
+    return None
+
+
+@functools.lru_cache(maxsize=None)
+def device_resolution(host: str) -> tuple[int, int]:
+    # Of a device that doesn't give its own, determined once from WLED if needed
+    return tuple(output_resolution() or discovery.get_matrix_shape(host))
+
+
+def main():
+    if config.args.replay is not None:
+        replay()
+        return
+    # Unattended starts, eg. at boot, never wait for an answer
+    interactive = not config.args.no_prompt and sys.stdin.isatty()
+    if config.args.host is not None:
+        selected_wled_hosts = config.args.host
     else:
-        # Determine the shape of the LED pixel matrix from WLED
-        led_matrix_shape = discovery.get_matrix_shape(selected_wled_host)
+        # Discover WLED instances
+        wled_instances = discovery.discover(config.args.search_timeout)
+        if len(wled_instances) == 0:
+            return 1
+
+        # Ask user which WLED instance to cast to, without prompts the first by address
+        selected_wled_hosts = [
+            discovery.select_instance(wled_instances)
+            if len(wled_instances) > 1 and interactive
+            else sorted(wled_instances)[0]
+        ]
+
+    selected_wled_hosts = [parse_device(host) for host in selected_wled_hosts]
+    for device in selected_wled_hosts:
+        if device.resolution is None:
+            # Determine the shape of the LED pixel matrix from WLED
+            device.resolution = device_resolution(device.host)
+    # Capture at the largest resolution any device needs, and the highest frame rate, see
+    # caster.run. Each device then downsamples and skips frames to get its own.
+    width, height = max(
+        [(0, 0)]
+        + [device.resolution for device in selected_wled_hosts if device.crop is None],
+        key=lambda resolution: resolution[0] * resolution[1],
+    )
+    # The output frame also has to hold every region and every device's crop of it
+    for x, y, w, h in [device.crop for device in selected_wled_hosts if device.crop] + [
+        region.output for region in config.regions or []
+    ]:
+        width, height = max(width, x + w), max(height, y + h)
+    led_matrix_shape = Size(width, height)
+    if config.edge_layout is not None:
+        # The output is the strip itself
+        led_matrix_shape = Size(config.edge_layout.led_count, 1)
 
     logger.info(
         f"Matrix shape: width={led_matrix_shape.width}, height={led_matrix_shape}"
     )
 
-    # get the coordinates to capture, they are stored in a mutable Box which can be modified by the UI
-    window = capture_screen.select_window(
-        monitor=config.args.monitor, title=config.args.title
-    )
-    logger.info(f"Selected {window}")
+    if config.args.capture_window and config.args.capture_backend != "xshm":
+        logger.warning("--capture-window needs --capture-backend xshm, capturing the screen")
 
-    # get the capture coordinates: dict[left, top, width, height]
-    capture_box = capture_screen.get_capture_box(window, led_matrix_shape)
-    logger.info(
-        f"Capture area: top={capture_box.top}, left={capture_box.left}, width={capture_box.width}, height={capture_box.height}"
-    )
-    asyncio.run(async_main(selected_wled_host, led_matrix_shape, capture_box))
+    window = None
+    if config.args.source == "screen" and config.profile is not None and config.profile.box is not None:
+        capture_box = config.profile.box
+    elif config.args.source != "screen":
+        # Pipe and file sources ignore the capture box, there is nothing to select
+        capture_box = Box(0, 0, led_matrix_shape.width, led_matrix_shape.height)
+    else:
+        # get the coordinates to capture, they are stored in a mutable Box which can be modified by the UI
+        criteria = dict(
+            monitor=config.args.monitor,
+            title=config.args.title,
+            title_regex=config.args.title_regex,
+            app=config.args.app,
+        )
+        if interactive:
+            window = capture_screen.select_window(**criteria)
+        else:
+            window = capture_screen.find_window(**criteria, timeout=config.args.wait)
+            if window is None:
+                logger.error(f"Nothing to capture matches {criteria}")
+                return 1
+        logger.info(f"Selected {window}")
+
+        # get the capture coordinates: dict[left, top, width, height]
+        capture_box = capture_screen.get_capture_box(
+            window, capture_screen.target_resolution(led_matrix_shape)
+        )
+        logger.info(
+            f"Capture area: top={capture_box.top}, left={capture_box.left}, width={capture_box.width}, height={capture_box.height}"
+        )
+
+    # Shared with the capture workers, which read it once per frame
+    capture_box = SharedBox(capture_box)
+
+    if config.args.benchmark is not None:
+        benchmark.run(selected_wled_hosts, capture_box, led_matrix_shape, config.args)
+        return
+    asyncio.run(async_main(selected_wled_hosts, led_matrix_shape, capture_box, window))
 
 
 if __name__ == "__main__":
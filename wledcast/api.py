@@ -0,0 +1,221 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+from http import HTTPStatus
+
+from wledcast import config
+from wledcast.metrics import prometheus_text
+from wledcast.model import Box
+from wledcast.switcher import ProfileSwitcher
+from wledcast.wled import caster
+
+logger = logging.getLogger(__name__)
+
+WEBSOCKET_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_BODY = 64 * 1024
+
+
+class ApiError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class ControlApi:
+    # A small HTTP server on the main event loop for monitoring and tuning a running cast
+    # without the terminal UI:
+    #   GET /status   capture box, fps, filters, profile, device and stage stats as JSON
+    #   GET /metrics  the same stats in Prometheus text format
+    #   GET /ws       a WebSocket that pushes /status every second
+    #   PUT /box, /fps, /filters, /profile  change them, with a JSON body
+    # It is plain asyncio so it doesn't add dependencies, and only binds to localhost by default.
+    def __init__(self, switcher: ProfileSwitcher, host: str = "127.0.0.1", port: int = 8080):
+        self.switcher = switcher
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def serve(self, stop_event, interval: float = 0.5):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info(f"Control API listening on {self.host}:{self.port}")
+        try:
+            while not stop_event.is_set():
+                await asyncio.sleep(interval)
+        finally:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def status(self) -> dict:
+        _, box = self.switcher.capture_box.snapshot()
+        version, filters = config.filters.snapshot()
+        times = caster.frame_times
+        measured = (
+            (len(times) - 1) / (times[-1] - times[0])
+            if len(times) > 1 and times[-1] > times[0]
+            else 0.0
+        )
+        return {
+            "box": vars(box),
+            "fps": self.switcher.conf_args.fps,
+            "measured_fps": round(measured, 1),
+            "profile": self.switcher.active,
+            "profiles": self.switcher.names,
+            "filters": filters,
+            "filters_version": version,
+            "devices": caster.device_stats(),
+            "stages": caster.stage_times.summary(),
+            "adaptive": caster.adaptive_state(),
+        }
+
+    def metrics(self) -> str:
+        return prometheus_text(
+            caster.stage_times.summary(),
+            caster.device_stats(),
+            self.switcher.conf_args.fps,
+            config.filters.version,
+        )
+
+    async def update(self, path: str, body: dict) -> dict:
+        if path == "/box":
+            try:
+                box = Box(*(int(body[key]) for key in ("left", "top", "width", "height")))
+            except (KeyError, TypeError, ValueError):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "box needs integer left, top, width and height")
+            if box.width <= 0 or box.height <= 0:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "box width and height must be positive")
+            self.switcher.set_box(box)
+        elif path == "/fps":
+            fps = body.get("fps")
+            if not is_number(fps) or fps <= 0:
+                raise ApiError(HTTPStatus.BAD_REQUEST, "fps must be a positive number")
+            self.switcher.set_fps(fps)
+        elif path == "/filters":
+            unknown = set(body) - set(config.filters.names)
+            if unknown:
+                raise ApiError(HTTPStatus.BAD_REQUEST, f"unknown filters: {', '.join(sorted(unknown))}")
+            if not all(value is None or is_number(value) for value in body.values()):
+                raise ApiError(HTTPStatus.BAD_REQUEST, "filter values must be numbers or null")
+            if config.filters.update(body):
+                await config.save_filter_config()
+        elif path == "/profile":
+            name = body.get("name")
+            if name not in self.switcher.profiles:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"no profile {name}")
+            await self.switcher.switch(name)
+        else:
+            raise ApiError(HTTPStatus.NOT_FOUND, f"no such endpoint {path}")
+        return self.status()
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            method, path, headers, body = await read_request(reader)
+            if method == "GET" and path == "/ws" and "websocket" in headers.get("upgrade", "").lower():
+                await self.stream(reader, writer, headers)
+                return
+            if method == "GET" and path == "/status":
+                status, content_type, payload = HTTPStatus.OK, "application/json", json.dumps(self.status())
+            elif method == "GET" and path == "/metrics":
+                status, content_type, payload = HTTPStatus.OK, "text/plain; version=0.0.4", self.metrics()
+            elif method in ("PUT", "POST"):
+                try:
+                    data = json.loads(body or b"{}")
+                except ValueError:
+                    raise ApiError(HTTPStatus.BAD_REQUEST, "body must be JSON")
+                if not isinstance(data, dict):
+                    raise ApiError(HTTPStatus.BAD_REQUEST, "body must be a JSON object")
+                status, content_type = HTTPStatus.OK, "application/json"
+                payload = json.dumps(await self.update(path, data))
+            else:
+                raise ApiError(HTTPStatus.NOT_FOUND, f"no such endpoint {method} {path}")
+        except ApiError as e:
+            status, content_type = e.status, "application/json"
+            payload = json.dumps({"error": str(e)})
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            writer.close()
+            return
+        except Exception as e:
+            # Eg. a source or profile failing to switch, the client still gets an answer
+            logger.exception(f"API request failed: {e}")
+            status, content_type = HTTPStatus.INTERNAL_SERVER_ERROR, "application/json"
+            payload = json.dumps({"error": str(e)})
+        write_response(writer, status, content_type, payload.encode())
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: dict):
+        # Push only: anything the client sends is ignored, until it closes or disconnects
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(
+            (
+                "HTTP/1.1 101 Switching Protocols\r\n"
+                "Upgrade: websocket\r\n"
+                "Connection: Upgrade\r\n"
+                f"Sec-WebSocket-Accept: {accept}\r\n\r\n"
+            ).encode()
+        )
+        try:
+            while True:
+                writer.write(websocket_frame(json.dumps(self.status()).encode()))
+                await writer.drain()
+                try:
+                    data = await asyncio.wait_for(reader.read(4096), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+                # Disconnected, or a close frame (opcode 8)
+                if not data or data[0] & 0x0F == 0x8:
+                    break
+        except ConnectionError:
+            pass
+        writer.close()
+
+
+def is_number(value) -> bool:
+    # JSON true and false come back as bool, which is an int, but they aren't numbers here
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+async def read_request(reader: asyncio.StreamReader) -> tuple[str, str, dict, bytes]:
+    request_line = (await reader.readline()).decode("latin-1")
+    method, path, _ = request_line.split(" ", 2)
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise ApiError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "body too large")
+    body = await reader.readexactly(length)
+    return method, path.split("?", 1)[0], headers, body
+
+
+def write_response(writer: asyncio.StreamWriter, status: HTTPStatus, content_type: str, payload: bytes):
+    writer.write(
+        (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            "Connection: close\r\n\r\n"
+        ).encode()
+        + payload
+    )
+
+
+def websocket_frame(payload: bytes) -> bytes:
+    # A single unmasked text frame, servers never mask
+    length = len(payload)
+    if length < 126:
+        header = bytes([0x81, length])
+    elif length < 2**16:
+        header = bytes([0x81, 126]) + length.to_bytes(2, "big")
+    else:
+        header = bytes([0x81, 127]) + length.to_bytes(8, "big")
+    return header + payload
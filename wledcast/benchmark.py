@@ -0,0 +1,101 @@
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from argparse import Namespace
+from multiprocessing import Event
+from typing import Union
+
+from wledcast.model import SharedBox, Size
+from wledcast.recording import RecordingReader, replay
+from wledcast.wled import caster
+from wledcast.wled.sender import DeviceSpec
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+
+def run(hosts: list[DeviceSpec], capture_box: SharedBox, led_matrix_shape: Size, conf_args: Namespace):
+    # Run the real casting pipeline headless for a fixed time and report what it achieved.
+    # Combine with --source file for runs that are reproducible between machines and modes.
+    timings = []
+    stop_event = Event()
+
+    def on_frame(timing):
+        if timing is not None:
+            timings.append(timing)
+
+    async def timed_run():
+        asyncio.get_running_loop().call_later(conf_args.benchmark, stop_event.set)
+        await caster.run(
+            hosts, capture_box, led_matrix_shape, conf_args, stop_event, on_frame
+        )
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    asyncio.run(timed_run())
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    latencies = sorted((sent - started) * 1000 for started, sent in timings)
+    print(
+        f"executor={conf_args.executor} workers={conf_args.workers} "
+        f"source={conf_args.source} output={led_matrix_shape.width}x{led_matrix_shape.height} "
+        f"target={conf_args.fps}fps"
+    )
+    print(f"  frames sent:   {len(timings)} in {wall:.1f}s ({len(timings) / wall:.1f} fps)")
+    if latencies:
+        print(
+            f"  latency (ms):  median {statistics.median(latencies):.2f}, "
+            f"p95 {latencies[int(len(latencies) * 0.95)]:.2f}, max {latencies[-1]:.2f}"
+        )
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux and bytes on macOS
+        scale = 1 if sys.platform == "darwin" else 1024
+        own = resource.getrusage(resource.RUSAGE_SELF)
+        print(f"  peak RSS (MiB): main {own.ru_maxrss * scale / 2**20:.0f}", end="")
+        if conf_args.executor == "process":
+            # Pool workers have exited by now, so their usage is accounted to us
+            children = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu += children.ru_utime + children.ru_stime
+            print(f", largest worker {children.ru_maxrss * scale / 2**20:.0f}", end="")
+        print()
+    print_device_stats(caster.device_stats())
+    print(f"  CPU time:      {cpu:.2f}s ({cpu / wall * 100:.0f}% of one core)")
+
+
+def print_device_stats(device_stats: dict[str, dict]):
+    for host, stats in device_stats.items():
+        print(
+            f"  {host}: {stats['sent']} sent, {stats['dropped']} dropped, "
+            f"{stats['decimated']} decimated, {stats['errors']} errors, "
+            f"skew {stats['skew_seconds'] * 1000:.3f} ms"
+        )
+
+
+def run_replay(reader: RecordingReader, hosts: Union[list[DeviceSpec], None], conf_args: Namespace):
+    # Replay a recording for a fixed time, the sending side of the pipeline without capture
+    # or processing. Frames come straight from the memory mapped recording.
+    stop_event = Event()
+
+    async def timed_replay():
+        asyncio.get_running_loop().call_later(conf_args.benchmark, stop_event.set)
+        return await replay(reader, hosts, stop_event, conf_args.replay_speed, conf_args.loop)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    sender = asyncio.run(timed_replay())
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    device_stats = sender.stats()
+    sent = sum(stats["sent"] for stats in device_stats.values())
+    print(f"replay={reader.path} frames={len(reader)} speed={conf_args.replay_speed}")
+    print(f"  frames sent:   {sent} in {wall:.1f}s ({sent / wall:.1f} fps over all devices)")
+    print_device_stats(device_stats)
+    print(f"  CPU time:      {cpu:.2f}s ({cpu / wall * 100:.0f}% of one core)")
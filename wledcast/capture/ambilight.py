@@ -0,0 +1,165 @@
+from dataclasses import dataclass
+from typing import Union
+
+import cv2
+import numpy as np
+
+corners = ("top-left", "top-right", "bottom-right", "bottom-left")
+
+
+@dataclass
+class EdgeLayout:
+    # LEDs on each side of the screen
+    top: int
+    right: int
+    bottom: int
+    left: int
+    # Depth of the sampled band along each edge, as a fraction of the shorter screen side
+    depth: float = 0.1
+    # skip: sides stop short of the corners, include: sides run into them,
+    # separate: one extra LED in each corner, sampled from the corner itself
+    corner_mode: str = "skip"
+    # Where the first LED of the strip is, and which way it runs seen from the front
+    start: str = "bottom-left"
+    clockwise: bool = True
+
+    @property
+    def led_count(self) -> int:
+        return (
+            self.top
+            + self.right
+            + self.bottom
+            + self.left
+            + (4 if self.corner_mode == "separate" else 0)
+        )
+
+    def order(self) -> list[tuple[str, int]]:
+        # (side or corner, index along the side from its clockwise start) for each LED of the
+        # strip in order. Clockwise, the top runs left to right, the right top to bottom, the
+        # bottom right to left and the left bottom to top.
+        counts = {"top": self.top, "right": self.right, "bottom": self.bottom, "left": self.left}
+        # The side that starts at each corner, going clockwise and counterclockwise
+        clockwise_sides = dict(zip(corners, ("top", "right", "bottom", "left")))
+        counterclockwise_sides = dict(zip(corners, ("left", "top", "right", "bottom")))
+        sequence_corners = corners if self.clockwise else corners[:1] + corners[:0:-1]
+        leds = []
+        for corner in sequence_corners:
+            if self.corner_mode == "separate":
+                leds.append((corner, 0))
+            if self.clockwise:
+                side = clockwise_sides[corner]
+                leds += [(side, i) for i in range(counts[side])]
+            else:
+                side = counterclockwise_sides[corner]
+                leds += [(side, i) for i in reversed(range(counts[side]))]
+        # Rotate so the strip starts at its start corner
+        first = sum(
+            (1 if self.corner_mode == "separate" else 0)
+            + counts[(clockwise_sides if self.clockwise else counterclockwise_sides)[corner]]
+            for corner in sequence_corners[: sequence_corners.index(self.start)]
+        )
+        return leds[first:] + leds[:first]
+
+
+def parse_edge_layout(conf_args) -> Union[EdgeLayout, None]:
+    # --ambilight TOP,RIGHT,BOTTOM,LEFT plus its --edge-* options, None when not set
+    if conf_args.ambilight is None:
+        return None
+    top, right, bottom, left = (int(count) for count in conf_args.ambilight.split(","))
+    return EdgeLayout(
+        top,
+        right,
+        bottom,
+        left,
+        conf_args.edge_depth,
+        conf_args.edge_corners,
+        conf_args.edge_start,
+        not conf_args.edge_counterclockwise,
+    )
+
+
+def zone_weights(start: float, stop: float, count: int, length: int) -> np.ndarray:
+    # (count, length) matrix averaging a profile of `length` pixels into `count` equal zones
+    # between start and stop. Pixels on a zone boundary are shared by the overlap.
+    edges = np.linspace(start, stop, count + 1)
+    pixels = np.arange(length)
+    overlap = np.clip(
+        np.minimum(pixels + 1, edges[1:, None]) - np.maximum(pixels, edges[:-1, None]),
+        0,
+        None,
+    )
+    return (overlap / (edges[1:] - edges[:-1])[:, None]).astype(np.float32)
+
+
+class EdgeSampler:
+    # Turns a captured frame into an ambilight strip. Only the bands along the edges are read:
+    # each band is averaged across its depth into a profile along the edge, and a weight
+    # matrix, precomputed for the frame size, averages the profile into that side's LEDs.
+    def __init__(self, layout: EdgeLayout):
+        self.layout = layout
+        # (frame shape, bands), replaced in one go as processing threads may share a sampler
+        self.prepared = (None, [])
+
+    def prepare(self, height: int, width: int) -> list:
+        layout = self.layout
+        depth = max(1, round(layout.depth * min(height, width)))
+        inset = 0 if layout.corner_mode == "include" else depth
+        positions = {led: index for index, led in enumerate(layout.order())}
+
+        def indices(side: str, count: int) -> list[int]:
+            return [positions[(side, i)] for i in range(count)]
+
+        # For each band: the slice of the frame, the axis it's averaged over, and the LEDs
+        # it feeds with their weights over the band's profile
+        top_leds = indices("top", layout.top)
+        top_weights = zone_weights(inset, width - inset, layout.top, width)
+        # Clockwise, the bottom and left run backwards along the frame's axes
+        bottom_leds = indices("bottom", layout.bottom)[::-1]
+        bottom_weights = zone_weights(inset, width - inset, layout.bottom, width)
+        left_leds = indices("left", layout.left)[::-1]
+        left_weights = zone_weights(inset, height - inset, layout.left, height)
+        right_leds = indices("right", layout.right)
+        right_weights = zone_weights(inset, height - inset, layout.right, height)
+        if layout.corner_mode == "separate":
+            top_leds += [positions[("top-left", 0)], positions[("top-right", 0)]]
+            top_weights = np.vstack(
+                [
+                    top_weights,
+                    zone_weights(0, depth, 1, width),
+                    zone_weights(width - depth, width, 1, width),
+                ]
+            )
+            bottom_leds += [positions[("bottom-left", 0)], positions[("bottom-right", 0)]]
+            bottom_weights = np.vstack(
+                [
+                    bottom_weights,
+                    zone_weights(0, depth, 1, width),
+                    zone_weights(width - depth, width, 1, width),
+                ]
+            )
+        bands = [
+            ((slice(0, depth), slice(None)), 0, top_leds, top_weights),
+            ((slice(height - depth, height), slice(None)), 0, bottom_leds, bottom_weights),
+            ((slice(None), slice(0, depth)), 1, left_leds, left_weights),
+            ((slice(None), slice(width - depth, width)), 1, right_leds, right_weights),
+        ]
+        bands = [
+            (region, axis, np.array(leds, dtype=np.intp), weights)
+            for region, axis, leds, weights in bands
+            if leds
+        ]
+        self.prepared = ((height, width), bands)
+        return bands
+
+    def sample(self, img: np.ndarray) -> np.ndarray:
+        # Returns the strip as a (1, led_count, channels) image, ready for colour conversion
+        # and filters like any other output frame
+        shape, bands = self.prepared
+        if img.shape[:2] != shape:
+            bands = self.prepare(*img.shape[:2])
+        strip = np.empty((self.layout.led_count, img.shape[2]), dtype=np.float32)
+        for region, axis, leds, weights in bands:
+            # cv2.reduce is many times faster than ndarray.mean on these bands
+            profile = cv2.reduce(img[region], axis, cv2.REDUCE_AVG, dtype=cv2.CV_32F)
+            strip[leds] = weights @ profile.reshape(-1, img.shape[2])
+        return np.clip(strip + 0.5, 0, 255).astype(np.uint8)[np.newaxis]
@@ -1,20 +1,95 @@
 import logging
+from dataclasses import dataclass
+from typing import Union
 
+import cv2
 import mss
 import numpy as np
-from PIL import Image
 
+from wledcast.capture.displays import MonitorInfo, topology
+from wledcast.capture.source import CaptureSource
 from wledcast.model import Box
 
 logger = logging.getLogger(__name__)
 
 
-def capture(window_box: Box) -> np.ndarray:
-    # Use mss to capture the image
-    with mss.mss() as cap:
-        img = cap.grab(vars(window_box))
-        image = Image.frombytes("RGB", img.size, img.bgra, "raw", "BGRX")
-        # image.resize(resolution, Image.Resampling.BOX)
-        rgb_array = np.array(image)
+@dataclass
+class Tile:
+    # The part of the capture box on one monitor, and where it goes in the frame
+    box: Box
+    x: int
+    y: int
+    # Holds the tile when the grab comes back at another resolution and is scaled to fit
+    scratch: np.ndarray = None
 
-        return rgb_array
+
+def plan_tiles(box: Box, monitors: list[MonitorInfo]) -> Union[list[Tile], None]:
+    # One grab of the whole box is cheapest, unless the box spans monitors with different
+    # scaling, which some platforms grab at the highest scale across the whole box, or runs
+    # into gaps between monitors. Then each monitor's part is grabbed by itself and the
+    # gaps are left black. None for a single grab.
+    tiles, scales, covered = [], set(), 0
+    for monitor in monitors:
+        left, top = max(box.left, monitor.left), max(box.top, monitor.top)
+        right = min(box.left + box.width, monitor.left + monitor.width)
+        bottom = min(box.top + box.height, monitor.top + monitor.height)
+        if right <= left or bottom <= top:
+            continue
+        tiles.append(
+            Tile(Box(left, top, right - left, bottom - top), left - box.left, top - box.top)
+        )
+        scales.add(monitor.scale)
+        covered += (right - left) * (bottom - top)
+    if len(tiles) <= 1 or (len(scales) == 1 and covered >= box.width * box.height):
+        return None
+    return tiles
+
+
+class MssSource(CaptureSource):
+    # The raw BGRX buffer is wrapped without conversion, colours are converted after downscaling
+    pixel_format = "BGRX"
+
+    def __init__(self):
+        self.cap = None
+        self.tiles = None
+        self.frame = None
+
+    def open(self):
+        # Keep one mss instance open rather than reconnecting for every frame
+        self.cap = mss.mss()
+
+    def set_geometry(self, box: Box):
+        self.tiles = plan_tiles(box, topology.monitors())
+        # Tiles are stitched into a frame kept between grabs
+        self.reuses_buffer = self.tiles is not None
+        if self.tiles is not None:
+            logger.info(f"Capture box spans {len(self.tiles)} monitors, grabbing each separately")
+            self.frame = np.zeros((box.height, box.width, 4), dtype=np.uint8)
+        else:
+            self.frame = None
+
+    def grab_raw(self, box: Box) -> np.ndarray:
+        img = self.cap.grab(vars(box))
+        return np.frombuffer(img.raw, dtype=np.uint8).reshape(img.height, img.width, 4)
+
+    def grab(self, box: Box) -> np.ndarray:
+        if self.tiles is None:
+            return self.grab_raw(box)
+        for tile in self.tiles:
+            part = self.grab_raw(tile.box)
+            height, width = tile.box.height, tile.box.width
+            target = self.frame[tile.y : tile.y + height, tile.x : tile.x + width]
+            if part.shape == target.shape:
+                np.copyto(target, part)
+            else:
+                # Grabbed in physical pixels on a scaled monitor, the frame is in the box's units
+                if tile.scratch is None:
+                    tile.scratch = np.empty_like(target)
+                cv2.resize(part, (width, height), dst=tile.scratch, interpolation=cv2.INTER_AREA)
+                np.copyto(target, tile.scratch)
+        return self.frame
+
+    def close(self):
+        if self.cap is not None:
+            self.cap.close()
+            self.cap = None
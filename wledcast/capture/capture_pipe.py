@@ -0,0 +1,43 @@
+import logging
+import sys
+from typing import BinaryIO, Union
+
+import numpy as np
+
+from wledcast.capture.source import CaptureSource
+from wledcast.model import Box, Size
+
+logger = logging.getLogger(__name__)
+
+
+class PipeSource(CaptureSource):
+    # Raw rgb24 frames of a fixed size, eg. from
+    # ffmpeg -i video.mp4 -vf scale=32:32 -f rawvideo -pix_fmt rgb24 - | wledcast --source pipe --input-resolution 32x32
+    pixel_format = "RGB"
+    reuses_buffer = True
+
+    def __init__(self, resolution: Size, path: str = "-"):
+        self.resolution = resolution
+        self.path = path
+        self.stream: Union[BinaryIO, None] = None
+        self.buffer = np.empty((resolution.height, resolution.width, 3), dtype=np.uint8)
+
+    def open(self):
+        self.stream = sys.stdin.buffer if self.path == "-" else open(self.path, "rb")
+
+    def grab(self, box: Box = None) -> Union[np.ndarray, None]:
+        # Fill the preallocated frame buffer, a pipe may return it in several chunks
+        view = memoryview(self.buffer).cast("B")
+        filled = 0
+        while filled < len(view):
+            n = self.stream.readinto(view[filled:])
+            if not n:
+                logger.info("End of input pipe")
+                return None
+            filled += n
+        return self.buffer
+
+    def close(self):
+        if self.stream is not None and self.stream is not sys.stdin.buffer:
+            self.stream.close()
+        self.stream = None
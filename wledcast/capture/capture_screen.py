@@ -1,20 +1,34 @@
 import logging
+import os
+import re
+import sys
+import time
+from argparse import Namespace
 from typing import Union
 
 import numpy as np
-import pymonctl
 import pywinctl
 
-from wledcast.capture import capture_mss
-from wledcast.config import border_size, max_x, max_y
-from wledcast.model import Box
+from wledcast.capture import capture_mss, capture_pipe, capture_video, capture_xshm
+from wledcast.capture.displays import MonitorInfo, topology
+from wledcast.capture.geometry import capture_resolution, fit_to_window
+from wledcast.capture.source import CaptureSource
+from wledcast.config import border_size, edge_layout, regions
+from wledcast.model import Box, SharedBox, Size
 
 logger = logging.getLogger(__name__)
 
+backends = {
+    "mss": capture_mss.MssSource,
+    "xshm": capture_xshm.XShmSource,
+}
+# Screen sources are opened lazily, once per worker process, and reused for every frame
+sources: dict[str, CaptureSource] = {}
+
 
 def select_from_list(
-    items: list[Union[pywinctl.Window, pymonctl.Monitor]], description: str
-) -> Union[pywinctl.Window, pymonctl.Monitor]:
+    items: list[Union[pywinctl.Window, MonitorInfo]], description: str
+) -> Union[pywinctl.Window, MonitorInfo]:
     if len(items) == 1:
         logger.info(
             f"Only one {description} found: {getattr(items[0], description)}. Selecting it."
@@ -36,11 +50,59 @@ def select_from_list(
     return items[choice]
 
 
+def app_name(window: pywinctl.Window) -> str:
+    # pywinctl runs ps for every window on Linux, /proc has the same name. Not from comm,
+    # which is cut off at 15 characters: the executable, or the first argument of processes
+    # whose executable can't be read, eg. another user's.
+    if sys.platform == "linux":
+        try:
+            pid = window.getPID()
+            try:
+                return os.path.basename(os.readlink(f"/proc/{pid}/exe"))
+            except OSError:
+                with open(f"/proc/{pid}/cmdline", "rb") as f:
+                    command = f.read().split(b"\0")[0].decode(errors="replace")
+                if command:
+                    return os.path.basename(command)
+        except (OSError, TypeError):
+            pass
+    return window.getAppName()
+
+
+def matching_windows(
+    title: str = None, title_regex: str = None, app: str = None
+) -> list[pywinctl.Window]:
+    # Windows whose title contains title, matches title_regex and whose process is app, all
+    # that are given. Each check costs the window system a round trip, so the cheap ones go
+    # first and the process name is only looked up for windows whose title matched.
+    pattern = re.compile(title_regex) if title_regex else None
+    app = app.lower().removesuffix(".exe") if app else None
+    matches = []
+    for window in pywinctl.getAllWindows():
+        window_title = window.title
+        if (
+            not window_title
+            or (title and title not in window_title)
+            or (pattern and not pattern.search(window_title))
+            or window.isMinimized
+        ):
+            continue
+        if app and app_name(window).lower().removesuffix(".exe") != app:
+            continue
+        matches.append(window)
+    return matches
+
+
+def client_area(window: pywinctl.Window) -> int:
+    rect = window.getClientFrame()
+    return (rect.right - rect.left) * (rect.bottom - rect.top)
+
+
 def select_window(
-    monitor: int = None, title: str = None
-) -> Union[pywinctl.Window, pymonctl.Monitor]:
+    monitor: int = None, title: str = None, title_regex: str = None, app: str = None
+) -> Union[pywinctl.Window, MonitorInfo]:
     if monitor is not None:
-        monitors = pymonctl.getAllMonitors()
+        monitors = topology.monitors()
         if 0 <= monitor < len(monitors):
             logger.info(f"Using monitor {monitor}")
             return monitors[monitor]
@@ -48,24 +110,22 @@ def select_window(
             return select_from_list(monitors, "name")
         else:
             logger.warning(f"Invalid monitor index {monitor}, found {len(monitors)} monitors")
-    # Get the list of open windows
-    windows: list[pywinctl.Window] = pywinctl.getAllWindows()
-    logger.info(f"Found {len(windows)} windows total")
 
-    if title:
-        logger.info(f"Filtering by title: {title}")
+    if title or title_regex or app:
+        logger.info(f"Filtering by title: {title or title_regex}, app: {app}")
+        # Not the active window, that's the terminal whose command line has the title in it
         windows_matching_title = [
             window
-            for window in windows
-            if title in window.title and not window.isActive
+            for window in matching_windows(title, title_regex, app)
+            if not window.isActive
         ]
-        logger.info(f"Found {len(windows)} matching windows")
+        logger.info(f"Found {len(windows_matching_title)} matching windows")
         if len(windows_matching_title) >= 1:
-            logger.info(
-                f"Selecting from {len(windows_matching_title)} windows matching title: {title}"
-            )
             return select_from_list(windows_matching_title, "title")
 
+    # Get the list of open windows
+    windows: list[pywinctl.Window] = pywinctl.getAllWindows()
+    logger.info(f"Found {len(windows)} windows total")
     windows = [
         window
         for window in windows
@@ -79,62 +139,113 @@ def select_window(
         logger.info(f"Selecting from {len(windows)} windows")
         return select_from_list(windows, "title")
 
-    monitors = pymonctl.getAllMonitors()
+    monitors = topology.monitors()
     logger.info(f"Found 0 visible windows, selecting from {len(monitors)} monitors")
     return select_from_list(monitors, "name")
 
 
+def find_window(
+    monitor: int = None,
+    title: str = None,
+    title_regex: str = None,
+    app: str = None,
+    timeout: float = 0.0,
+) -> Union[pywinctl.Window, MonitorInfo, None]:
+    # Like select_window, but never asks, for unattended starts and profile switches.
+    # --monitor without an index, or nothing to match at all, is the primary monitor. When
+    # several windows match, inactive ones beat the active one (likely the terminal), then
+    # the largest wins, then the first listed, so a setup always picks the same window.
+    # Windows are looked for again until timeout, eg. while a player is still starting.
+    # None if nothing matches.
+    if monitor is not None or not (title or title_regex or app):
+        monitors = topology.monitors()
+        if monitor is None or monitor == -1:
+            return next((m for m in monitors if m.primary), monitors[0] if monitors else None)
+        return monitors[monitor] if 0 <= monitor < len(monitors) else None
+    deadline = time.monotonic() + timeout
+    while True:
+        matches = matching_windows(title, title_regex, app)
+        if matches:
+            # min() keeps the first of equals
+            return min(matches, key=lambda window: (window.isActive, -client_area(window)))
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(0.25, remaining))
+
+
+def followable(window: Union[pywinctl.Window, MonitorInfo, None]) -> bool:
+    # Windows move and resize, monitors are left alone
+    return isinstance(window, pywinctl.Window)
+
+
+def target_resolution(led_matrix_shape: Size) -> Union[Size, None]:
+    # What get_capture_box crops to for this cast, None with --regions or --ambilight
+    return capture_resolution(led_matrix_shape, regions, edge_layout)
+
+
 def get_capture_box(
-    window: Union[pywinctl.Window, pymonctl.Monitor], target_resolution
+    window: Union[pywinctl.Window, MonitorInfo], target_resolution: Union[Size, None]
 ) -> Box:
+    # Without a target resolution, the whole window is captured, eg. for --ambilight
     # Get the client rectangle of the window
     rect = (
         window.getClientFrame() if isinstance(window, pywinctl.Window) else window.rect
     )
     logger.info(f"Client rect: {rect}")
-
-    client_box = Box(
-        left=max(border_size, rect.left),
-        top=max(border_size, rect.top),
-        width=min(
-            max_x - max(border_size, rect.left) - border_size,
-            rect.right - max(border_size, rect.left) - border_size,
-        ),
-        height=min(
-            max_y - max(border_size, rect.top) - border_size,
-            rect.bottom - max(border_size, rect.top) - border_size,
-        ),
-    )
-
-    # crop the largest area in client_rect that matches the aspect ratio of resolution
-    target_aspect_ratio = target_resolution.width / target_resolution.height
-
-    # Calculate the aspect ratio of the client rectangle
-    client_aspect_ratio = client_box.width / client_box.height
-
-    # Check if the aspect ratio of the client rectangle matches the aspect ratio of the resolution
-    if client_aspect_ratio > target_aspect_ratio:
-        # Crop the width of the client rectangle to match the aspect ratio of the resolution
-        new_width = int(client_box.height * target_aspect_ratio)
-        center_x = client_box.left + (client_box.width // 2)
-        client_box.left = center_x - (new_width // 2)
-        client_box.width = new_width
+    # The desktop as it is now, monitors may have changed since startup
+    return Box(*fit_to_window(rect, topology.bounds(), border_size, target_resolution))
+
+
+def get_source(backend: str = "mss") -> CaptureSource:
+    if backend not in sources:
+        source = backends[backend]()
+        source.open()
+        sources[backend] = source
+    return sources[backend]
+
+
+def sync_geometry(
+    source: CaptureSource, shared_box: SharedBox
+) -> tuple[Union[Box, None], bool]:
+    # Take a consistent copy of the capture box. If it changed since this source last saw it,
+    # let the source rebuild anything that depends on the geometry. Returns (box, changed),
+    # the box is None while the followed window is hidden.
+    sequence, box, window, hidden = shared_box.target()
+    if sequence == source.geometry_sequence:
+        return (None if hidden else box), False
+    source.set_window(window)
+    source.set_geometry(box)
+    source.geometry_sequence = sequence
+    return (None if hidden else box), True
+
+
+def open_stream_source(
+    conf_args: Namespace, led_matrix_shape: Size
+) -> Union[CaptureSource, None]:
+    # Pipe and video file sources, None when casting the screen
+    if conf_args.source == "pipe":
+        resolution = led_matrix_shape
+        if conf_args.input_resolution is not None:
+            w, h = conf_args.input_resolution.split("x")
+            resolution = Size(int(w), int(h))
+        source = capture_pipe.PipeSource(resolution, conf_args.input)
+    elif conf_args.source == "file":
+        # Regions and edges are sampled from the full frame
+        full_frame = regions is not None or edge_layout is not None
+        source = capture_video.VideoFileSource(
+            conf_args.input, None if full_frame else led_matrix_shape, conf_args.loop
+        )
     else:
-        # Crop the height of the client rectangle to match the aspect ratio of the resolution
-        new_height = int(client_box.width / target_aspect_ratio)
-        center_y = client_box.top + (client_box.height // 2)
-        client_box.top = center_y - (new_height // 2)
-        client_box.height = new_height
-
-    return client_box
+        return None
+    source.open()
+    return source
 
 
 def capture(
-    window_box: Box
+    window_box: Box, source: CaptureSource
 ) -> Union[np.ndarray, None]:
     try:
-        rgb_array = capture_mss.capture(window_box)
-
-        return rgb_array
+        return source.grab(window_box)
     except Exception as e:
         return None
@@ -0,0 +1,59 @@
+import logging
+from typing import Union
+
+import cv2
+import numpy as np
+
+from wledcast.capture.source import CaptureSource
+from wledcast.model import Box, Size
+
+logger = logging.getLogger(__name__)
+
+
+class VideoFileSource(CaptureSource):
+    # Frames are downscaled to the LED resolution straight after decoding, so the rest of the
+    # pipeline only ever sees tiny images. Reading a file makes runs fully reproducible.
+    # Without a resolution, frames are passed on as decoded, for outputs sampled from parts
+    # of the frame like --regions and --ambilight.
+    pixel_format = "BGR"
+    reuses_buffer = True
+
+    def __init__(self, path: str, resolution: Union[Size, None], loop: bool = False):
+        self.path = path
+        self.resolution = resolution
+        self.loop = loop
+        self.video = None
+        self.frame = None
+        self.buffer = (
+            np.empty((resolution.height, resolution.width, 3), dtype=np.uint8)
+            if resolution is not None
+            else None
+        )
+
+    def open(self):
+        self.video = cv2.VideoCapture(self.path)
+        if not self.video.isOpened():
+            raise OSError(f"Cannot open video file {self.path}")
+
+    def grab(self, box: Box = None) -> Union[np.ndarray, None]:
+        ok, self.frame = self.video.read(self.frame)
+        if not ok and self.loop:
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, self.frame = self.video.read(self.frame)
+        if not ok:
+            logger.info(f"End of video file {self.path}")
+            return None
+        if self.resolution is None:
+            return self.frame
+        cv2.resize(
+            self.frame,
+            tuple(self.resolution),
+            dst=self.buffer,
+            interpolation=cv2.INTER_AREA,
+        )
+        return self.buffer
+
+    def close(self):
+        if self.video is not None:
+            self.video.release()
+            self.video = None
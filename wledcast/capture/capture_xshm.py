@@ -0,0 +1,409 @@
+import ctypes
+import ctypes.util
+import logging
+import select
+import time
+
+import numpy as np
+
+from wledcast.capture.source import CaptureSource
+from wledcast.model import Box
+
+logger = logging.getLogger(__name__)
+
+# Linux/X11 only: XShmGetImage reads straight into a shared memory segment that is exposed
+# as a numpy view, and the X Damage extension reports which parts of the screen were redrawn
+ZPixmap = 2
+ALL_PLANES = 0xFFFFFFFF
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+X_DAMAGE_REPORT_DELTA_RECTANGLES = 1
+X_DAMAGE_NOTIFY = 0
+
+
+class XShmSegmentInfo(ctypes.Structure):
+    _fields_ = [
+        ("shmseg", ctypes.c_ulong),
+        ("shmid", ctypes.c_int),
+        ("shmaddr", ctypes.c_void_p),
+        ("readOnly", ctypes.c_int),
+    ]
+
+
+class XImage(ctypes.Structure):
+    # Only the leading fields are declared, the struct is always used through a pointer
+    _fields_ = [
+        ("width", ctypes.c_int),
+        ("height", ctypes.c_int),
+        ("xoffset", ctypes.c_int),
+        ("format", ctypes.c_int),
+        ("data", ctypes.c_void_p),
+        ("byte_order", ctypes.c_int),
+        ("bitmap_unit", ctypes.c_int),
+        ("bitmap_bit_order", ctypes.c_int),
+        ("bitmap_pad", ctypes.c_int),
+        ("depth", ctypes.c_int),
+        ("bytes_per_line", ctypes.c_int),
+        ("bits_per_pixel", ctypes.c_int),
+    ]
+
+
+class XRectangle(ctypes.Structure):
+    _fields_ = [
+        ("x", ctypes.c_short),
+        ("y", ctypes.c_short),
+        ("width", ctypes.c_ushort),
+        ("height", ctypes.c_ushort),
+    ]
+
+
+class XDamageNotifyEvent(ctypes.Structure):
+    _fields_ = [
+        ("type", ctypes.c_int),
+        ("serial", ctypes.c_ulong),
+        ("send_event", ctypes.c_int),
+        ("display", ctypes.c_void_p),
+        ("drawable", ctypes.c_ulong),
+        ("damage", ctypes.c_ulong),
+        ("level", ctypes.c_int),
+        ("more", ctypes.c_int),
+        ("timestamp", ctypes.c_ulong),
+        ("area", XRectangle),
+        ("geometry", XRectangle),
+    ]
+
+
+class XEvent(ctypes.Union):
+    _fields_ = [("type", ctypes.c_int), ("pad", ctypes.c_long * 24)]
+
+
+XErrorHandler = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.c_void_p)
+
+xlib = xext = xdamage = libc = None
+x_errors = []
+
+
+@XErrorHandler
+def on_x_error(display, event):
+    # The default Xlib handler exits the process, record the error and raise it from the caller instead
+    x_errors.append(event)
+    return 0
+
+
+def load_libraries():
+    global xlib, xext, xdamage, libc
+    if xlib is not None:
+        return
+
+    def load(name):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            raise OSError(f"lib{name} not found, the xshm capture backend needs X11")
+        return ctypes.CDLL(path)
+
+    x11, ext, damage, c = load("X11"), load("Xext"), load("Xdamage"), load("c")
+
+    x11.XOpenDisplay.argtypes = [ctypes.c_char_p]
+    x11.XOpenDisplay.restype = ctypes.c_void_p
+    x11.XCloseDisplay.argtypes = [ctypes.c_void_p]
+    x11.XDefaultRootWindow.argtypes = [ctypes.c_void_p]
+    x11.XDefaultRootWindow.restype = ctypes.c_ulong
+    x11.XDefaultScreen.argtypes = [ctypes.c_void_p]
+    x11.XDefaultVisual.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    x11.XDefaultVisual.restype = ctypes.c_void_p
+    x11.XDefaultDepth.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    x11.XConnectionNumber.argtypes = [ctypes.c_void_p]
+    x11.XPending.argtypes = [ctypes.c_void_p]
+    x11.XNextEvent.argtypes = [ctypes.c_void_p, ctypes.POINTER(XEvent)]
+    x11.XSync.argtypes = [ctypes.c_void_p, ctypes.c_int]
+    x11.XFlush.argtypes = [ctypes.c_void_p]
+    x11.XDestroyImage.argtypes = [ctypes.POINTER(XImage)]
+    x11.XTranslateCoordinates.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_ulong,
+        ctypes.c_ulong,
+        ctypes.c_int,
+        ctypes.c_int,
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_ulong),
+    ]
+    x11.XSetErrorHandler.argtypes = [XErrorHandler]
+    x11.XSetErrorHandler.restype = ctypes.c_void_p
+
+    ext.XShmQueryExtension.argtypes = [ctypes.c_void_p]
+    ext.XShmCreateImage.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_void_p,
+        ctypes.c_uint,
+        ctypes.c_int,
+        ctypes.c_void_p,
+        ctypes.POINTER(XShmSegmentInfo),
+        ctypes.c_uint,
+        ctypes.c_uint,
+    ]
+    ext.XShmCreateImage.restype = ctypes.POINTER(XImage)
+    ext.XShmAttach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+    ext.XShmDetach.argtypes = [ctypes.c_void_p, ctypes.POINTER(XShmSegmentInfo)]
+    ext.XShmGetImage.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_ulong,
+        ctypes.POINTER(XImage),
+        ctypes.c_int,
+        ctypes.c_int,
+        ctypes.c_ulong,
+    ]
+
+    damage.XDamageQueryExtension.argtypes = [
+        ctypes.c_void_p,
+        ctypes.POINTER(ctypes.c_int),
+        ctypes.POINTER(ctypes.c_int),
+    ]
+    damage.XDamageCreate.argtypes = [ctypes.c_void_p, ctypes.c_ulong, ctypes.c_int]
+    damage.XDamageCreate.restype = ctypes.c_ulong
+    damage.XDamageDestroy.argtypes = [ctypes.c_void_p, ctypes.c_ulong]
+    damage.XDamageSubtract.argtypes = [
+        ctypes.c_void_p,
+        ctypes.c_ulong,
+        ctypes.c_ulong,
+        ctypes.c_ulong,
+    ]
+
+    c.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+    c.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    c.shmat.restype = ctypes.c_void_p
+    c.shmdt.argtypes = [ctypes.c_void_p]
+    c.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+
+    x11.XSetErrorHandler(on_x_error)
+    xlib, xext, xdamage, libc = x11, ext, damage, c
+
+
+def open_display() -> ctypes.c_void_p:
+    load_libraries()
+    display = xlib.XOpenDisplay(None)
+    if not display:
+        raise OSError("Cannot open X display")
+    return display
+
+
+def check_x_errors(display, action: str):
+    xlib.XSync(display, 0)
+    if x_errors:
+        x_errors.clear()
+        raise OSError(f"X error during {action}")
+
+
+class XShmGrabber:
+    def __init__(self):
+        self.display = open_display()
+        if not xext.XShmQueryExtension(self.display):
+            xlib.XCloseDisplay(self.display)
+            raise OSError("X server does not support MIT-SHM")
+        screen = xlib.XDefaultScreen(self.display)
+        self.root = xlib.XDefaultRootWindow(self.display)
+        self.visual = xlib.XDefaultVisual(self.display, screen)
+        self.depth = xlib.XDefaultDepth(self.display, screen)
+        self.shminfo = XShmSegmentInfo()
+        self.image = None
+        self.size = None
+        self.buffer = None
+        # Window read from instead of the root, 0 for the root, and its position on the root
+        self.window = 0
+        self.origin = (0, 0)
+
+    def set_window(self, window: int):
+        # Reading a window's own drawable skips whatever is on top of it, as long as a
+        # compositor keeps its contents. Falls back to the root if the window can't be read.
+        self.window, self.origin = window, (0, 0)
+        if not window:
+            return
+        x, y, child = ctypes.c_int(), ctypes.c_int(), ctypes.c_ulong()
+        xlib.XTranslateCoordinates(
+            self.display,
+            window,
+            self.root,
+            0,
+            0,
+            ctypes.byref(x),
+            ctypes.byref(y),
+            ctypes.byref(child),
+        )
+        try:
+            check_x_errors(self.display, "XTranslateCoordinates")
+        except OSError:
+            logger.warning(f"Can't find window {window:#x}, capturing the screen instead")
+            self.window = 0
+            return
+        self.origin = (x.value, y.value)
+
+    def allocate(self, width: int, height: int):
+        self.free()
+        image = xext.XShmCreateImage(
+            self.display,
+            self.visual,
+            self.depth,
+            ZPixmap,
+            None,
+            ctypes.byref(self.shminfo),
+            width,
+            height,
+        )
+        if not image:
+            raise OSError("XShmCreateImage failed")
+        if image.contents.bits_per_pixel != 32:
+            xlib.XDestroyImage(image)
+            raise OSError(f"Unsupported X visual: {image.contents.bits_per_pixel} bpp")
+        stride = image.contents.bytes_per_line
+        self.shminfo.shmid = libc.shmget(
+            IPC_PRIVATE, stride * height, IPC_CREAT | 0o600
+        )
+        if self.shminfo.shmid < 0:
+            xlib.XDestroyImage(image)
+            raise OSError("shmget failed")
+        address = libc.shmat(self.shminfo.shmid, None, 0)
+        if address in (None, ctypes.c_void_p(-1).value):
+            libc.shmctl(self.shminfo.shmid, IPC_RMID, None)
+            xlib.XDestroyImage(image)
+            raise OSError("shmat failed")
+        self.shminfo.shmaddr = address
+        self.shminfo.readOnly = 0
+        image.contents.data = address
+        self.image = image
+        xext.XShmAttach(self.display, ctypes.byref(self.shminfo))
+        # Mark the segment for removal now so it is freed even if we exit uncleanly
+        libc.shmctl(self.shminfo.shmid, IPC_RMID, None)
+        try:
+            check_x_errors(self.display, "XShmAttach")
+        except OSError:
+            self.free()
+            raise
+
+        # BGRX rows, padded to bytes_per_line. The view aliases the shared segment, no copy.
+        raw = np.ctypeslib.as_array(
+            ctypes.cast(address, ctypes.POINTER(ctypes.c_uint8)),
+            shape=(height, stride),
+        )
+        self.buffer = raw.reshape(height, stride // 4, 4)[:, :width]
+        self.size = (width, height)
+
+    def grab(self, box: Box) -> np.ndarray:
+        if self.size != (box.width, box.height):
+            self.allocate(box.width, box.height)
+        if self.window:
+            drawable = self.window
+            x, y = box.left - self.origin[0], box.top - self.origin[1]
+        else:
+            drawable, x, y = self.root, box.left, box.top
+        if not xext.XShmGetImage(self.display, drawable, self.image, x, y, ALL_PLANES):
+            if self.window:
+                # Gone, or a visual the image doesn't match
+                x_errors.clear()
+                logger.warning(f"Can't capture window {self.window:#x}, capturing the screen instead")
+                self.window, self.origin = 0, (0, 0)
+                return self.grab(box)
+            # Raises the X error behind the failure, rather than leaving it for a later call
+            check_x_errors(self.display, "XShmGetImage")
+            raise OSError("XShmGetImage failed")
+        return self.buffer
+
+    def free(self):
+        if self.image is None:
+            return
+        xext.XShmDetach(self.display, ctypes.byref(self.shminfo))
+        xlib.XSync(self.display, 0)
+        # The data belongs to the shared segment, don't let Xlib free() it
+        self.image.contents.data = None
+        xlib.XDestroyImage(self.image)
+        libc.shmdt(self.shminfo.shmaddr)
+        self.image = self.buffer = self.size = None
+
+    def close(self):
+        self.free()
+        xlib.XCloseDisplay(self.display)
+
+
+class DamageWatcher:
+    def __init__(self):
+        self.display = open_display()
+        event_base, error_base = ctypes.c_int(), ctypes.c_int()
+        if not xdamage.XDamageQueryExtension(
+            self.display, ctypes.byref(event_base), ctypes.byref(error_base)
+        ):
+            xlib.XCloseDisplay(self.display)
+            raise OSError("X server does not support the Damage extension")
+        self.notify_type = event_base.value + X_DAMAGE_NOTIFY
+        self.damage = xdamage.XDamageCreate(
+            self.display,
+            xlib.XDefaultRootWindow(self.display),
+            X_DAMAGE_REPORT_DELTA_RECTANGLES,
+        )
+        check_x_errors(self.display, "XDamageCreate")
+        self.fd = xlib.XConnectionNumber(self.display)
+        self.event = XEvent()
+
+    def drain(self, box: Box) -> bool:
+        # Consume all pending damage events, return whether any of them touched the box
+        hit = seen = False
+        while xlib.XPending(self.display):
+            xlib.XNextEvent(self.display, ctypes.byref(self.event))
+            if self.event.type != self.notify_type:
+                continue
+            seen = True
+            area = ctypes.cast(
+                ctypes.byref(self.event), ctypes.POINTER(XDamageNotifyEvent)
+            ).contents.area
+            hit = hit or (
+                area.x < box.left + box.width
+                and box.left < area.x + area.width
+                and area.y < box.top + box.height
+                and box.top < area.y + area.height
+            )
+        if seen:
+            # Empty the damage region so new drawing is reported again
+            xdamage.XDamageSubtract(self.display, self.damage, 0, 0)
+            xlib.XFlush(self.display)
+        return hit
+
+    def wait(self, box: Box, timeout: float) -> bool:
+        # Block until the box is redrawn, False if the timeout passed with no damage
+        deadline = time.monotonic() + timeout
+        while not self.drain(box):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            select.select([self.fd], [], [], remaining)
+        return True
+
+    def close(self):
+        xdamage.XDamageDestroy(self.display, self.damage)
+        xlib.XCloseDisplay(self.display)
+
+
+class XShmSource(CaptureSource):
+    # Frames are BGRX views into the shared memory segment, valid until the next grab
+    pixel_format = "BGRX"
+    reuses_buffer = True
+
+    def __init__(self):
+        self.grabber = None
+
+    def open(self):
+        self.grabber = XShmGrabber()
+
+    def set_window(self, window: int):
+        self.grabber.set_window(window)
+
+    def set_geometry(self, box: Box):
+        # Reallocate the shared segment up front rather than on the first grab of the new size
+        if self.grabber.size != (box.width, box.height):
+            self.grabber.allocate(box.width, box.height)
+
+    def grab(self, box: Box) -> np.ndarray:
+        return self.grabber.grab(box)
+
+    def close(self):
+        if self.grabber is not None:
+            self.grabber.close()
+            self.grabber = None
@@ -0,0 +1,33 @@
+import time
+import zlib
+
+import numpy as np
+
+
+class ChangeDetector:
+    def __init__(self, keepalive: float = 1.0, stride: int = 8):
+        # keepalive: max seconds between frames let through while the image is static,
+        # so WLED doesn't drop out of realtime mode
+        # stride: only every stride-th row and column is hashed
+        self.keepalive = keepalive
+        self.stride = stride
+        self.last_digest = None
+        self.last_passed = 0.0
+
+    def reset(self):
+        # Let the next frame through regardless of its content
+        self.last_digest = None
+
+    def digest(self, img: np.ndarray) -> tuple:
+        sample = np.ascontiguousarray(img[:: self.stride, :: self.stride])
+        # include the shape so a resize of the capture area is always seen as a change
+        return img.shape, zlib.crc32(sample)
+
+    def has_changed(self, img: np.ndarray) -> bool:
+        now = time.monotonic()
+        digest = self.digest(img)
+        if digest == self.last_digest and now - self.last_passed < self.keepalive:
+            return False
+        self.last_digest = digest
+        self.last_passed = now
+        return True
@@ -0,0 +1,101 @@
+import logging
+import threading
+from dataclasses import dataclass
+
+import pymonctl
+from pywinbox import Rect
+
+logger = logging.getLogger(__name__)
+
+# Used when no monitor can be found, eg. on a headless machine
+fallback_size = (1920, 1080)
+
+
+@dataclass
+class MonitorInfo:
+    # A monitor of the virtual desktop, as --monitor indexes them
+    index: int
+    name: str
+    left: int
+    top: int
+    width: int
+    height: int
+    primary: bool = False
+    # Display scaling, eg. 1.5 at 150%
+    scale: float = 1.0
+
+    @property
+    def rect(self) -> Rect:
+        return Rect(self.left, self.top, self.left + self.width, self.top + self.height)
+
+
+def parse_screens(screens: dict) -> list[MonitorInfo]:
+    # From pymonctl.getAllMonitorsDict(), in its order
+    monitors = []
+    for index, (name, screen) in enumerate(screens.items()):
+        position, size = screen.get("position"), screen.get("size")
+        left, top = (position.x, position.y) if position is not None else (0, 0)
+        width, height = (size.width, size.height) if size is not None else fallback_size
+        # As percentages, (0, 0) where pymonctl can't tell
+        scale = screen.get("scale")
+        monitors.append(
+            MonitorInfo(
+                index,
+                name,
+                left,
+                top,
+                width,
+                height,
+                bool(screen.get("is_primary")),
+                scale[0] / 100 if scale and scale[0] else 1.0,
+            )
+        )
+    return monitors
+
+
+class Topology:
+    # The monitors, queried once and then only refreshed when pymonctl reports one being
+    # plugged, unplugged or changed, rather than enumerated again for every lookup
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cached = None
+        self.watching = False
+
+    def monitors(self) -> list[MonitorInfo]:
+        with self.lock:
+            if self.cached is None:
+                try:
+                    self.cached = parse_screens(pymonctl.getAllMonitorsDict())
+                except Exception as e:
+                    logger.warning(f"Monitor detection failed ({e})")
+                    self.cached = []
+            return self.cached
+
+    def watch(self):
+        # pymonctl checks for display changes on its own thread and calls back with them
+        if self.watching:
+            return
+        pymonctl.plugListenerRegister(self.on_change)
+        pymonctl.changeListenerRegister(self.on_change)
+        self.watching = True
+
+    def on_change(self, names: list[str], screens: dict):
+        monitors = parse_screens(screens)
+        with self.lock:
+            self.cached = monitors
+        logger.info(f"Displays changed: {', '.join(names)}. {len(monitors)} monitors now")
+
+    def bounds(self) -> Rect:
+        # Of the whole virtual desktop
+        monitors = self.monitors()
+        if not monitors:
+            return Rect(0, 0, *fallback_size)
+        return Rect(
+            min(monitor.left for monitor in monitors),
+            min(monitor.top for monitor in monitors),
+            max(monitor.left + monitor.width for monitor in monitors),
+            max(monitor.top + monitor.height for monitor in monitors),
+        )
+
+
+topology = Topology()
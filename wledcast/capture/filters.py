@@ -0,0 +1,205 @@
+import ctypes
+import math
+import multiprocessing
+import threading
+import time
+from typing import Union
+
+import cv2
+import numpy as np
+
+# Rec. 709 luma weights, for the sRGB primaries of a screen capture
+luma_weights = np.array([0.2126, 0.7152, 0.0722])
+
+luma_matrix = luma_weights[np.newaxis].astype(np.float32)
+
+# Each processing thread (or worker process) keeps its own stages and their buffers
+local = threading.local()
+
+
+def stages() -> "FilterStages":
+    if not hasattr(local, "stages"):
+        local.stages = FilterStages()
+    return local.stages
+
+
+class FilterStages:
+    # The output filters, applied in place to a frame the caller owns. Kernels and lookup
+    # tables are only rebuilt when their setting changes, and sharpening, which can't work in
+    # place, writes into a buffer kept between frames. Frames of the same size then filter
+    # without allocating.
+    def __init__(self):
+        self.saturation_alpha = None
+        self.saturation_matrix = None
+        self.sharpen_alpha = None
+        self.sharpen_kernel = None
+        self.scratch = None
+        self.balance_scale = None
+        self.balance_lut = None
+        self.auto = AutoLevels()
+
+    def apply(self, img: np.ndarray, filters: dict) -> np.ndarray:
+        if filters.get("auto_exposure") or filters.get("auto_balance"):
+            self.auto(img, filters.get("auto_exposure") or 0, filters.get("auto_balance") or 0)
+        if filters["saturation"] is not None:
+            self.saturation(img, filters["saturation"])
+        if filters["brightness"] is not None:
+            self.brightness(img, filters["brightness"])
+        if filters["contrast"] is not None:
+            self.contrast(img, filters["contrast"])
+        if filters["sharpen"] is not None:
+            self.sharpen(img, filters["sharpen"])
+        if filters["balance_r"] is not None:
+            self.balance(img, filters["balance_r"], filters["balance_g"], filters["balance_b"])
+        return img
+
+    def saturation(self, img: np.ndarray, alpha: float):
+        # Moves each pixel away from (alpha > 1) or towards (alpha < 1) its own luma:
+        # alpha * rgb + (1 - alpha) * luma, which keeps luma and hue and leaves grays alone.
+        # That's one 3x3 matrix, so a single cv2.transform per frame.
+        if alpha == 1:
+            return
+        if alpha != self.saturation_alpha:
+            matrix = alpha * np.eye(3) + (1 - alpha) * np.tile(luma_weights, (3, 1))
+            self.saturation_matrix = matrix.astype(np.float32)
+            self.saturation_alpha = alpha
+        cv2.transform(img, self.saturation_matrix, dst=img)
+
+    def brightness(self, img: np.ndarray, alpha: float):
+        # Scale towards black, the second image has no weight
+        cv2.addWeighted(img, alpha, img, 0, 0, dst=img)
+
+    def contrast(self, img: np.ndarray, alpha: float):
+        # Scale around the mean gray level. cv2.mean gives per channel means without the
+        # float copy of the frame np.mean makes, and the mean is truncated to a gray level.
+        means = cv2.mean(img)
+        mean = int((means[0] + means[1] + means[2]) / 3)
+        cv2.addWeighted(img, alpha, img, 0, mean * (1 - alpha), dst=img)
+
+    def sharpen(self, img: np.ndarray, alpha: float):
+        if alpha != self.sharpen_alpha:
+            kernel = np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]], dtype=np.float64) * alpha
+            kernel[1, 1] += 1
+            self.sharpen_kernel, self.sharpen_alpha = kernel, alpha
+        if self.scratch is None or self.scratch.shape != img.shape:
+            self.scratch = np.empty_like(img)
+        cv2.filter2D(img, -1, self.sharpen_kernel, dst=self.scratch)
+        np.copyto(img, self.scratch)
+
+    def balance(self, img: np.ndarray, r: float, g: float, b: float):
+        # Scale the red, green and blue channels with one lookup table per channel
+        if (r, g, b) != self.balance_scale:
+            scaled = np.arange(256, dtype=np.float64)[:, np.newaxis] * np.array([r, g, b])
+            self.balance_lut = np.clip(scaled, 0, 255).astype(np.uint8).reshape(256, 1, 3)
+            self.balance_scale = (r, g, b)
+        cv2.LUT(img, self.balance_lut, dst=img)
+
+
+class SharedLevels:
+    # The smoothed levels of AutoLevels: low, high, the three channel gains and when they last
+    # moved, 0 for never. With several workers each gets every Nth frame, so the levels live in
+    # shared memory and are moved under its lock, as one set for the cast rather than one per
+    # worker that the LEDs would flicker between.
+    def __init__(self):
+        self.values = multiprocessing.Array(ctypes.c_double, [0.0, 255.0, 1.0, 1.0, 1.0, 0.0])
+
+    def move(self, targets: Union[tuple, None], time_constant: float) -> tuple:
+        # Moves the levels towards targets, (low, high, gains), by how long ago they last
+        # moved. None leaves them. Returns them as (low, high, gains).
+        with self.values.get_lock():
+            low, high, *gains, updated = self.values[:]
+            gains = np.array(gains)
+            if targets is not None:
+                now = time.monotonic()
+                if not updated:
+                    weight = 1.0
+                else:
+                    weight = 1 - math.exp(-min(now - updated, 1.0) / time_constant)
+                low += weight * (targets[0] - low)
+                high += weight * (targets[1] - high)
+                gains = gains + weight * (targets[2] - gains)
+                self.values[:] = [low, high, *gains, now]
+        return low, high, gains
+
+
+# Created in the main process on first use, and handed to each worker process, see
+# wledcast.wled.caster.init_worker
+shared_levels = None
+shared_levels_lock = threading.Lock()
+
+
+def cast_levels() -> SharedLevels:
+    global shared_levels
+    with shared_levels_lock:
+        if shared_levels is None:
+            shared_levels = SharedLevels()
+        return shared_levels
+
+
+class AutoLevels:
+    # Auto exposure and white balance, from statistics of the frame at LED resolution:
+    # exposure stretches the luma between its 1st and 99th percentile, from a 256 bin
+    # histogram, towards the full range, and white balance scales each channel towards the
+    # frame's mean gray (gray world). Strengths between 0 and 1 say how far. The levels are
+    # smoothed over time so cuts don't make the LEDs jump, see SharedLevels, and folded into a
+    # per-channel lookup table which is only rebuilt when they move by more than a threshold.
+    time_constant = 1.0  # seconds for the levels to move most of the way to a new scene
+    max_gain = 4.0  # dark scenes are lifted at most this much, or noise is all that shows
+    min_level = 8  # frames darker than this are left alone, eg. black between scenes
+    level_threshold = 2.0
+    gain_threshold = 0.02
+
+    def __init__(self, shared: Union[SharedLevels, None] = None):
+        # The levels of the cast, shared_levels unless given
+        self.shared = shared
+        self.low, self.high = 0.0, 255.0
+        self.gains = np.ones(3)
+        self.built = None  # (low, high, gains) of the current table
+        self.lut = None
+        self.luma = None
+
+    def levels(self, img: np.ndarray, exposure: float, balance: float) -> Union[tuple, None]:
+        # Targets for this frame: the input range to stretch to 0-255 and the channel gains,
+        # None to leave the levels as they are
+        if self.luma is None or self.luma.shape != img.shape[:2]:
+            self.luma = np.empty(img.shape[:2], dtype=np.uint8)
+        cv2.transform(img, luma_matrix, dst=self.luma)
+        histogram = cv2.calcHist([self.luma], [0], None, [256], [0, 256]).ravel()
+        cumulative = np.cumsum(histogram)
+        low = float(np.searchsorted(cumulative, 0.01 * cumulative[-1]))
+        high = float(np.searchsorted(cumulative, 0.99 * cumulative[-1]))
+        means = np.array(cv2.mean(img)[:3])
+        gray = means.mean()
+        if high < self.min_level or gray < self.min_level:
+            return None
+        # Don't stretch a range narrower than max_gain allows, widen it around its middle
+        span = max(high - low, 255 / self.max_gain)
+        high = min(255.0, (low + high + span) / 2)
+        low = max(0.0, high - span)
+        gains = np.clip(gray / np.maximum(means, 1), 0.5, 2.0)
+        return (
+            exposure * low,
+            255 - exposure * (255 - high),
+            1 + balance * (gains - 1),
+        )
+
+    def __call__(self, img: np.ndarray, exposure: float, balance: float):
+        shared = self.shared if self.shared is not None else cast_levels()
+        self.low, self.high, self.gains = shared.move(
+            self.levels(img, exposure, balance), self.time_constant
+        )
+        if (
+            self.built is None
+            or abs(self.low - self.built[0]) > self.level_threshold
+            or abs(self.high - self.built[1]) > self.level_threshold
+            or np.abs(self.gains - self.built[2]).max() > self.gain_threshold
+        ):
+            self.build()
+        cv2.LUT(img, self.lut, dst=img)
+
+    def build(self):
+        scale = 255 / max(self.high - self.low, 1)
+        levels = np.arange(256, dtype=np.float64)[:, np.newaxis] * self.gains
+        lut = np.clip((levels - self.low) * scale + 0.5, 0, 255)
+        self.lut = lut.astype(np.uint8).reshape(256, 1, 3)
+        self.built = (self.low, self.high, self.gains.copy())
@@ -0,0 +1,39 @@
+def capture_resolution(led_matrix_shape, regions, edge_layout):
+    # The resolution the capture box is cropped to the aspect ratio of. Regions and edges
+    # are sampled from the whole window, only a plain scaled output crops it.
+    if regions or edge_layout is not None:
+        return None
+    return led_matrix_shape
+
+
+def keep_on_desktop(box, desktop, border_size: int) -> tuple[int, int]:
+    # (left, top) of a box moved as little as needed to keep it and its border on the desktop
+    left = max(desktop.left + border_size, min(box.left, desktop.right - border_size - box.width))
+    top = max(desktop.top + border_size, min(box.top, desktop.bottom - border_size - box.height))
+    return left, top
+
+
+def fit_to_window(rect, desktop, border_size: int, target_resolution) -> tuple[int, int, int, int]:
+    # (left, top, width, height) of the capture box for a window's client rect, kept on the
+    # desktop and off the border. Without a target resolution it covers the whole window,
+    # otherwise the largest centred area with the target's aspect ratio.
+    left = max(border_size, rect.left)
+    top = max(border_size, rect.top)
+    width = min(desktop.right - left - border_size, rect.right - left - border_size)
+    height = min(desktop.bottom - top - border_size, rect.bottom - top - border_size)
+
+    if target_resolution is None:
+        return left, top, width, height
+
+    target_aspect_ratio = target_resolution.width / target_resolution.height
+    if width / height > target_aspect_ratio:
+        # Crop the width to match the aspect ratio of the resolution
+        new_width = int(height * target_aspect_ratio)
+        left = left + width // 2 - new_width // 2
+        width = new_width
+    else:
+        # Crop the height to match the aspect ratio of the resolution
+        new_height = int(width / target_aspect_ratio)
+        top = top + height // 2 - new_height // 2
+        height = new_height
+    return left, top, width, height
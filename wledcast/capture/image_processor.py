@@ -1,95 +1,66 @@
 import cv2
 import numpy as np
-import wx
 
-from wledcast.model import Size
-
-
-def process_raw_image(img: np.ndarray, resolution: Size, filters: dict) -> np.ndarray:
-    img = cv2.resize(img, resolution, interpolation=cv2.INTER_AREA)
+from wledcast.capture.ambilight import EdgeSampler
+from wledcast.capture.filters import stages
+from wledcast.model import Region, Size
+
+# Captures are converted to RGB after downscaling, when the image is tiny
+color_conversions = {
+    "BGR": cv2.COLOR_BGR2RGB,
+    "BGRX": cv2.COLOR_BGRA2RGB,
+}
+
+
+def process_raw_image(
+    img: np.ndarray,
+    resolution: Size,
+    filters: dict,
+    pixel_format: str = "RGB",
+    regions: list[Region] = None,
+    edges: EdgeSampler = None,
+) -> np.ndarray:
+    captured = img
+    if edges is not None:
+        img = edges.sample(img)
+    elif regions:
+        img = compose_regions(img, regions, resolution)
+    elif img.shape[1::-1] != tuple(resolution):
+        img = cv2.resize(img, resolution, interpolation=cv2.INTER_AREA)
+    if pixel_format in color_conversions:
+        img = cv2.cvtColor(img, color_conversions[pixel_format])
+    if img is captured:
+        # Filters work in place, never on the captured frame itself
+        img = img.copy()
     img = apply_filters_cv2(img, filters)
     return img
 
 
-def apply_filters_cv2(img: np.ndarray, filters: dict) -> np.ndarray:
-    # Convert to HSV for color adjustment
-    if filters["saturation"] is not None:
-        img = filter_saturation(img, filters["saturation"])
-
-    # Adjust brightness
-    if filters["brightness"] is not None:
-        img = filter_brightness(img, filters["brightness"])
-
-    # Adjust contrast
-    if filters["contrast"] is not None:
-        img = filter_contrast(img, filters["contrast"])
-
-    if filters["sharpen"] is not None:
-        img = filter_sharpen(img, filters["sharpen"])
-
-    if filters["balance_r"] is not None:
-        img = filter_balance(
-            img,
-            {
-                "r": filters["balance_r"],
-                "g": filters["balance_g"],
-                "b": filters["balance_b"],
-            },
+def compose_regions(
+    img: np.ndarray, regions: list[Region], resolution: Size
+) -> np.ndarray:
+    # The capture box is grabbed once and each region is a view into it, so adding regions
+    # adds resizes of their own pixels but no grabs. Uncovered LEDs stay black.
+    height, width = img.shape[:2]
+    out = np.zeros((resolution[1], resolution[0], img.shape[2]), dtype=img.dtype)
+    for region in regions:
+        left, top, area_width, area_height = region.area
+        view = img[
+            round(top * height) : round((top + area_height) * height),
+            round(left * width) : round((left + area_width) * width),
+        ]
+        x, y, output_width, output_height = region.output
+        if view.size == 0 or output_width <= 0 or output_height <= 0:
+            continue
+        out[y : y + output_height, x : x + output_width] = cv2.resize(
+            view, (output_width, output_height), interpolation=cv2.INTER_AREA
         )
-
-    return img
-
-
-def filter_sharpen(img, alpha):
-    kernel = np.array([[0, -1, 0], [-1, 4, -1], [0, -1, 0]]) * alpha
-    kernel[1, 1] += 1
-    img = cv2.filter2D(img, -1, kernel)
-    return img
-
-
-def filter_balance(img, alpha):
-    # scale the red, green, and blue channels
-    scale = np.array([alpha["r"], alpha["g"], alpha["b"]])[np.newaxis, np.newaxis, :]
-
-    img = (img * scale).astype(np.uint8)
-    return img
+    return out
 
 
-def filter_contrast(img, alpha):
-    # Compute the mean luminance (gray level)
-    mean_luminance = np.mean(img)
-
-    # Create a gray image of mean luminance
-    gray_img = np.full_like(img, mean_luminance)
-
-    # Enhance contrast
-    enhanced_img = cv2.addWeighted(img, alpha, gray_img, 1 - alpha, 0)
-    return enhanced_img
-
-
-def filter_brightness(img, alpha):
-    # Create a black image
-    black_img = np.zeros_like(img)
-
-    # Enhance brightness
-    enhanced_img = cv2.addWeighted(img, alpha, black_img, 1 - alpha, 0)
-    return enhanced_img
-
-
-def filter_saturation(img, alpha):
-    # Convert to HSV and split the channels
-    hsv = cv2.cvtColor(img, cv2.COLOR_RGB2HSV)
-    h, s, v = cv2.split(hsv)
-
-    # Create a grayscale (desaturated) version
-    gray = cv2.cvtColor(img, cv2.COLOR_RGB2GRAY)
-
-    # Enhance color
-    s_enhanced = cv2.addWeighted(s, alpha, gray, 1 - alpha, 0)
-
-    # Merge and convert back to RGB
-    enhanced_img = cv2.cvtColor(cv2.merge([h, s_enhanced, v]), cv2.COLOR_HSV2RGB)
-    return enhanced_img
+def apply_filters_cv2(img: np.ndarray, filters: dict) -> np.ndarray:
+    # Filters img in place, see wledcast.capture.filters
+    return stages().apply(img, filters)
 
 
 def image_to_ascii(image):
@@ -109,30 +80,3 @@ def image_to_ascii(image):
     for i in range(0, ascii_str_len, width):
         ascii_img += ascii_str[i : i + width] + "\n"
     return ascii_img
-
-
-def stretch_array_repeat(arr, stretch_factor):
-    # Repeat the array elements along the column axis
-    stretched_arr = np.repeat(arr, stretch_factor, axis=0)
-    # Repeat the array elements along the row axis
-    stretched_arr = np.repeat(stretched_arr, stretch_factor, axis=1)
-    return stretched_arr
-
-
-def show_preview(rgb_array, resolution):
-    # Show a live view of the downscaled feed on the computer with 24-bit color blocks
-    # Scaling by an integer will keep the pixelated effect but make it visible
-    x, y = resolution
-    monitor_x, monitor_y = wx.GetDisplaySize()
-    # find the largest integer scaling factpr that will fit in the monitor in both dimensions
-    scaling_factor = min(monitor_x // x, monitor_y // y)
-    bgr_array = cv2.cvtColor(rgb_array, cv2.COLOR_RGB2BGR)
-    if scaling_factor > 1:
-        bgr_array = stretch_array_repeat(bgr_array, scaling_factor)
-    try:
-        # Use OpenCV to display the image
-        cv2.imshow("Live View", bgr_array)
-        cv2.waitKey(1)
-
-    except Exception as e:
-        print(f"An error occurred during live view: {e}")
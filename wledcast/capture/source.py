@@ -0,0 +1,40 @@
+from typing import Union
+
+import numpy as np
+
+from wledcast.model import Box
+
+
+class CaptureSource:
+    # Pixel layout of grabbed frames: "RGB", "BGR" or "BGRX"
+    pixel_format = "RGB"
+    # True if grab() returns a view of an internal buffer that the next grab() overwrites
+    reuses_buffer = False
+    # Sequence number of the capture box geometry last passed to set_geometry
+    geometry_sequence = None
+
+    def open(self):
+        pass
+
+    def set_geometry(self, box: Box):
+        # Called when the capture box moves or resizes, before the next grab
+        pass
+
+    def set_window(self, window: int):
+        # Sources that can read a window's own pixels, rather than whatever is on screen over
+        # it, capture from this window from now on, 0 for the screen. Called before
+        # set_geometry.
+        pass
+
+    def grab(self, box: Box) -> Union[np.ndarray, None]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Callable, Union
+
+import pywinctl
+
+from wledcast.capture.displays import topology
+from wledcast.capture.geometry import keep_on_desktop
+from wledcast.config import border_size
+from wledcast.model import Box, SharedBox
+
+logger = logging.getLogger(__name__)
+
+
+class WindowTracker:
+    # Keeps the capture box on the window being cast as it moves, resizes, minimizes or
+    # closes. The window's client rectangle is polled every interval seconds on an executor
+    # thread, as window system calls can block and not every platform reports moves. A move
+    # shifts the box along with the window, keeping any adjustment made to it, a resize fits
+    # a new box to the window. While the window is minimized or closed the box is marked
+    # hidden and capture workers skip frames rather than cast whatever is in its place.
+    def __init__(
+        self,
+        capture_box: SharedBox,
+        fit: Callable[[pywinctl.Window], Box],
+        on_change: Callable[[], None] = None,
+        interval: float = 0.5,
+        capture_window: bool = False,
+    ):
+        self.capture_box = capture_box
+        self.fit = fit
+        self.on_change = on_change
+        self.interval = interval
+        # Have sources that can read the window's own pixels do so
+        self.capture_window = capture_window
+        self.window = None
+        # Client rectangle the box was last placed in, (left, top, right, bottom)
+        self.rect = None
+
+    def follow(self, window: Union[pywinctl.Window, None]):
+        # Starts following window, whose box was just set, or stops following with None
+        self.window = window
+        self.rect = None
+        handle = 0
+        if window is not None:
+            try:
+                self.rect, _ = self.geometry(window)
+                if self.capture_window:
+                    handle = int(window.getHandle())
+            except Exception as e:
+                logger.warning(f"Can't follow {window.title}: {e}")
+                self.window = None
+        box = self.capture_box
+        if (box.window, box.hidden) != (handle, False):
+            box.window, box.hidden = handle, False
+            box.publish()
+
+    def geometry(self, window: pywinctl.Window) -> tuple[Union[tuple, None], bool]:
+        # (client rectangle, shown), the rectangle is None once the window is closed
+        if not window.isAlive:
+            return None, False
+        rect = window.getClientFrame()
+        shown = not window.isMinimized and window.isVisible
+        return (rect.left, rect.top, rect.right, rect.bottom), shown
+
+    def update(self, rect: Union[tuple, None], shown: bool):
+        box = self.capture_box
+        if shown == box.hidden:
+            if rect is None:
+                logger.warning(
+                    f"{self.window.title} was closed, nothing is captured until a profile "
+                    "picks another window"
+                )
+            else:
+                logger.info(f"{self.window.title} {'shown' if shown else 'hidden'}")
+            box.hidden = not shown
+            box.publish()
+        if rect is None:
+            # Closed for good, a profile switch can pick a new window
+            self.window = None
+            return
+        if not shown or rect == self.rect:
+            return
+        moved = self.rect is not None and (
+            (rect[2] - rect[0], rect[3] - rect[1])
+            == (self.rect[2] - self.rect[0], self.rect[3] - self.rect[1])
+        )
+        if moved:
+            # Shifted along with the window, as far as the desktop goes
+            dx, dy = rect[0] - self.rect[0], rect[1] - self.rect[1]
+            new_box = Box(box.left + dx, box.top + dy, box.width, box.height)
+            new_box.left, new_box.top = keep_on_desktop(new_box, topology.bounds(), border_size)
+        else:
+            new_box = self.fit(self.window)
+        self.rect = rect
+        box.publish(new_box)
+        if self.on_change is not None:
+            self.on_change()
+
+    async def run(self, stop_event):
+        loop = asyncio.get_running_loop()
+        while not stop_event.is_set():
+            window = self.window
+            if window is not None:
+                try:
+                    rect, shown = await loop.run_in_executor(None, self.geometry, window)
+                except Exception as e:
+                    logger.debug(f"Can't read the geometry of {window.title}: {e}")
+                else:
+                    # A profile switch may have picked another window meanwhile
+                    if window is self.window:
+                        self.update(rect, shown)
+            await asyncio.sleep(self.interval)
@@ -1,10 +1,11 @@
 import argparse
-import json
 import logging
 import os
 
-import aiofiles
-import pymonctl
+from wledcast.capture.ambilight import corners, parse_edge_layout
+from wledcast.capture.displays import topology
+from wledcast.filter_config import FilterConfig, user_config_dir
+from wledcast.profiles import load_profiles, parse_regions
 
 # Parse command line arguments
 parser = argparse.ArgumentParser()
@@ -15,6 +16,30 @@ parser.add_argument(
     default=None,
     help="Cast window whose title contains this string",
 )
+parser.add_argument(
+    "--title-regex",
+    type=str,
+    default=None,
+    help="Cast window whose title matches this regular expression",
+)
+parser.add_argument(
+    "--app",
+    type=str,
+    default=None,
+    help="Cast a window of the process with this name, eg. mpv or vlc.exe",
+)
+parser.add_argument(
+    "--no-prompt",
+    default=False,
+    help="Never ask which window or monitor to cast, take the best match or exit. Implied when stdin isn't a terminal",
+    action="store_true",
+)
+parser.add_argument(
+    "--wait",
+    type=float,
+    default=0,
+    help="Without prompts, keep looking for a matching window for this many seconds, eg. while it starts. Defaults to 0",
+)
 parser.add_argument(
     "--search-timeout",
     type=int,
@@ -37,7 +62,8 @@ parser.add_argument(
     "--host",
     default=None,
     type=str,
-    help="Specify the IP address of the WLED instance to cast to",
+    nargs="+",
+    help="Specify the IP address of the WLED instance to cast to. Several can be given to cast to all of them",
 )
 parser.add_argument(
     "--monitor",
@@ -64,76 +90,240 @@ parser.add_argument(
     default=3,
     help="Number of capture workers. Defaults to 3 which is fine unless fps is very high",
 )
+parser.add_argument(
+    "--skip-static",
+    default=False,
+    help="Skip processing and sending frames while the captured image is unchanged",
+    action="store_true",
+)
+parser.add_argument(
+    "--keepalive",
+    type=float,
+    default=1.0,
+    help="Resend the last frame to devices sent nothing for this long (seconds), to keep WLED in realtime mode. Defaults to 1s",
+)
+parser.add_argument(
+    "--health-interval",
+    type=float,
+    default=10,
+    help="Seconds between checks that devices are reachable, unreachable ones are paused. 0 to never pause. Defaults to 10",
+)
+parser.add_argument(
+    "--capture-backend",
+    choices=["mss", "xshm"],
+    default="mss",
+    help="Screen capture backend. xshm (Linux/X11 only) uses shared memory and only captures when the area is redrawn",
+)
+parser.add_argument(
+    "--follow-interval",
+    type=float,
+    default=0.5,
+    help="Seconds between checks of the cast window's position, the capture box follows it when it moves or resizes. 0 to keep the box where it is. Defaults to 0.5",
+)
+parser.add_argument(
+    "--capture-window",
+    default=False,
+    help="With the xshm backend, read the cast window's own pixels so windows on top of it don't show (needs a compositor)",
+    action="store_true",
+)
+parser.add_argument(
+    "--source",
+    choices=["screen", "pipe", "file"],
+    default="screen",
+    help="Where frames come from: the screen (default), raw rgb24 frames on a pipe, or a video file",
+)
+parser.add_argument(
+    "--input",
+    type=str,
+    default="-",
+    help="Video file for --source file, or pipe/FIFO path for --source pipe (defaults to stdin)",
+)
+parser.add_argument(
+    "--input-resolution",
+    type=str,
+    default=None,
+    help="Frame size of raw --source pipe input (format 64x32). Defaults to the output resolution",
+)
+parser.add_argument(
+    "--loop",
+    default=False,
+    help="Restart --source file or --replay from the beginning when it ends",
+    action="store_true",
+)
+parser.add_argument(
+    "--executor",
+    choices=["process", "thread"],
+    default="process",
+    help="Run capture workers in a process pool (default) or as threads in one process",
+)
+parser.add_argument(
+    "--benchmark",
+    type=float,
+    default=None,
+    metavar="SECONDS",
+    help="Cast without the UI for SECONDS, then print frame rate, latency, CPU and memory statistics",
+)
+parser.add_argument(
+    "--filter-config",
+    type=str,
+    default=None,
+    help="Filter settings file, watched for changes while casting. Defaults to filter.json in the user config directory",
+)
+parser.add_argument(
+    "--regions",
+    type=str,
+    default=None,
+    help="JSON file of capture box regions to compose into the output, instead of scaling the whole box",
+)
+parser.add_argument(
+    "--ambilight",
+    type=str,
+    default=None,
+    metavar="TOP,RIGHT,BOTTOM,LEFT",
+    help="Drive an LED strip around the screen edges with this many LEDs per side, sampled from the edges of the capture box",
+)
+parser.add_argument(
+    "--edge-depth",
+    type=float,
+    default=0.1,
+    help="With --ambilight, depth of the sampled edge bands as a fraction of the shorter side. Defaults to 0.1",
+)
+parser.add_argument(
+    "--edge-corners",
+    choices=["skip", "include", "separate"],
+    default="skip",
+    help="With --ambilight, leave the corners out of the sides (default), include them, or give each corner its own LED",
+)
+parser.add_argument(
+    "--edge-start",
+    choices=corners,
+    default="bottom-left",
+    help="With --ambilight, the corner the strip starts at. Defaults to bottom-left",
+)
+parser.add_argument(
+    "--edge-counterclockwise",
+    default=False,
+    help="With --ambilight, the strip runs counterclockwise seen from the front",
+    action="store_true",
+)
+parser.add_argument(
+    "--adaptive-fps",
+    default=False,
+    help="Find the highest frame rate the devices and pipeline sustain while casting, starting from --fps",
+    action="store_true",
+)
+parser.add_argument(
+    "--min-fps",
+    type=int,
+    default=5,
+    help="Lowest frame rate --adaptive-fps backs off to. Defaults to 5",
+)
+parser.add_argument(
+    "--max-fps",
+    type=int,
+    default=60,
+    help="Highest frame rate --adaptive-fps tries. Defaults to 60",
+)
+parser.add_argument(
+    "--api-port",
+    type=int,
+    default=None,
+    help="Serve the HTTP control and metrics API on this port. Off by default",
+)
+parser.add_argument(
+    "--api-host",
+    type=str,
+    default="127.0.0.1",
+    help="Address the control API listens on. Defaults to localhost only",
+)
+parser.add_argument(
+    "--sync",
+    choices=["push", "broadcast"],
+    default=None,
+    help="Latch DDP devices together: send all their data, then a push packet to each device or one broadcast",
+)
+parser.add_argument(
+    "--sync-address",
+    type=str,
+    default="255.255.255.255",
+    help="Broadcast address for --sync broadcast. Defaults to 255.255.255.255",
+)
+parser.add_argument(
+    "--sync-delay",
+    type=float,
+    default=0,
+    help="With --sync, ask devices to show frames this many milliseconds after the push, with a DDP timecode",
+)
+parser.add_argument(
+    "--record",
+    type=str,
+    default=None,
+    help="Record the frames sent to each device to this file",
+)
+parser.add_argument(
+    "--record-compress",
+    default=False,
+    help="Compress recorded frames with zlib",
+    action="store_true",
+)
+parser.add_argument(
+    "--replay",
+    type=str,
+    default=None,
+    help="Send a recording to its devices, or to --host, instead of casting",
+)
+parser.add_argument(
+    "--replay-speed",
+    type=float,
+    default=1.0,
+    help="Replay this many times as fast as recorded, 0 for as fast as possible. Defaults to 1",
+)
+parser.add_argument(
+    "--profiles",
+    type=str,
+    default=None,
+    help="Profiles file. Defaults to profiles.json in the user config directory",
+)
+parser.add_argument(
+    "--profile",
+    type=str,
+    default=None,
+    help="Profile to start with. Defaults to the default profile in the profiles file, if any",
+)
 args = parser.parse_args()
 
+# A profile supplies defaults for the command line options, flags given explicitly still win
+profiles_path = args.profiles or os.path.join(user_config_dir(), "profiles.json")
+default_profile, profiles = load_profiles(profiles_path, set(vars(args)))
+profile_name = args.profile or default_profile
+if profile_name is not None and profile_name not in profiles:
+    parser.error(f"Profile {profile_name} not found in {profiles_path}")
+profile = profiles.get(profile_name)
+if profile is not None:
+    parser.set_defaults(**profile.options)
+    args = parser.parse_args()
+
 border_size: int = int(args.border_size)
-filter_config_path = os.path.join(os.path.dirname(__file__), "filter.json")
+# Inline in a profile, or a file given with --regions
+regions = parse_regions(args.regions)
+edge_layout = parse_edge_layout(args)
+if regions and edge_layout:
+    parser.error("--regions and --ambilight can't be used together")
+filter_config_path = args.filter_config or os.path.join(user_config_dir(), "filter.json")
 
-with open(filter_config_path, "r") as f:
-    filters = json.load(f)
+# Created from the defaults shipped with the package on first run
+filters = FilterConfig(filter_config_path)
+if profile is not None and profile.filters is not None:
+    filters.update(profile.filters)
 
 logger = logging.getLogger(__name__)
 
 
 async def save_filter_config():
-    async with aiofiles.open(filter_config_path, "w") as f:
-        await f.write(json.dumps(filters, indent=4))
-
-
-# Calculate actual virtual desktop bounds considering monitor positions
-try:
-    monitors = pymonctl.getAllMonitorsDict()
-    if not monitors:
-        # Fallback to a reasonable default if no monitors detected
-        max_x, max_y = 1920, 1080
-        logger.warning("No monitors detected, using fallback resolution 1920x1080")
-    else:
-        # Find the actual bounding box of all monitors
-        min_x = min_y = float('inf')
-        max_x_bound = max_y_bound = float('-inf')
-        
-        for i, monitor in enumerate(monitors.values()):
-            # Handle Point objects for position
-            pos = monitor.get("position", None)
-            size = monitor.get("size", None)
-            
-            # Extract coordinates from Point/Size objects or use defaults
-            if hasattr(pos, 'x') and hasattr(pos, 'y'):
-                left = pos.x
-                top = pos.y
-            else:
-                left = top = 0
-                
-            if hasattr(size, 'width') and hasattr(size, 'height'):
-                width = size.width
-                height = size.height
-            else:
-                width, height = 1920, 1080
-            
-            # Calculate monitor boundaries
-            right = left + width
-            bottom = top + height
-            
-            
-            # Update bounding box
-            min_x = min(min_x, left)
-            min_y = min(min_y, top)
-            max_x_bound = max(max_x_bound, right)
-            max_y_bound = max(max_y_bound, bottom)
-        
-        # Store the actual coordinate bounds for UI constraints
-        # Don't convert to dimensions - keep as coordinate bounds
-        max_x = max_x_bound
-        max_y = max_y_bound
-        # Also store minimums for constraints
-        min_desktop_x = min_x
-        min_desktop_y = min_y
-        
-        logger.info(f"Virtual desktop bounds: {max_x}x{max_y} (monitors from {min_x},{min_y} to {max_x_bound},{max_y_bound})")
+    await filters.save()
 
-except Exception as e:
-    # Fallback if monitor detection fails
-    max_x, max_y = 1920, 1080
-    min_desktop_x = min_desktop_y = 0
-    logger.warning(f"Monitor detection failed ({e}), using fallback resolution 1920x1080")
 
+# Bounds of the virtual desktop across all monitors, for the UI's constraints. The monitors
+# are enumerated once here and cached for selecting and fitting the capture box.
+min_desktop_x, min_desktop_y, max_x, max_y = topology.bounds()
+logger.info(f"Virtual desktop bounds: {min_desktop_x},{min_desktop_y} to {max_x},{max_y}")
@@ -0,0 +1,162 @@
+import asyncio
+import ctypes
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from multiprocessing.sharedctypes import RawArray
+
+import aiofiles
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+default_filter_config_path = os.path.join(os.path.dirname(__file__), "filter.json")
+
+
+def user_config_dir() -> str:
+    if sys.platform == "win32":
+        base = os.environ.get("APPDATA") or os.path.expanduser("~")
+    elif sys.platform == "darwin":
+        base = os.path.expanduser("~/Library/Application Support")
+    else:
+        base = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+    return os.path.join(base, "wledcast")
+
+
+def read_filter_file(path: str) -> tuple[int, dict]:
+    # Files are {"version": n, "filters": {...}}, a plain dict of filters is read as version 0
+    with open(path, "r") as f:
+        data = json.load(f)
+    if "filters" in data:
+        return int(data.get("version", 0)), data["filters"]
+    return 0, data
+
+
+class FilterConfig:
+    # The filter settings, with a version that is bumped on every change. Values live in a
+    # shared array which workers are handed once at startup, like the SharedBox, so filters
+    # aren't pickled with every frame and workers only rebuild their filters when the version
+    # moves. The file is in the user's config directory and is watched, so a running cast can
+    # be tuned by a script rewriting it.
+    def __init__(self, path: str, defaults_path: str = default_filter_config_path):
+        _, defaults = read_filter_file(defaults_path)
+        self.path = path
+        self.names = tuple(defaults)
+        # [sequence, version, *values], None is stored as NaN
+        self.shared = RawArray(ctypes.c_double, 2 + len(self.names))
+        self.lock = threading.Lock()
+        self.cache = (-1, {})
+        self.mtime = None
+        # Filters added since the user's file was written keep their defaults
+        self.update(defaults)
+        if os.path.exists(path):
+            self.load()
+        else:
+            self.write()
+
+    def __getstate__(self):
+        # Only pickled when handed to a new worker process, the RawArray is inherited
+        return {"path": self.path, "names": self.names, "shared": self.shared}
+
+    def __setstate__(self, state):
+        self.path = state["path"]
+        self.names = state["names"]
+        self.shared = state["shared"]
+        self.lock = threading.Lock()
+        self.cache = (-1, {})
+        self.mtime = None
+
+    @property
+    def record(self) -> np.ndarray:
+        return np.frombuffer(self.shared, dtype=np.float64)
+
+    @property
+    def version(self) -> int:
+        return int(self.record[1])
+
+    def update(self, filters: dict, version: int = 0) -> bool:
+        # Publishes the given filters, unknown names are ignored and missing ones kept.
+        # Returns whether anything changed, the version only moves when it did.
+        with self.lock:
+            record = self.record
+            values = record[2:].copy()
+            for i, name in enumerate(self.names):
+                if name in filters:
+                    value = filters[name]
+                    values[i] = math.nan if value is None else float(value)
+            if np.array_equal(values, record[2:], equal_nan=True) and record[0] > 0:
+                return False
+            record[0] += 1
+            record[1] = max(version, int(record[1]) + 1)
+            record[2:] = values
+            record[0] += 1
+        return True
+
+    def snapshot(self) -> tuple[int, dict]:
+        # Seqlock read, see SharedBox.snapshot
+        record = self.record
+        while True:
+            sequence = record[0]
+            if sequence % 2 == 0:
+                version = int(record[1])
+                values = record[2:].tolist()
+                if record[0] == sequence:
+                    return version, {
+                        name: None if math.isnan(value) else value
+                        for name, value in zip(self.names, values)
+                    }
+            time.sleep(0)
+
+    def current(self) -> dict:
+        # The filters as of the latest version, only copied out of shared memory when it moved
+        version, filters = self.cache
+        if version != self.version:
+            version, filters = self.snapshot()
+            self.cache = (version, filters)
+        return filters
+
+    def load(self) -> bool:
+        version, filters = read_filter_file(self.path)
+        self.mtime = os.stat(self.path).st_mtime_ns
+        return self.update(filters, version)
+
+    def serialize(self) -> str:
+        version, filters = self.snapshot()
+        return json.dumps({"version": version, "filters": filters}, indent=4)
+
+    def write(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w") as f:
+            f.write(self.serialize())
+        self.mtime = os.stat(self.path).st_mtime_ns
+
+    async def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        async with aiofiles.open(self.path, "w") as f:
+            await f.write(self.serialize())
+        # Don't reload our own write
+        self.mtime = os.stat(self.path).st_mtime_ns
+
+    def reload(self) -> bool:
+        # Loads the file again if it changed on disk since it was last read or written
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self.mtime:
+                return False
+            changed = self.load()
+        except (OSError, ValueError) as e:
+            # Most likely caught halfway through being written, try again next time
+            logger.info(f"Could not reload {self.path}: {e}")
+            return False
+        if changed:
+            logger.info(f"Reloaded filters from {self.path}, version {self.version}")
+        return changed
+
+    async def watch(self, stop_event, interval: float = 1.0):
+        while not stop_event.is_set():
+            await asyncio.sleep(interval)
+            self.reload()
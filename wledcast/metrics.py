@@ -0,0 +1,91 @@
+import threading
+from collections import deque
+
+
+class StageTimes:
+    # How long frames spend in each stage of the pipeline, in seconds:
+    # capture: grabbing the frame (or reading it and handing it to a worker, for stream sources)
+    # process: resizing and filtering
+    # handoff: getting the processed frame back to the sender
+    # total: from the start of the capture until the frame is handed to the sender
+    stages = ("capture", "process", "handoff", "total")
+
+    def __init__(self, window: int = 200):
+        self.recent = {stage: deque(maxlen=window) for stage in self.stages}
+        self.sums = dict.fromkeys(self.stages, 0.0)
+        self.count = 0
+        # Frames are recorded from the pool's result thread or several processing threads
+        self.lock = threading.Lock()
+
+    def record(self, started: float, captured: float, processed: float, submitted: float):
+        durations = {
+            "capture": captured - started,
+            "process": processed - captured,
+            "handoff": submitted - processed,
+            "total": submitted - started,
+        }
+        with self.lock:
+            self.count += 1
+            for stage, duration in durations.items():
+                self.recent[stage].append(duration)
+                self.sums[stage] += duration
+
+    def summary(self) -> dict[str, dict]:
+        # Median and 95th percentile over the recent frames, sum and count over all of them
+        with self.lock:
+            recent = {stage: sorted(durations) for stage, durations in self.recent.items()}
+            sums, count = dict(self.sums), self.count
+        return {
+            stage: {
+                "p50": durations[len(durations) // 2] if durations else 0.0,
+                "p95": durations[int(len(durations) * 0.95)] if durations else 0.0,
+                "sum": sums[stage],
+                "count": count,
+            }
+            for stage, durations in recent.items()
+        }
+
+
+def prometheus_text(
+    stage_summary: dict[str, dict],
+    device_stats: dict[str, dict],
+    target_fps: float,
+    filters_version: int,
+) -> str:
+    # Prometheus text exposition format, version 0.0.4
+    lines = [
+        "# HELP wledcast_stage_seconds Time frames spend in each pipeline stage",
+        "# TYPE wledcast_stage_seconds summary",
+    ]
+    for stage, summary in stage_summary.items():
+        for quantile in ("0.5", "0.95"):
+            value = summary["p50" if quantile == "0.5" else "p95"]
+            lines.append(f'wledcast_stage_seconds{{stage="{stage}",quantile="{quantile}"}} {value}')
+        lines.append(f'wledcast_stage_seconds_sum{{stage="{stage}"}} {summary["sum"]}')
+        lines.append(f'wledcast_stage_seconds_count{{stage="{stage}"}} {summary["count"]}')
+
+    device_metrics = [
+        ("frames_sent_total", "counter", "sent", "Frames sent to the device"),
+        ("frames_dropped_total", "counter", "dropped", "Frames replaced by a newer one before being sent"),
+        ("frames_decimated_total", "counter", "decimated", "Frames skipped to keep to the device's frame rate"),
+        ("send_errors_total", "counter", "errors", "Socket errors sending to the device"),
+        ("device_fps", "gauge", "fps", "Recent frame rate sent to the device"),
+        ("send_seconds", "gauge", "send_seconds", "Median time to send a frame's packets"),
+        ("latch_seconds", "gauge", "latch_seconds", "Median time from a frame reaching the sender to the device being told to show it"),
+        ("send_skew_seconds", "gauge", "skew_seconds", "How much later the device shows frames than the first device"),
+    ]
+    for name, kind, key, description in device_metrics:
+        lines.append(f"# HELP wledcast_{name} {description}")
+        lines.append(f"# TYPE wledcast_{name} {kind}")
+        for host, stats in device_stats.items():
+            lines.append(f'wledcast_{name}{{host="{host}"}} {stats[key]}')
+
+    lines += [
+        "# HELP wledcast_target_fps Frame rate the capture is paced at",
+        "# TYPE wledcast_target_fps gauge",
+        f"wledcast_target_fps {target_fps}",
+        "# HELP wledcast_filters_version Version of the filter settings in use",
+        "# TYPE wledcast_filters_version gauge",
+        f"wledcast_filters_version {filters_version}",
+    ]
+    return "\n".join(lines) + "\n"
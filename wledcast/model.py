@@ -1,5 +1,11 @@
+import ctypes
+import threading
+import time
 from dataclasses import dataclass
+from multiprocessing.sharedctypes import RawArray
+from typing import Union
 
+import numpy as np
 from pywinbox import Size
 
 
@@ -18,3 +24,79 @@ class Box:
 
     def getPosition(self):
         return self.getTopLeft()
+
+
+@dataclass
+class Region:
+    # Part of the capture box, as (left, top, width, height) fractions of its size
+    area: tuple[float, float, float, float]
+    # Where it goes in the output frame, as (x, y, width, height) in LEDs
+    output: tuple[int, int, int, int]
+
+
+class SharedBox(Box):
+    # The capture box edited by the UI and read by capture workers in other processes.
+    # Writers publish() a new Box, which sets the fields and the shared record together. Readers
+    # take snapshot()s guarded by a sequence counter (seqlock): it is odd while a write is in
+    # progress and readers retry until they see the same even value before and after reading.
+    def __init__(self, box: Box):
+        super().__init__(box.left, box.top, box.width, box.height)
+        # Window to read the pixels from, for sources that can, 0 for the screen
+        self.window = 0
+        # Set while the followed window is minimized or closed, there is nothing to capture
+        self.hidden = False
+        # [sequence, left, top, width, height, window, hidden]
+        self.shared = RawArray(ctypes.c_int64, 7)
+        self.lock = threading.Lock()
+        self.publish()
+
+    def __getstate__(self):
+        # Only pickled when handed to a new worker process, the RawArray is inherited
+        return {"box": Box(self.left, self.top, self.width, self.height), "shared": self.shared}
+
+    def __setstate__(self, state):
+        box = state["box"]
+        Box.__init__(self, box.left, box.top, box.width, box.height)
+        self.window, self.hidden = 0, False
+        self.shared = state["shared"]
+        self.lock = threading.Lock()
+
+    @property
+    def record(self) -> np.ndarray:
+        return np.frombuffer(self.shared, dtype=np.int64)
+
+    def publish(self, box: Union[Box, None] = None):
+        # Keyboard and mouse handlers and the window tracker run on different threads, so
+        # writers take a lock, and set the geometry under it rather than field by field
+        with self.lock:
+            if box is not None:
+                self.left, self.top, self.width, self.height = (
+                    box.left,
+                    box.top,
+                    box.width,
+                    box.height,
+                )
+            geometry = (self.left, self.top, self.width, self.height, self.window, int(self.hidden))
+            record = self.record
+            if tuple(record[1:]) == geometry and record[0] > 0:
+                return
+            record[0] += 1
+            record[1:] = geometry
+            record[0] += 1
+
+    def snapshot(self) -> tuple[int, Box]:
+        # Returns the sequence number and a consistent copy of the published geometry.
+        # The sequence number only changes when the geometry does, so it can key caches.
+        sequence, box, _, _ = self.target()
+        return sequence, box
+
+    def target(self) -> tuple[int, Box, int, bool]:
+        # Like snapshot(), plus the published window and whether it is hidden
+        record = self.record
+        while True:
+            sequence = int(record[0])
+            if sequence % 2 == 0:
+                left, top, width, height, window, hidden = (int(v) for v in record[1:])
+                if int(record[0]) == sequence:
+                    return sequence, Box(left, top, width, height), window, bool(hidden)
+            time.sleep(0)
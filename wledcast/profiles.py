@@ -0,0 +1,69 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Union
+
+from wledcast.model import Box, Region
+
+logger = logging.getLogger(__name__)
+
+# Profile settings that can change while casting, everything else only applies at startup
+runtime_options = {"host", "title", "title_regex", "app", "monitor", "fps"}
+
+
+@dataclass
+class Profile:
+    name: str
+    # Command line options by their argparse names, eg. {"fps": 40, "capture_backend": "xshm"}
+    options: dict = field(default_factory=dict)
+    box: Union[Box, None] = None
+    filters: Union[dict, None] = None
+
+
+def parse_regions(value: Union[str, list, None]) -> Union[list[Region], None]:
+    # A list of {"area": [left, top, width, height], "output": [x, y, width, height]}, or the
+    # path of a JSON file with one. Areas are fractions of the capture box, outputs in LEDs.
+    if value is None:
+        return None
+    if isinstance(value, str):
+        with open(value, "r") as f:
+            value = json.load(f)
+    regions = []
+    for region in value:
+        area, output = tuple(map(float, region["area"])), tuple(map(int, region["output"]))
+        if len(area) != 4 or len(output) != 4:
+            raise ValueError(f"Regions need 4 values for area and output: {region}")
+        if min(area) < 0 or max(area[0] + area[2], area[1] + area[3]) > 1 + 1e-9:
+            raise ValueError(f"Region area must be within the capture box: {region}")
+        regions.append(Region(area, output))
+    return regions
+
+
+def load_profiles(path: str, option_names: set) -> tuple[Union[str, None], dict[str, Profile]]:
+    # The file looks like
+    # {"default": "tv", "profiles": {"tv": {"host": ["10.0.0.5"], "monitor": 0, "fps": 40,
+    #   "box": [0, 0, 1920, 1080], "filters": {"brightness": 0.5}}}}
+    # Returns the default profile's name and the profiles by name.
+    if not os.path.exists(path):
+        return None, {}
+    with open(path, "r") as f:
+        data = json.load(f)
+    profiles = {}
+    for name, settings in data.get("profiles", {}).items():
+        settings = dict(settings)
+        box = settings.pop("box", None)
+        filters = settings.pop("filters", None)
+        unknown = set(settings) - option_names
+        if unknown:
+            raise ValueError(f"Unknown settings in profile {name}: {', '.join(sorted(unknown))}")
+        if isinstance(settings.get("host"), str):
+            settings["host"] = [settings["host"]]
+        profiles[name] = Profile(
+            name, settings, Box(*box) if box is not None else None, filters
+        )
+    default = data.get("default")
+    if default is not None and default not in profiles:
+        raise ValueError(f"Default profile {default} is not defined")
+    logger.info(f"Loaded {len(profiles)} profiles from {path}")
+    return default, profiles
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import mmap
+import queue
+import struct
+import threading
+import time
+import zlib
+from typing import Iterator, Union
+
+import numpy as np
+
+from wledcast.wled.sender import AsyncSender, DeviceSpec
+
+logger = logging.getLogger(__name__)
+
+# A recording is the file header, then records, each a record header and its payload:
+# frames, with the LED buffer as sent to a device, and device records naming a device id's
+# host the first time it appears. Closing the recording appends an index of the frames, the
+# hosts in device id order, one per line, and a trailer, so readers can open it without
+# scanning. Without the trailer, eg. after a crash, readers rebuild both by scanning the records.
+FILE_MAGIC = b"WLEDREC1"
+TRAILER_MAGIC = b"WLEDIDX2"
+# kind, flags, device id, seconds since the recording started, width, height, payload length
+record_header = struct.Struct("<BBHdHHI")
+trailer = struct.Struct("<QQQ8s")  # index offset, frame count, hosts offset, magic
+index_dtype = np.dtype([("timestamp", "<f8"), ("offset", "<u8"), ("device", "<u2")])
+
+FRAME = 1
+DEVICE = 2
+COMPRESSED = 0x01
+
+
+class FrameRecorder:
+    # Writes frames to a recording from a background thread. Recording a frame only copies it
+    # into a slot of a preallocated ring, the thread compresses and writes it. If the thread
+    # falls behind and every slot is full, frames are dropped instead of holding up the caller.
+    def __init__(self, path: str, compress: bool = False, slots: int = 64):
+        self.path = path
+        self.compress = compress
+        self.file = open(path, "wb")
+        self.file.write(FILE_MAGIC)
+        self.slots = [np.empty(0, dtype=np.uint8) for _ in range(slots)]
+        self.free = queue.SimpleQueue()
+        for slot in range(slots):
+            self.free.put(slot)
+        self.filled = queue.SimpleQueue()
+        self.devices: dict[str, int] = {}
+        self.started = time.monotonic()
+        self.dropped = 0
+        self.index: list[tuple[float, int, int]] = []
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def record(self, host: str, rgb_array: np.ndarray):
+        timestamp = time.monotonic() - self.started
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return
+        data = np.ascontiguousarray(rgb_array).reshape(-1)
+        if self.slots[slot].size < data.size:
+            self.slots[slot] = np.empty(data.size, dtype=np.uint8)
+        self.slots[slot][: data.size] = data
+        height, width = rgb_array.shape[:2]
+        self.filled.put((slot, host, timestamp, width, height, data.size))
+
+    def write_loop(self):
+        while True:
+            item = self.filled.get()
+            if item is None:
+                break
+            slot, host, timestamp, width, height, size = item
+            if host not in self.devices:
+                self.devices[host] = len(self.devices)
+                name = host.encode()
+                header = record_header.pack(DEVICE, 0, self.devices[host], timestamp, 0, 0, len(name))
+                self.file.write(header)
+                self.file.write(name)
+            payload = memoryview(self.slots[slot])[:size]
+            flags = 0
+            if self.compress:
+                payload, flags = zlib.compress(payload, 1), COMPRESSED
+            self.index.append((timestamp, self.file.tell(), self.devices[host]))
+            self.file.write(
+                record_header.pack(
+                    FRAME, flags, self.devices[host], timestamp, width, height, len(payload)
+                )
+            )
+            self.file.write(payload)
+            self.free.put(slot)
+
+    def close(self):
+        self.filled.put(None)
+        self.thread.join()
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=index_dtype).tobytes())
+        hosts_offset = self.file.tell()
+        self.file.write("\n".join(self.devices).encode())
+        self.file.write(trailer.pack(index_offset, len(self.index), hosts_offset, TRAILER_MAGIC))
+        self.file.close()
+        if self.dropped:
+            logger.warning(
+                f"{self.dropped} frames were dropped from {self.path}, the disk didn't keep up"
+            )
+        logger.info(f"Recorded {len(self.index)} frames to {self.path}")
+
+
+class RecordingReader:
+    # Reads a recording through a memory map. Uncompressed frames are returned as views of
+    # the map, so reading them copies and decodes nothing.
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[: len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f"{path} is not a wledcast recording")
+        self.devices: dict[int, str] = {}
+        self.index = self.read_index()
+
+    def read_index(self) -> np.ndarray:
+        end = len(self.map) - trailer.size
+        if end >= len(FILE_MAGIC):
+            index_offset, count, hosts_offset, magic = trailer.unpack_from(self.map, end)
+            if magic == TRAILER_MAGIC:
+                hosts = self.map[hosts_offset:end].decode()
+                self.devices = dict(enumerate(hosts.split("\n"))) if hosts else {}
+                return np.frombuffer(self.map, index_dtype, count, index_offset)
+        logger.warning(f"{self.path} has no index, it wasn't closed properly. Scanning it")
+        return np.array(self.scan(len(self.map)), dtype=index_dtype)
+
+    def scan(self, end: int) -> list[tuple[float, int, int]]:
+        # Reads the device records, and lists the frames, up to end
+        frames = []
+        offset = len(FILE_MAGIC)
+        while offset + record_header.size <= end:
+            kind, _, device, timestamp, _, _, length = record_header.unpack_from(self.map, offset)
+            payload = offset + record_header.size
+            if payload + length > end:
+                break  # cut off mid-record
+            if kind == DEVICE:
+                self.devices[device] = self.map[payload : payload + length].decode()
+            elif kind == FRAME:
+                frames.append((timestamp, offset, device))
+            offset = payload + length
+        return frames
+
+    @property
+    def hosts(self) -> list[str]:
+        return [self.devices[device] for device in sorted(self.devices)]
+
+    @property
+    def duration(self) -> float:
+        return float(self.index["timestamp"][-1]) if len(self.index) else 0.0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def frame(self, i: int) -> tuple[float, str, np.ndarray]:
+        # (seconds since the start, host, frame as sent to the host)
+        offset = int(self.index["offset"][i])
+        _, flags, device, timestamp, width, height, length = record_header.unpack_from(
+            self.map, offset
+        )
+        payload = offset + record_header.size
+        if flags & COMPRESSED:
+            data = np.frombuffer(zlib.decompress(self.map[payload : payload + length]), np.uint8)
+        else:
+            data = np.frombuffer(self.map, np.uint8, length, payload)
+        return timestamp, self.devices[device], data.reshape(height, width, -1)
+
+    def seek(self, timestamp: float) -> int:
+        # Index of the first frame at or after timestamp
+        return int(np.searchsorted(self.index["timestamp"], timestamp))
+
+    def __iter__(self) -> Iterator[tuple[float, str, np.ndarray]]:
+        for i in range(len(self)):
+            yield self.frame(i)
+
+    def close(self):
+        # Frames returned are views of the map, it stays open until they're gone
+        self.index = self.index.copy()
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+
+
+async def replay(
+    reader: RecordingReader,
+    hosts: Union[list[DeviceSpec], None],
+    stop_event,
+    speed: float = 1.0,
+    loop: bool = False,
+) -> AsyncSender:
+    # Sends a recording to devices with its original timing, or speed times as fast, 0 for as
+    # fast as the devices take it. Recorded devices go to the hosts they were recorded from,
+    # or with hosts given, to those in the order the recording first saw them.
+    recorded = reader.hosts
+    if hosts is None:
+        hosts = [DeviceSpec(host) for host in recorded]
+    targets = dict(zip(recorded, range(len(hosts))))
+    # Frames are sent as they were recorded, without resizing
+    sender = AsyncSender(
+        [DeviceSpec(spec.host, protocol=spec.protocol, universe=spec.universe) for spec in hosts]
+    )
+    await sender.open()
+    event_loop = asyncio.get_running_loop()
+    try:
+        while not stop_event.is_set():
+            started = time.perf_counter()
+            for i in range(len(reader)):
+                timestamp, host, frame = reader.frame(i)
+                if host not in targets:
+                    continue
+                if speed > 0:
+                    delay = started + timestamp / speed - time.perf_counter()
+                    if delay > 0:
+                        # asyncio.sleep is only accurate to ~15ms
+                        await event_loop.run_in_executor(None, time.sleep, delay)
+                else:
+                    await asyncio.sleep(0)
+                if stop_event.is_set():
+                    break
+                sender.devices[targets[host]].submit(frame)
+            if not loop:
+                break
+        # Let the last frames go out
+        await asyncio.sleep(0.1)
+    finally:
+        await sender.close()
+    return sender
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from argparse import Namespace
+from typing import Union
+
+from wledcast import config
+from wledcast.capture import capture_screen
+from wledcast.capture.window_tracker import WindowTracker
+from wledcast.model import Box, SharedBox, Size
+from wledcast.profiles import Profile, runtime_options
+from wledcast.ui.gui import TransparentWindow
+from wledcast.wled import caster
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileSwitcher:
+    # Switches a running cast between profiles. Only what can change in place is switched:
+    # the capture box, filters, fps and target devices. Workers, the capture source and open
+    # sockets are kept, so a switch takes effect from the next frame.
+    def __init__(
+        self,
+        profiles: dict[str, Profile],
+        active: Union[str, None],
+        capture_box: SharedBox,
+        led_matrix_shape: Size,
+        conf_args: Namespace,
+        window: TransparentWindow,
+        tracker: Union[WindowTracker, None] = None,
+    ):
+        self.profiles = profiles
+        self.active = active
+        self.capture_box = capture_box
+        self.led_matrix_shape = led_matrix_shape
+        self.conf_args = conf_args
+        self.window = window
+        self.tracker = tracker
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.profiles)
+
+    def set_box(self, box: Box):
+        self.capture_box.publish(box)
+        self.window.RequestGeometryUpdate()
+
+    def set_fps(self, fps: float):
+        # Devices without their own frame rate follow it, the capture loops read the rate to
+        # capture at every frame
+        self.conf_args.fps = caster.set_fps(fps)
+
+    async def switch(self, name: str):
+        profile = self.profiles[name]
+        options = profile.options
+        startup_only = set(options) - runtime_options
+        if startup_only:
+            logger.info(
+                f"Profile {name}: {', '.join(sorted(startup_only))} only apply at startup"
+            )
+
+        box, window = profile.box, None
+        if box is None and set(options) & {"monitor", "title", "title_regex", "app"}:
+            window = await asyncio.get_running_loop().run_in_executor(
+                None,
+                capture_screen.find_window,
+                options.get("monitor"),
+                options.get("title"),
+                options.get("title_regex"),
+                options.get("app"),
+            )
+            if window is None:
+                logger.warning(f"Profile {name}: nothing to capture matches {options}")
+            else:
+                box = capture_screen.get_capture_box(
+                    window, capture_screen.target_resolution(self.led_matrix_shape)
+                )
+        if box is not None and self.conf_args.source == "screen":
+            self.set_box(box)
+            if self.tracker is not None:
+                # Follow the profile's window, a box given as such stays where it is
+                self.tracker.follow(window if capture_screen.followable(window) else None)
+
+        if profile.filters is not None:
+            config.filters.update(profile.filters)
+        if "fps" in options:
+            self.set_fps(options["fps"])
+        if "host" in options:
+            await caster.set_hosts(options["host"])
+        self.active = name
+        logger.info(f"Switched to profile {name}")
@@ -1,15 +1,16 @@
 import logging
+import threading
 
 import wx
 
 from wledcast.config import border_size, max_x, max_y
-from wledcast.model import Box
+from wledcast.model import Box, SharedBox
 
 logger = logging.getLogger(__name__)
 
 
 class TransparentWindow(wx.Frame):
-    def __init__(self, parent, title, capture_box: Box):
+    def __init__(self, parent, title, capture_box: SharedBox):
         self.capture_box = capture_box
         self.capture_box.left = capture_box.left + border_size // 2
         self.capture_box.top = capture_box.top + border_size // 2
@@ -26,6 +27,7 @@ class TransparentWindow(wx.Frame):
         adjusted_height = int(capture_box.height * adjustment_factor)
         self.capture_box.width = adjusted_width
         self.capture_box.height = adjusted_height
+        self.capture_box.publish()
         pos = (capture_box.left - border_size, capture_box.top - border_size)
         size = (
             capture_box.width + 2 * border_size,
@@ -43,7 +45,8 @@ class TransparentWindow(wx.Frame):
         self.SetBackgroundStyle(wx.BG_STYLE_PAINT)  # Needed for shaped windows
         self.Bind(wx.EVT_PAINT, self.OnPaint)
         self.Bind(wx.EVT_SIZE, self.OnSize)  # Resize event
-        self.CreateShapeBitmap(size)
+        self.shape_size = None
+        self.SetShapeForSize(size)
         self.Bind(wx.EVT_LEFT_DOWN, self.OnMouseDown)
         self.Bind(wx.EVT_LEFT_UP, self.OnMouseUp)
         self.Bind(wx.EVT_RIGHT_DOWN, self.OnRightMouseDown)
@@ -56,6 +59,13 @@ class TransparentWindow(wx.Frame):
         self.resizing = False
         self.dragStartPos = None
 
+        # Geometry changes from the keyboard thread and mouse events are coalesced into
+        # at most one window update per display refresh
+        self.update_lock = threading.Lock()
+        self.update_pending = False
+        mode = wx.Display(max(0, wx.Display.GetFromWindow(self))).GetCurrentMode()
+        self.update_interval_ms = max(1, 1000 // (mode.refresh or 60))
+
     def OnMouseDown(self, event):
         try:
             self.CaptureMouse()
@@ -107,28 +117,28 @@ class TransparentWindow(wx.Frame):
             self.resizing = False
 
     def OnMouseMove(self, event):
+        # The window only catches up with the capture box on the next geometry update, so
+        # the new geometry is worked out from the box, window size being the box and border
+        box = self.capture_box
+        size = (box.width + 2 * border_size, box.height + 2 * border_size)
         if self.dragging:
             x, y = self.ClientToScreen(event.GetPosition())
             newpos = (
-                max(0, min(max_x - self.GetSize().width, x - self.dragStartPos.x)),
-                max(0, min(max_y - self.GetSize().height, y - self.dragStartPos.y)),
+                max(0, min(max_x - size[0], x - self.dragStartPos.x)),
+                max(0, min(max_y - size[1], y - self.dragStartPos.y)),
+            )
+            box.publish(
+                Box(newpos[0] + border_size, newpos[1] + border_size, box.width, box.height)
             )
-            self.capture_box.left = newpos[0] + border_size
-            self.capture_box.top = newpos[1] + border_size
-            self.Move(newpos)
+            self.RequestGeometryUpdate()
         elif self.resizing:
             x, y = self.ClientToScreen(event.GetPosition())
-            newsize = (
-                int(
-                    self.GetSize()[0]
-                    / self.GetSize()[1]
-                    * max(1, y - self.GetPosition().y)
-                ),
-                max(1, y - self.GetPosition().y),
+            height = max(1, y - (box.top - border_size))
+            newsize = (int(size[0] / size[1] * height), height)
+            box.publish(
+                Box(box.left, box.top, newsize[0] - 2 * border_size, newsize[1] - 2 * border_size)
             )
-            self.capture_box.width = newsize[0] - 2 * border_size
-            self.capture_box.height = newsize[1] - 2 * border_size
-            self.SetSize(newsize)
+            self.RequestGeometryUpdate()
 
     def OnMouseLeave(self, event):
         self.SetCursor(wx.Cursor(wx.CURSOR_ARROW))
@@ -136,37 +146,48 @@ class TransparentWindow(wx.Frame):
     def OnMouseEnter(self, event):
         self.SetCursor(wx.Cursor(wx.CURSOR_SIZENWSE))
 
-    def CreateShapeBitmap(self, size):
-        # Create a bitmap where the border is opaque and the center is transparent
-        bitmap = wx.Bitmap(size[0], size[1], 32)
-        dc = wx.MemoryDC(bitmap)
-        dc.SetBackground(
-            wx.Brush(wx.Colour(255, 0, 0, 1), wx.BRUSHSTYLE_TRANSPARENT)
-        )  # Fully transparent brush
-        dc.Clear()
-        dc.SetPen(
-            wx.Pen(wx.Colour(255, 0, 0, 1), border_size, wx.PENSTYLE_SOLID)
-        )  # Red pen for the border
-        dc.SetBrush(
-            wx.Brush(wx.Colour(255, 0, 0, 1), wx.BRUSHSTYLE_TRANSPARENT)
-        )  # Fully transparent brush
-        dc.DrawRectangle(0, 0, size[0], size[1])
-        del dc  # Need to delete the DC before setting shape
-        self.SetShape(wx.Region(bitmap, wx.Colour(0, 0, 0, 0)))
+    def RequestGeometryUpdate(self):
+        # Safe to call from any thread, repeated calls before the update runs are merged
+        with self.update_lock:
+            if self.update_pending:
+                return
+            self.update_pending = True
+        wx.CallAfter(wx.CallLater, self.update_interval_ms, self.ApplyGeometry)
+
+    def ApplyGeometry(self):
+        with self.update_lock:
+            self.update_pending = False
+        box = self.capture_box
+        # Move and resize in one call, the shape follows in OnSize
+        self.SetSize(
+            box.left - border_size,
+            box.top - border_size,
+            box.width + 2 * border_size,
+            box.height + 2 * border_size,
+        )
+
+    def SetShapeForSize(self, size):
+        # The window is only the border: a region made of its four edges, which is much
+        # cheaper to build than a full size bitmap mask. Same band the border pen used to draw.
+        width, height = size
+        if (width, height) == self.shape_size:
+            return
+        band = (border_size + 1) // 2
+        region = wx.Region(0, 0, width, band)
+        region.Union(0, height - band, width, band)
+        region.Union(0, 0, band, height)
+        region.Union(width - band, 0, band, height)
+        self.SetShape(region)
+        self.shape_size = (width, height)
 
     def OnPaint(self, event):
-        # Custom drawing for the border
+        # Everything outside the shape is clipped, so filling the window draws the border
         dc = wx.PaintDC(self)
-        width, height = self.GetClientSize()
-        dc.SetBrush(wx.TRANSPARENT_BRUSH)  # Transparent brush for the interior
-        pen = wx.Pen(wx.Colour(255, 0, 0, 1), border_size)
-        dc.SetPen(pen)  # Red pen for the border
-        dc.DrawRectangle(0, 0, width, height)
-        pen.Destroy()
+        dc.SetBackground(wx.Brush(wx.Colour(255, 0, 0)))
+        dc.Clear()
 
     def OnSize(self, event):
-        # Recreate the shape bitmap when the window is resized
-        self.CreateShapeBitmap(event.GetSize())
+        self.SetShapeForSize(event.GetSize())
         event.Skip()
 
     def Destroy(self):
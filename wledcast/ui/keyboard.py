@@ -7,13 +7,14 @@ from wxasync import WxAsyncApp
 from pynput import keyboard
 
 from wledcast.config import border_size, max_x, max_y, min_desktop_x, min_desktop_y
-from wledcast.model import Box
+from wledcast.model import Box, SharedBox
+from wledcast.ui.gui import TransparentWindow
 
 logger = logging.getLogger(__name__)
 
 
 def setup_keybinds(
-    app: WxAsyncApp, frame: wx.Frame, capture_box: Box, stop_event: Event
+    app: WxAsyncApp, frame: TransparentWindow, capture_box: SharedBox, stop_event: Event
 ) -> callable:
     logger.info("Setting up keybinds")
     aspect_ratio = frame.GetSize().GetWidth() / frame.GetSize().GetHeight()
@@ -40,14 +41,17 @@ def setup_keybinds(
                 delta_y,
             ),
         )
-        capture_box.left += delta_x
-        capture_box.top += delta_y
-        logger.info(f"Capture area: {capture_box}")
-        # wx.CallAfter(frame.capturing.SetPosition, (capture_box.left, capture_box.top))
-        wx.CallAfter(
-            frame.SetPosition,
-            (capture_box.left - border_size, capture_box.top - border_size),
+        capture_box.publish(
+            Box(
+                capture_box.left + delta_x,
+                capture_box.top + delta_y,
+                capture_box.width,
+                capture_box.height,
+            )
         )
+        logger.debug(f"Capture area: {capture_box}")
+        # Key repeats are merged into one window move per display refresh
+        frame.RequestGeometryUpdate()
 
     def adjust_size(step: int):
         delta_w = (
@@ -67,19 +71,16 @@ def setup_keybinds(
         h_w_bounded_scale = min(delta_h_bounded / delta_h, delta_w_bounded / delta_w)
         delta_w_final = math.floor(h_w_bounded_scale * delta_w)
         delta_h_final = math.floor(h_w_bounded_scale * delta_h)
-        logger.info(f"delta_w_total: {delta_w_final}, delta_h_total: {delta_h_final}")
-        logger.info(f"capture_box_before: {capture_box}")
-        capture_box.width += delta_w_final
-        capture_box.height += delta_h_final
-        logger.info(f"capture_box_after: {capture_box}")
-        wx.CallAfter(
-            frame.SetSize,
-            (capture_box.width + border_size * 2, capture_box.height + border_size * 2),
-        )
-        # wx.CallAfter(frame.capturing.SetSize, (capture_box.width, capture_box.height))
-        logger.info(
-            f"new frame size: {(capture_box.width+border_size, capture_box.height+border_size)}"
+        capture_box.publish(
+            Box(
+                capture_box.left,
+                capture_box.top,
+                capture_box.width + delta_w_final,
+                capture_box.height + delta_h_final,
+            )
         )
+        logger.debug(f"Capture area resized by {delta_w_final}x{delta_h_final}: {capture_box}")
+        frame.RequestGeometryUpdate()
 
     def perform_action(action_type, key):
         # Determine the action based on the key and whether it's a move or resize action
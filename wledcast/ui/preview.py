@@ -0,0 +1,77 @@
+import logging
+from typing import Callable, Union
+
+import cv2
+import numpy as np
+import wx
+
+logger = logging.getLogger(__name__)
+
+
+class PreviewWindow(wx.Frame):
+    # Shows what was last sent to the LEDs, scaled up by an integer factor to keep the pixelated
+    # look. It polls the sender on its own timer, so the preview never costs the frame path
+    # anything, and hiding it stops the timer.
+    def __init__(
+        self, parent, latest_frame: Callable[[], Union[np.ndarray, None]], fps: int = 15
+    ):
+        super().__init__(parent, title="Live View")
+        self.latest_frame = latest_frame
+        self.fps = fps
+        self.last_frame = None
+        self.frame_shape = None
+        self.buffer = None
+        self.bitmap = None
+        self.timer = wx.Timer(self)
+        self.SetBackgroundStyle(wx.BG_STYLE_PAINT)
+        self.Bind(wx.EVT_TIMER, self.OnTimer, self.timer)
+        self.Bind(wx.EVT_PAINT, self.OnPaint)
+        self.Bind(wx.EVT_CLOSE, self.OnClose)
+
+    def Toggle(self):
+        if self.IsShown():
+            self.timer.Stop()
+            self.Hide()
+        else:
+            self.Show()
+            self.timer.Start(1000 // self.fps)
+
+    def OnClose(self, event):
+        # Closing the window only hides it, it can be toggled back on
+        if event.CanVeto():
+            event.Veto()
+            self.Toggle()
+        else:
+            self.timer.Stop()
+            event.Skip()
+
+    def OnTimer(self, event):
+        frame = self.latest_frame()
+        if frame is None or frame is self.last_frame:
+            return
+        self.last_frame = frame
+        if frame.shape[:2] != self.frame_shape:
+            self.Resize(frame.shape[1], frame.shape[0])
+        cv2.resize(
+            frame,
+            (self.buffer.shape[1], self.buffer.shape[0]),
+            dst=self.buffer,
+            interpolation=cv2.INTER_NEAREST,
+        )
+        self.bitmap.CopyFromBuffer(self.buffer)
+        self.Refresh(eraseBackground=False)
+
+    def Resize(self, width: int, height: int):
+        # Largest integer scaling factor that fits on the display in both dimensions
+        display_width, display_height = wx.GetDisplaySize()
+        scale = max(1, min(display_width // width, display_height // height))
+        size = (width * scale, height * scale)
+        self.buffer = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        self.bitmap = wx.Bitmap(size[0], size[1], 24)
+        self.frame_shape = (height, width)
+        self.SetClientSize(size)
+
+    def OnPaint(self, event):
+        dc = wx.PaintDC(self)
+        if self.bitmap is not None:
+            dc.DrawBitmap(self.bitmap, 0, 0)
@@ -2,6 +2,7 @@ import asyncio
 import logging
 from collections import deque
 from multiprocessing import Event
+from typing import Callable
 
 import wx
 from asciimatics.event import KeyboardEvent
@@ -12,6 +13,7 @@ from wxasync import StartCoroutine
 
 from wledcast import config
 from wledcast.model import Box
+from wledcast.switcher import ProfileSwitcher
 
 logger = logging.getLogger(__name__)
 
@@ -19,22 +21,46 @@ logger = logging.getLogger(__name__)
 async def config_editor_async(
     screen,
     frame_times: deque,
+    device_stats: Callable[[], dict],
     capture_box: Box,
     stop_event: Event,
+    toggle_preview: Callable[[], None],
+    switcher: ProfileSwitcher,
 ):
     logger.info("Starting config editor UI")
+    # F1-F9 switch to the profiles in the order they are in the file
+    profile_keys = {
+        getattr(Screen, f"KEY_F{i + 1}"): name
+        for i, name in enumerate(switcher.names[:9])
+    }
+
+    def profiles_text() -> str:
+        return f"Profile: {switcher.active or '-'}  " + " ".join(
+            f"F{i + 1} {name}" for i, name in enumerate(profile_keys.values())
+        )
+
+    shown_version = None
 
     def update_form():
         # Update form values from config
-        for key, value in config.filters.items():
-            form_data[key].value = str(value)
+        nonlocal shown_version
+        shown_version, filters = config.filters.snapshot()
+        for key, value in filters.items():
+            # Filters that are off are shown empty
+            form_data[key].value = "" if value is None else str(value)
 
     def save_config():
         # Define an async function to save the config
         async def async_save():
+            nonlocal shown_version
             try:
-                for key, value in config.filters.items():
-                    config.filters[key] = float(form_data[key].value)
+                config.filters.update(
+                    {
+                        key: float(field.value) if field.value.strip() else None
+                        for key, field in form_data.items()
+                    }
+                )
+                shown_version = config.filters.version
                 await config.save_filter_config()
             except ValueError as exc:
                 pass
@@ -45,7 +71,7 @@ async def config_editor_async(
     logger.info(f"Creating frame, {screen.height}x{screen.width}")
     frame = Frame(
         screen,
-        min(int(screen.height), 15),
+        min(int(screen.height), 20),
         min(int(screen.width), 80),
         title="Edit Configuration",
     )
@@ -67,15 +93,20 @@ async def config_editor_async(
         f"Casting {capture_box.width}x{capture_box.height} ({capture_box.left}, {capture_box.top}) to ({capture_box.left + capture_box.width}, {capture_box.top + capture_box.height}) at ~~~fps"
     )
     layout.add_widget(fps_label)
+    devices_label = Label("")
+    layout.add_widget(devices_label)
+    profiles_label = Label(profiles_text())
+    layout.add_widget(profiles_label)
 
     # Create form fields
     form_data = {
-        k: Text(k.replace("_", " ").title() + ":", k) for k in config.filters.keys()
+        k: Text(k.replace("_", " ").title() + ":", k) for k in config.filters.names
     }
 
     for name, field in form_data.items():
         layout.add_widget(field)
     layout.add_widget(Button("Save", save_config))
+    layout.add_widget(Button("Toggle preview", toggle_preview))
     logger.info("Updating form")
     frame.fix()
     update_form()
@@ -87,21 +118,45 @@ async def config_editor_async(
     screen.open()
     # Start the event loop
     while not stop_event.is_set():
+        if config.filters.version != shown_version:
+            # The filter file was changed from outside
+            update_form()
         if len(frame_times) >= 10:
             fps_label.text = f"Casting {capture_box.width}x{capture_box.height} ({capture_box.left}, {capture_box.top}) to ({capture_box.left + capture_box.width}, {capture_box.top + capture_box.height}) at {round((len(frame_times)-1) / (frame_times[len(frame_times) - 1] - frame_times[0]), 1) if len(frame_times) > 0 else '~~'}fps.)"
+        devices_label.text = ", ".join(
+            f"{host}: {stats['fps']}fps, {stats['dropped']} dropped, {stats['errors']} errors"
+            for host, stats in device_stats().items()
+        )
         screen.draw_next_frame(repeat=False)
         event = screen.get_event()
-        if isinstance(event, KeyboardEvent):
+        if isinstance(event, KeyboardEvent) and event.key_code in profile_keys:
+            await switcher.switch(profile_keys[event.key_code])
+            profiles_label.text = profiles_text()
+        elif isinstance(event, KeyboardEvent):
             frame.process_event(event)
         await asyncio.sleep(0.05)
 
 
 def start_async(
-    frame_times: deque, capture_box: Box, stop_event: Event, window: wx.Frame
+    frame_times: deque,
+    device_stats: Callable[[], dict],
+    capture_box: Box,
+    stop_event: Event,
+    window: wx.Frame,
+    toggle_preview: Callable[[], None],
+    switcher: ProfileSwitcher,
 ):
     logger.info("Starting terminal UI")
 
     async def run(screen: Screen):
-        await config_editor_async(screen, frame_times, capture_box, stop_event)
+        await config_editor_async(
+            screen,
+            frame_times,
+            device_stats,
+            capture_box,
+            stop_event,
+            toggle_preview,
+            switcher,
+        )
 
     return StartCoroutine(Screen.wrapper(run), window)
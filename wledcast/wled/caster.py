@@ -4,70 +4,327 @@ import time
 from argparse import Namespace
 from collections import deque
 from multiprocessing import Event, Pool
+from typing import Callable, Union
 
+import numpy as np
 from wx import Frame
 from wxasync import StartCoroutine
 
 from wledcast import config
-from wledcast.capture import capture_screen, image_processor
-from wledcast.model import Box, Size
-from wledcast.wled.pixel_writer import PixelWriter
+from wledcast.capture import capture_screen, capture_xshm, image_processor
+from wledcast.capture import filters as filter_stages
+from wledcast.capture.ambilight import EdgeLayout, EdgeSampler
+from wledcast.capture.change_detector import ChangeDetector
+from wledcast.filter_config import FilterConfig
+from wledcast.metrics import StageTimes
+from wledcast.model import Region, SharedBox, Size
+from wledcast.recording import FrameRecorder
+from wledcast.wled import discovery, pipeline
+from wledcast.wled.health import HealthMonitor
+from wledcast.wled.rate_controller import RateController
+from wledcast.wled.sender import AsyncSender, DeviceSpec
 
 logger = logging.getLogger(__name__)
 
 # Initialize the pixel writer
 frame_times = deque(maxlen=20)
+stage_times = StageTimes()
+
+# Pool workers are long lived, so each keeps its own detector between frames
+change_detector = None
+# Each worker process is handed the shared capture box, filters and regions once, when it starts
+shared_box = None
+shared_filters = None
+regions = None
+edge_sampler = None
+# The sender of the running cast, lives in the main process
+sender = None
+# Set while casting with --adaptive-fps
+rate_controller = None
 
 async def async_sleep(duration):
     await asyncio.get_running_loop().run_in_executor(None, time.sleep, duration)
 
 
+def init_worker(
+    capture_box: SharedBox,
+    filters: FilterConfig,
+    capture_regions: list[Region] = None,
+    edge_layout: EdgeLayout = None,
+    levels: filter_stages.SharedLevels = None,
+):
+    global shared_box, shared_filters, regions, edge_sampler
+    shared_box = capture_box
+    if levels is not None:
+        # Auto levels move together across the workers
+        filter_stages.shared_levels = levels
+    shared_filters = filters
+    regions = capture_regions
+    # Each worker precomputes the zone weights for the capture size it sees
+    edge_sampler = EdgeSampler(edge_layout) if edge_layout is not None else None
+
+
 def cast(
-    writer: PixelWriter,
-    capture_box: Box,
     led_matrix_shape: Size,
-    live_preview: bool,
-    filters: dict,
+    keepalive: float = None,
+    capture_backend: str = "mss",
+    frame: np.ndarray = None,
+    pixel_format: str = "RGB",
+    started: float = None,
 ):
-    # Capture the selected screen
-    rgb_array = capture_screen.capture(capture_box)
+    global change_detector
+    started = started or time.time()
+    # Capture the selected screen, unless the frame was read from a stream source
+    if frame is None:
+        source = capture_screen.get_source(capture_backend)
+        capture_box, moved = capture_screen.sync_geometry(source, shared_box)
+        if moved and change_detector is not None:
+            # A moved or resized box always gets a fresh frame
+            change_detector.reset()
+        if capture_box is None:
+            # The followed window is hidden, devices keep showing the last frame
+            return
+        frame = capture_screen.capture(capture_box, source)
+        pixel_format = source.pixel_format
+    captured = time.time()
+    rgb_array = frame
     if rgb_array is None:
         logger.info("**Dropped frame**".ljust(40))
         return
+    # Skip the rest of the pipeline if nothing changed since the last frame
+    if keepalive is not None:
+        if change_detector is None:
+            change_detector = ChangeDetector(keepalive)
+        if not change_detector.has_changed(rgb_array):
+            return
     # Process the image
-    rgb_array = image_processor.process_raw_image(rgb_array, led_matrix_shape, filters)
-    if live_preview:
-        image_processor.show_preview(rgb_array, led_matrix_shape)
-    # Update the LED matrix via WLED in real-time
-    writer.update_pixels(rgb_array)
+    rgb_array = image_processor.process_raw_image(
+        rgb_array,
+        led_matrix_shape,
+        shared_filters.current(),
+        pixel_format,
+        regions,
+        edge_sampler,
+    )
+    # The frame goes back to the main process, which sends it to WLED
+    return (started, captured, time.time()), rgb_array
 
-    return time.time()
 
+def record_frame(timing):
+    if timing is not None:
+        frame_times.append(timing[1])
 
-def start_async(
-    host: str,
-    capture_box: Box,
+
+def device_stats() -> dict[str, dict]:
+    return sender.stats() if sender is not None else {}
+
+
+async def set_hosts(hosts: list[DeviceSpec]):
+    if sender is not None:
+        await sender.set_hosts(hosts)
+
+
+def set_fps(fps: float) -> float:
+    # The frame rate of devices without their own, returns the rate to capture at
+    return sender.set_fps(fps) if sender is not None else fps
+
+
+def adaptive_state() -> Union[dict, None]:
+    return rate_controller.state() if rate_controller is not None else None
+
+
+def latest_sent_frame() -> Union[np.ndarray, None]:
+    return sender.latest_frame() if sender is not None else None
+
+
+async def run(
+    hosts: list[DeviceSpec],
+    capture_box: SharedBox,
     led_matrix_shape: Size,
     conf_args: Namespace,
     stop_event: Event,
-    window: Frame,
+    on_frame: Callable = record_frame,
+    resolve_resolution: Callable[[str], tuple[int, int]] = None,
+):
+    # on_frame is called with (start, done) timestamps for every frame handed to the sender.
+    # resolve_resolution is for hosts that a profile switch adds, see AsyncSender.
+    global sender, rate_controller
+    recorder = (
+        FrameRecorder(conf_args.record, conf_args.record_compress)
+        if conf_args.record is not None
+        else None
+    )
+    sender = AsyncSender(
+        hosts,
+        conf_args.sync,
+        conf_args.sync_address,
+        conf_args.sync_delay / 1000,
+        recorder,
+        conf_args.fps,
+        resolve_resolution,
+    )
+    # --fps is for devices without their own, capture at the highest rate any device needs
+    conf_args.fps = sender.capture_fps()
+    await sender.open()
+    monitor = HealthMonitor(
+        sender, discovery.get_info, conf_args.health_interval, conf_args.keepalive
+    )
+    monitor_task = asyncio.create_task(monitor.run(stop_event))
+    controller_task = None
+    if conf_args.adaptive_fps:
+        rate_controller = RateController(
+            sender, stage_times, conf_args, monitor.info
+        )
+        controller_task = asyncio.create_task(rate_controller.run(stop_event))
+    try:
+        if conf_args.executor == "thread":
+            await run_threaded(
+                sender, capture_box, led_matrix_shape, conf_args, stop_event, on_frame
+            )
+        else:
+            await run_process_pool(
+                sender, capture_box, led_matrix_shape, conf_args, stop_event, on_frame
+            )
+    finally:
+        monitor_task.cancel()
+        if controller_task is not None:
+            controller_task.cancel()
+        await sender.close()
+        if recorder is not None:
+            recorder.close()
+
+
+async def run_threaded(
+    sender: AsyncSender,
+    capture_box: SharedBox,
+    led_matrix_shape: Size,
+    conf_args: Namespace,
+    stop_event: Event,
+    on_frame: Callable,
+):
+    threaded = pipeline.ThreadedPipeline(
+        sender,
+        capture_box,
+        led_matrix_shape,
+        conf_args,
+        stop_event,
+        on_frame,
+        stage_times,
+    )
+    threaded.start()
+    while not stop_event.is_set() and threaded.is_alive():
+        await asyncio.sleep(0.1)
+    stop_event.set()
+    await asyncio.get_running_loop().run_in_executor(None, threaded.join)
+
+
+async def run_process_pool(
+    sender: AsyncSender,
+    capture_box: SharedBox,
+    led_matrix_shape: Size,
+    conf_args: Namespace,
+    stop_event: Event,
+    on_frame: Callable,
 ):
-    writer = PixelWriter(host)
-
-    async def loop():
-        with Pool(conf_args.workers) as pool:
-            while not stop_event.is_set():
-                pool.apply_async(
-                    cast,
-                    args=(
-                        writer,
-                        capture_box,
-                        led_matrix_shape,
-                        conf_args.live_preview,
-                        config.filters,
-                    ),
-                    callback=lambda x: frame_times.append(x) if x is not None else None,
+    def on_result(result):
+        # Runs on the pool's result thread
+        if result is None:
+            return
+        (started, captured, processed), rgb_array = result
+        sender.submit_threadsafe(rgb_array)
+        submitted = time.time()
+        stage_times.record(started, captured, processed, submitted)
+        on_frame((started, submitted))
+
+    worker_errors = {"count": 0, "logged": 0.0}
+
+    def on_error(e: BaseException):
+        # Also on the result thread. A failing worker fails every frame, log it every few
+        # seconds instead of at the frame rate.
+        worker_errors["count"] += 1
+        if time.monotonic() - worker_errors["logged"] > 5:
+            logger.error(f"Frame failed in a capture worker ({worker_errors['count']} so far): {e!r}")
+            worker_errors["logged"] = time.monotonic()
+
+    source = capture_screen.open_stream_source(conf_args, led_matrix_shape)
+    # With xshm, frames are only dispatched once the capture area has been redrawn. The
+    # screen's damage doesn't cover a window hidden under others, so not with --capture-window.
+    watcher = (
+        capture_xshm.DamageWatcher()
+        if conf_args.capture_backend == "xshm"
+        and source is None
+        and not conf_args.capture_window
+        else None
+    )
+    # The capture box, filters and output layout go to each worker once at startup instead of
+    # with every frame
+    with Pool(
+        conf_args.workers,
+        init_worker,
+        (
+            capture_box,
+            config.filters,
+            config.regions,
+            config.edge_layout,
+            filter_stages.cast_levels(),
+        ),
+    ) as pool:
+        while not stop_event.is_set():
+            if watcher is not None:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, watcher.wait, capture_box.snapshot()[1], conf_args.keepalive
+                )
+            frame, pixel_format, started = None, None, time.time()
+            if source is not None:
+                # Stream sources are read here, in order, and the frame handed to a worker
+                frame = await asyncio.get_running_loop().run_in_executor(
+                    None, source.grab, None
                 )
-                await async_sleep(1 / conf_args.fps) # asyncio.sleep is only accurate to ~15ms!
+                if frame is None:
+                    break
+                pixel_format = source.pixel_format
+                if source.reuses_buffer:
+                    # apply_async pickles its arguments later, on another thread
+                    frame = frame.copy()
+            pool.apply_async(
+                cast,
+                args=(
+                    led_matrix_shape,
+                    conf_args.keepalive if conf_args.skip_static else None,
+                    conf_args.capture_backend,
+                    frame,
+                    pixel_format,
+                    started,
+                ),
+                callback=on_result,
+                error_callback=on_error,
+            )
+            # Time spent reading a stream source counts towards the frame interval
+            delay = 1 / conf_args.fps - (time.time() - started)
+            await async_sleep(max(0, delay)) # asyncio.sleep is only accurate to ~15ms!
+    if watcher is not None:
+        watcher.close()
+    if source is not None:
+        source.close()
 
-    return StartCoroutine(loop(), window)
+
+def start_async(
+    hosts: list[DeviceSpec],
+    capture_box: SharedBox,
+    led_matrix_shape: Size,
+    conf_args: Namespace,
+    stop_event: Event,
+    window: Frame,
+    resolve_resolution: Callable[[str], tuple[int, int]] = None,
+):
+    return StartCoroutine(
+        run(
+            hosts,
+            capture_box,
+            led_matrix_shape,
+            conf_args,
+            stop_event,
+            resolve_resolution=resolve_resolution,
+        ),
+        window,
+    )
@@ -1,3 +1,4 @@
+import logging
 import socket
 import time
 from typing import Union
@@ -7,6 +8,8 @@ from zeroconf import ServiceBrowser, ServiceInfo, ServiceStateChange, Zeroconf
 
 from wledcast.model import Size
 
+logger = logging.getLogger(__name__)
+
 
 def discover(timeout: int = 3) -> list[str]:
     # Discover WLED instances on the local network
@@ -72,6 +75,16 @@ def select_instance(instances: list[str]) -> Union[str, None]:
     return instances[selected_index]
 
 
+def get_info(host: str, timeout: float = 1.0) -> Union[dict, None]:
+    # WLED's /json/info, or None if the device doesn't answer. Used while casting, so never exits
+    try:
+        response = requests.get(f"http://{host}:80/json/info", timeout=timeout)
+        return response.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        logger.info(f"Could not get info from {host}: {e}")
+        return None
+
+
 def get_matrix_shape(host) -> Size:
     # Determine the shape of the LED pixel matrix from WLED
     try:
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Union
+
+from wledcast.wled.sender import AsyncSender, Device
+
+logger = logging.getLogger(__name__)
+
+# Protocols whose devices are WLED and can be probed over HTTP, others only by socket errors
+wled_protocols = {"ddp", "drgb", "dnrgb"}
+
+
+class DeviceHealth:
+    # Consecutive failed checks before a device is paused
+    failures_to_pause = 2
+
+    def __init__(self):
+        # Whether the device ever answered /json/info. Those that did are judged by the
+        # probe, the rest by socket errors since the last check, eg. ICMP host unreachable.
+        self.answered = False
+        self.errors_seen = 0
+        self.failures = 0
+        # Just resumed: checked again soon, and paused again on the first failure
+        self.probation = False
+        self.next_check = 0.0
+
+    def check(self, device: Device, info: Union[dict, None]) -> bool:
+        # Returns whether the device counts as reachable after this check
+        errors, self.errors_seen = device.stats.errors - self.errors_seen, device.stats.errors
+        if info is not None:
+            self.answered = True
+        healthy = info is not None if self.answered else errors == 0
+        self.failures = 0 if healthy else self.failures + 1
+        if device.paused:
+            # A paused device sends nothing, so a check without new errors is a success. The
+            # frame sent on resuming shows whether the device is really back.
+            self.probation = healthy
+            return healthy
+        if self.probation:
+            self.probation = False
+            return healthy
+        return self.failures < self.failures_to_pause
+
+
+class HealthMonitor:
+    # Watches each device on a slow timer and stops sending to the ones that can't be reached,
+    # which saves the processing and airtime of frames nobody receives. Unreachable devices
+    # are checked more often so they get frames again soon after they come back, starting
+    # with the last frame. It also resends the last frame to devices that were sent nothing
+    # for keepalive seconds, so WLED stays in realtime mode while the picture is static.
+    # The last /json/info of each device is kept for others to read, see info().
+    def __init__(
+        self,
+        sender: AsyncSender,
+        fetch_info: Union[Callable[[str], Union[dict, None]], None],
+        interval: float = 10.0,
+        keepalive: float = 1.0,
+        retry_interval: float = 2.0,
+        tick: float = 0.25,
+    ):
+        self.sender = sender
+        self.fetch_info = fetch_info
+        self.interval = interval
+        self.keepalive = keepalive
+        self.retry_interval = retry_interval
+        self.tick = tick
+        self.health: dict[str, DeviceHealth] = {}
+        self.infos: dict[str, dict] = {}
+
+    async def run(self, stop_event):
+        while not stop_event.is_set():
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            for device in self.sender.devices:
+                if not device.paused and now - device.last_send_time > self.keepalive:
+                    device.keepalive()
+            if self.interval > 0:
+                due = [
+                    device
+                    for device in self.sender.devices
+                    if now >= self.device_health(device).next_check
+                ]
+                if due:
+                    await self.check(due)
+
+    def device_health(self, device: Device) -> DeviceHealth:
+        if device.host not in self.health:
+            health = DeviceHealth()
+            health.next_check = time.monotonic() + self.interval
+            self.health[device.host] = health
+        return self.health[device.host]
+
+    async def check(self, devices: list[Device]):
+        loop = asyncio.get_running_loop()
+
+        async def probe(device: Device) -> Union[dict, None]:
+            if self.fetch_info is None or device.protocol not in wled_protocols:
+                return None
+            return await loop.run_in_executor(None, self.fetch_info, device.host)
+
+        infos = await asyncio.gather(*[probe(device) for device in devices])
+        for device, info in zip(devices, infos):
+            self.update(device, info)
+
+    def info(self, host: str) -> Union[dict, None]:
+        # What the device last answered to /json/info, None if it didn't answer the last probe
+        return self.infos.get(host)
+
+    def update(self, device: Device, info: Union[dict, None]):
+        if info is not None:
+            self.infos[device.host] = info
+        else:
+            self.infos.pop(device.host, None)
+        health = self.device_health(device)
+        reachable = health.check(device, info)
+        if device.paused and reachable:
+            logger.info(f"{device.host} is reachable again, resuming")
+            device.paused = False
+            device.next_due = 0.0
+            device.keepalive()
+        elif not device.paused and not reachable:
+            logger.warning(f"{device.host} is unreachable, pausing until it answers again")
+            device.paused = True
+        device.stats.reachable = not device.paused
+        health.next_check = time.monotonic() + (
+            self.retry_interval if device.paused or health.probation else self.interval
+        )
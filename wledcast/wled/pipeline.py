@@ -0,0 +1,167 @@
+import logging
+import queue
+import threading
+import time
+from argparse import Namespace
+from multiprocessing import Event
+from typing import Callable
+
+from wledcast import config
+from wledcast.capture import capture_screen, capture_xshm, image_processor
+from wledcast.capture.ambilight import EdgeSampler
+from wledcast.capture.change_detector import ChangeDetector
+from wledcast.metrics import StageTimes
+from wledcast.model import SharedBox, Size
+from wledcast.wled.sender import AsyncSender
+
+logger = logging.getLogger(__name__)
+
+
+def put_latest(q: queue.Queue, item):
+    # Never block the upstream stage: if the queue is full, replace the oldest frame
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+
+class ThreadedPipeline:
+    # Capture and processing run on threads of the main process, connected by a bounded queue,
+    # and processed frames go to the sender on the event loop. mss/XShm grabs and cv2 release
+    # the GIL, so for LED sized outputs this avoids the process pool's startup, pickling and
+    # per-process memory.
+    def __init__(
+        self,
+        sender: AsyncSender,
+        capture_box: SharedBox,
+        led_matrix_shape: Size,
+        conf_args: Namespace,
+        stop_event: Event,
+        on_frame: Callable,
+        stage_times: StageTimes,
+    ):
+        self.sender = sender
+        self.capture_box = capture_box
+        self.led_matrix_shape = led_matrix_shape
+        self.conf_args = conf_args
+        self.stop_event = stop_event
+        self.on_frame = on_frame
+        self.stage_times = stage_times
+        self.edge_sampler = (
+            EdgeSampler(config.edge_layout) if config.edge_layout is not None else None
+        )
+        self.captured = queue.Queue(maxsize=2)
+        self.threads = [
+            threading.Thread(target=self.capture_loop, name="capture", daemon=True),
+            *[
+                threading.Thread(
+                    target=self.process_loop, name=f"process-{i}", daemon=True
+                )
+                for i in range(max(1, conf_args.workers))
+            ],
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def is_alive(self) -> bool:
+        return all(thread.is_alive() for thread in self.threads)
+
+    def join(self):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+
+    def capture_loop(self):
+        try:
+            self.capture_frames()
+        except Exception as e:
+            logger.error(f"Capture thread failed: {e}")
+        finally:
+            self.stop_event.set()
+
+    def capture_frames(self):
+        conf_args = self.conf_args
+        source = capture_screen.open_stream_source(conf_args, self.led_matrix_shape)
+        stream = source is not None
+        if not stream:
+            # Screen sources are opened on this thread, mss connections are per thread
+            source = capture_screen.backends[conf_args.capture_backend]()
+            source.open()
+        watcher = (
+            capture_xshm.DamageWatcher()
+            if conf_args.capture_backend == "xshm"
+            and not stream
+            and not conf_args.capture_window
+            else None
+        )
+        detector = ChangeDetector(conf_args.keepalive) if conf_args.skip_static else None
+        next_frame = time.perf_counter()
+        try:
+            while not self.stop_event.is_set():
+                capture_box, moved = capture_screen.sync_geometry(
+                    source, self.capture_box
+                )
+                if moved and detector is not None:
+                    # A moved or resized box always gets a fresh frame
+                    detector.reset()
+                # While the followed window is hidden there's no box, and devices keep
+                # showing the last frame
+                if capture_box is not None:
+                    if watcher is not None:
+                        watcher.wait(capture_box, conf_args.keepalive)
+                    started = time.time()
+                    frame = capture_screen.capture(capture_box, source)
+                    captured = time.time()
+                    if frame is None and stream:
+                        break
+                    if frame is not None and (
+                        detector is None or detector.has_changed(frame)
+                    ):
+                        if source.reuses_buffer:
+                            # The next grab overwrites the buffer while this frame is processed
+                            frame = frame.copy()
+                        put_latest(
+                            self.captured, (started, captured, frame, source.pixel_format)
+                        )
+                    elif frame is None:
+                        logger.info("**Dropped frame**".ljust(40))
+
+                # Read every frame, the fps can be changed while casting
+                next_frame += 1 / conf_args.fps
+                delay = next_frame - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # Running behind, don't try to catch up with a burst of frames
+                    next_frame = time.perf_counter()
+        finally:
+            if watcher is not None:
+                watcher.close()
+            source.close()
+
+    def process_loop(self):
+        while not self.stop_event.is_set():
+            try:
+                started, captured, frame, pixel_format = self.captured.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            rgb_array = image_processor.process_raw_image(
+                frame,
+                self.led_matrix_shape,
+                config.filters.current(),
+                pixel_format,
+                config.regions,
+                self.edge_sampler,
+            )
+            processed = time.time()
+            self.sender.submit_threadsafe(rgb_array)
+            submitted = time.time()
+            self.stage_times.record(started, captured, processed, submitted)
+            self.on_frame((started, submitted))
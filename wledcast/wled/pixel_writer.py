@@ -1,49 +1,272 @@
+import logging
 import socket
+import uuid
+from abc import ABC, abstractmethod
+from typing import Union
 
 import numpy
 
+logger = logging.getLogger(__name__)
+
+
+def ddp_timecode(timestamp: float) -> int:
+    # DDP timecodes are the middle 32 bits of an NTP timestamp: 16 bits of seconds and 16 of
+    # fraction. Devices compare them with their own clock, so keep both synced to NTP.
+    ntp = timestamp + 2208988800  # seconds from 1900 to 1970
+    return (int(ntp) & 0xFFFF) << 16 | int(ntp % 1 * 65536)
 
-class PixelWriter:
-    DDP_MAX_DATALEN = 1200  # Maximum length of DDP data
-    DDP_DESTINATION_ID = 1  # Hardcoded Destination ID
+
+class UdpWriter(ABC):
+    # Splits a frame of RGB data into a protocol's packets. Packets are built in buffers kept
+    # between frames: headers are written once per frame size, after that a frame only
+    # copies its pixels and stamps the per-frame fields, eg. the sequence number.
+    port: int
+    header_length: int
+    chunk_length: int  # RGB bytes per packet
+    latchable = False
 
     def __init__(self, host):
         self.host = host
-        self.sequence_id = 1  # Initialize sequence ID
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # UDP socket
+        self.frame_length = None
+        # (packet, start, stop) for each packet of a frame of frame_length bytes
+        self.buffers: list[tuple[bytearray, int, int]] = []
+        self.push = True
 
-    def update_pixels(self, rgb_array: numpy.ndarray):
-        # Update the LED matrix via WLED in real-time using DDP
-        # Convert numpy array directly to bytes for better performance
-        byte_data = rgb_array.flatten().tobytes()
+    @abstractmethod
+    def header(self, index: int, start: int, stop: int) -> bytes:
+        # Header of packet index, carrying frame bytes start to stop
+        ...
 
-        self._send_ddp_data(byte_data)
+    def packet_length(self, data_length: int) -> int:
+        return self.header_length + data_length
 
-    def _create_ddp_packet(self, data, data_offset, is_last_packet=False):
-        header = bytearray(10)
-        header[0] = 0b01000000 | (0b00000001 if is_last_packet else 0)
-        header[1] = self.sequence_id
-        header[2] = 0x0B  # RGB, 8 bits per element
-        header[3] = self.DDP_DESTINATION_ID
-        header[4:8] = data_offset.to_bytes(4, byteorder="big")
-        header[8:10] = len(data).to_bytes(2, byteorder="big")
-        return header + data
+    def stamp(self, packet: bytearray, index: int):
+        # Per-frame header fields, nothing by default
+        pass
 
-    def _send_ddp_data(self, rgb_data):
-        data_offset = 0
+    def prepare(self, frame_length: int):
+        self.frame_length = frame_length
+        self.buffers = []
+        for index, start in enumerate(range(0, frame_length, self.chunk_length)):
+            stop = min(start + self.chunk_length, frame_length)
+            packet = bytearray(self.packet_length(stop - start))
+            packet[: self.header_length] = self.header(index, start, stop)
+            self.buffers.append((packet, start, stop))
 
-        for i in range(0, len(rgb_data), self.DDP_MAX_DATALEN):
-            packet_data = rgb_data[i : i + self.DDP_MAX_DATALEN]
-            is_last_packet = i + self.DDP_MAX_DATALEN >= len(rgb_data)
-            packet = self._create_ddp_packet(packet_data, data_offset, is_last_packet)
-            self.socket.sendto(packet, (self.host, 4048))
-            data_offset += len(packet_data)
+    def packets(self, rgb_data, push: bool = True) -> list[bytearray]:
+        # rgb_data is any bytes-like object, eg. bytes or a memoryview of a frame. The packets
+        # returned are overwritten by the next frame, so send them before building another.
+        # Without push the device is to hold the frame until a push packet, only DDP can.
+        self.push = push
+        rgb_data = memoryview(rgb_data)
+        if len(rgb_data) != self.frame_length:
+            self.prepare(len(rgb_data))
+        packets = []
+        for index, (packet, start, stop) in enumerate(self.buffers):
+            packet[self.header_length : self.header_length + stop - start] = rgb_data[start:stop]
+            self.stamp(packet, index)
+            packets.append(packet)
+        self.next_frame()
+        return packets
 
-        # Increment sequence ID for the next RGB dataset
-        self.sequence_id = (self.sequence_id + 1) % 16
+    def next_frame(self):
+        pass
+
+    def update_pixels(self, rgb_array: numpy.ndarray):
+        # A C-contiguous view of the frame, the pixels are only copied into the packets
+        rgb_data = memoryview(numpy.ascontiguousarray(rgb_array).reshape(-1))
+        for packet in self.packets(rgb_data):
+            self.socket.sendto(packet, (self.host, self.port))
 
     def close_socket(self):
         self.socket.close()
 
     def __del__(self):
         self.close_socket()
+
+
+class PixelWriter(UdpWriter):
+    # DDP, WLED's default and the only protocol without a limit on frame size
+    DDP_PORT = 4048
+    DDP_MAX_DATALEN = 1200  # Maximum length of DDP data
+    DDP_DESTINATION_ID = 1  # Hardcoded Destination ID
+    port = DDP_PORT
+    header_length = 10
+    chunk_length = DDP_MAX_DATALEN
+
+    DDP_FLAGS = 0b01000000  # version 1
+    DDP_PUSH = 0b00000001
+    DDP_TIMECODE = 0b00010000
+    # Latching with push packets, see wledcast.wled.sender.AsyncSender
+    latchable = True
+
+    def __init__(self, host):
+        super().__init__(host)
+        self.sequence_id = 1  # Initialize sequence ID
+        # Push packets, without and with a timecode
+        self.push_buffers = (bytearray(10), bytearray(14))
+        for buffer in self.push_buffers:
+            buffer[0] = self.DDP_FLAGS | self.DDP_PUSH | (self.DDP_TIMECODE if len(buffer) == 14 else 0)
+            buffer[2] = 0x0B
+            buffer[3] = self.DDP_DESTINATION_ID
+
+    def header(self, index, start, stop):
+        header = bytearray(10)
+        header[0] = self.DDP_FLAGS
+        header[2] = 0x0B  # RGB, 8 bits per element
+        header[3] = self.DDP_DESTINATION_ID
+        header[4:8] = start.to_bytes(4, byteorder="big")
+        header[8:10] = (stop - start).to_bytes(2, byteorder="big")
+        return header
+
+    def stamp(self, packet, index):
+        packet[1] = self.sequence_id
+        if index == len(self.buffers) - 1:
+            # The last packet of a frame has the PUSH flag set, unless a push packet follows
+            packet[0] = self.DDP_FLAGS | (self.DDP_PUSH if self.push else 0)
+
+    def next_frame(self):
+        # Increment sequence ID for the next RGB dataset
+        self.sequence_id = (self.sequence_id + 1) % 16
+
+    def push_packet(self, timecode: Union[int, None] = None) -> bytearray:
+        # A packet without data showing the last frame built, at the time of the timecode if
+        # given and the device supports it
+        buffer = self.push_buffers[timecode is not None]
+        buffer[1] = (self.sequence_id - 1) % 16
+        if timecode is not None:
+            buffer[10:14] = timecode.to_bytes(4, byteorder="big")
+        return buffer
+
+
+class DnrgbWriter(UdpWriter):
+    # WLED's UDP realtime protocol, for controllers without DDP. DNRGB sends up to 489 LEDs
+    # per packet, each with the index of its first LED.
+    port = 21324
+    DNRGB = 4
+    TIMEOUT = 2  # seconds WLED waits after the last packet before going back to its effects
+    header_length = 4
+    chunk_length = 489 * 3
+
+    def header(self, index, start, stop):
+        return bytes([self.DNRGB, self.TIMEOUT]) + (start // 3).to_bytes(2, byteorder="big")
+
+
+class DrgbWriter(DnrgbWriter):
+    # DRGB fits up to 490 LEDs in one packet without a start index. Larger frames are sent
+    # as DNRGB, which WLED also understands on the same port.
+    DRGB = 2
+    DRGB_MAX_LEDS = 490
+
+    def prepare(self, frame_length):
+        if frame_length > self.DRGB_MAX_LEDS * 3:
+            logger.info(
+                f"{frame_length // 3} LEDs don't fit in a DRGB packet, sending DNRGB to {self.host}"
+            )
+            self.header_length, self.chunk_length = DnrgbWriter.header_length, DnrgbWriter.chunk_length
+        else:
+            self.header_length, self.chunk_length = 2, self.DRGB_MAX_LEDS * 3
+        super().prepare(frame_length)
+
+    def header(self, index, start, stop):
+        if self.header_length == 2:
+            return bytes([self.DRGB, self.TIMEOUT])
+        return super().header(index, start, stop)
+
+
+class E131Writer(UdpWriter):
+    # E1.31 (sACN) data packets, unicast to the device. Each universe carries 170 LEDs,
+    # 510 of its 512 channels, and universes count up from the device's first one.
+    port = 5568
+    header_length = 126
+    chunk_length = 170 * 3
+    PRIORITY = 100
+
+    def __init__(self, host, universe: Union[int, None] = None):
+        super().__init__(host)
+        self.universe = 1 if universe is None else universe
+        self.cid = uuid.uuid4().bytes  # identifies this sender to the receiver
+        self.sequence = 0
+
+    def header(self, index, start, stop):
+        length = self.header_length + stop - start
+        header = bytearray(self.header_length)
+        # Root layer
+        header[0:2] = (0x0010).to_bytes(2, "big")  # preamble size
+        header[4:16] = b"ASC-E1.17\x00\x00\x00"
+        header[16:18] = (0x7000 | (length - 16)).to_bytes(2, "big")
+        header[18:22] = (0x00000004).to_bytes(4, "big")  # VECTOR_ROOT_E131_DATA
+        header[22:38] = self.cid
+        # Framing layer
+        header[38:40] = (0x7000 | (length - 38)).to_bytes(2, "big")
+        header[40:44] = (0x00000002).to_bytes(4, "big")  # VECTOR_E131_DATA_PACKET
+        header[44:52] = b"wledcast"  # source name, null padded to 64 bytes
+        header[108] = self.PRIORITY
+        header[113:115] = (self.universe + index).to_bytes(2, "big")
+        # DMP layer
+        header[115:117] = (0x7000 | (length - 115)).to_bytes(2, "big")
+        header[117] = 0x02  # VECTOR_DMP_SET_PROPERTY
+        header[118] = 0xA1  # address and data type
+        header[121:123] = (1).to_bytes(2, "big")  # address increment
+        header[123:125] = (1 + stop - start).to_bytes(2, "big")  # start code and channels
+        return header
+
+    def stamp(self, packet, index):
+        packet[111] = self.sequence
+
+    def next_frame(self):
+        self.sequence = (self.sequence + 1) % 256
+
+
+class ArtNetWriter(UdpWriter):
+    # Art-Net ArtDmx packets, 170 LEDs per universe like E1.31. Universes are numbered from
+    # the device's first one, 15 bit port addresses.
+    port = 6454
+    header_length = 18
+    chunk_length = 170 * 3
+
+    def __init__(self, host, universe: Union[int, None] = None):
+        super().__init__(host)
+        self.universe = 1 if universe is None else universe
+        self.sequence = 1
+
+    def packet_length(self, data_length):
+        # DMX data in ArtDmx must be an even number of channels
+        return self.header_length + data_length + data_length % 2
+
+    def header(self, index, start, stop):
+        header = bytearray(self.header_length)
+        header[0:8] = b"Art-Net\x00"
+        header[8:10] = (0x5000).to_bytes(2, "little")  # OpDmx
+        header[10:12] = (14).to_bytes(2, "big")  # protocol version
+        header[14:16] = (self.universe + index).to_bytes(2, "little")
+        header[16:18] = (stop - start + (stop - start) % 2).to_bytes(2, "big")
+        return header
+
+    def stamp(self, packet, index):
+        packet[12] = self.sequence
+
+    def next_frame(self):
+        # 0 means the receiver doesn't check the order, so go 1 to 255
+        self.sequence = self.sequence % 255 + 1
+
+
+# Writers by the protocol names devices are given, see wledcast.wled.sender.parse_device
+protocols = {
+    "ddp": PixelWriter,
+    "drgb": DrgbWriter,
+    "dnrgb": DnrgbWriter,
+    "e131": E131Writer,
+    "artnet": ArtNetWriter,
+}
+
+
+def create_writer(host: str, protocol: str = "ddp", universe: Union[int, None] = None) -> UdpWriter:
+    if protocol not in protocols:
+        raise ValueError(f"Unknown protocol {protocol}, use one of {', '.join(protocols)}")
+    if universe is not None:
+        if protocol not in ("e131", "artnet"):
+            raise ValueError(f"Only e131 and artnet devices have a universe, not {protocol}")
+        return protocols[protocol](host, universe)
+    return protocols[protocol](host)
@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+from argparse import Namespace
+from typing import Callable, Union
+
+from wledcast.metrics import StageTimes
+from wledcast.wled.sender import AsyncSender, DeviceStats
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceRate:
+    # Highest frame rate a device is believed to handle, found by additive increase and
+    # multiplicative decrease: it creeps up while the device keeps up with what it's sent
+    # and is cut back as soon as it shows signs of overload.
+    increase = 2  # fps added after each run of healthy periods
+    healthy_periods_needed = 2
+    backoff = 0.8
+    # Overloaded when more than this fraction of frames is lost or dropped
+    max_loss = 0.1
+
+    def __init__(self, host: str, ceiling: float):
+        self.host = host
+        self.ceiling = ceiling
+        self.healthy_periods = 0
+        self.loss: Union[float, None] = None
+        self.device_fps: Union[float, None] = None
+        # Counters at the last update
+        self.sent = self.dropped = self.errors = 0
+
+    def update(
+        self,
+        stats: DeviceStats,
+        elapsed: float,
+        target: float,
+        device_fps: Union[float, None],
+        min_fps: float,
+        max_fps: float,
+    ):
+        sent, dropped, errors = (
+            stats.sent - self.sent,
+            stats.dropped - self.dropped,
+            stats.errors - self.errors,
+        )
+        self.sent, self.dropped, self.errors = stats.sent, stats.dropped, stats.errors
+        sent_fps = sent / elapsed
+        self.device_fps = device_fps
+        # WLED reports how often it refreshes the LEDs, anything we send beyond that is lost
+        self.loss = (
+            max(0.0, 1 - device_fps / sent_fps)
+            if device_fps is not None and sent_fps > 0
+            else None
+        )
+        overloaded = (
+            errors > 0
+            or dropped > self.max_loss * max(sent, 1)
+            or (self.loss is not None and self.loss > self.max_loss)
+        )
+        if overloaded:
+            self.ceiling = max(min_fps, min(self.ceiling, sent_fps) * self.backoff)
+            self.healthy_periods = 0
+            return
+        self.healthy_periods += 1
+        # Only probe higher once the device is actually getting the current rate
+        if (
+            self.healthy_periods >= self.healthy_periods_needed
+            and sent_fps >= 0.9 * min(target, self.ceiling)
+        ):
+            self.ceiling = min(max_fps, self.ceiling + self.increase)
+            self.healthy_periods = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "ceiling": round(self.ceiling, 1),
+            "device_fps": self.device_fps,
+            "loss": round(self.loss, 3) if self.loss is not None else None,
+        }
+
+
+class RateController:
+    # Replaces a fixed --fps with one found at runtime: the highest rate every device and the
+    # pipeline itself can sustain. Each period it looks at what was sent, dropped and failed per
+    # device, WLED's own refresh rate from the /json/info device_info returns, and how many
+    # frames the pipeline could produce, then sets conf_args.fps, which the capture loops read
+    # every frame. device_info doesn't ask the device, the health monitor already does.
+    def __init__(
+        self,
+        sender: AsyncSender,
+        stage_times: StageTimes,
+        conf_args: Namespace,
+        device_info: Union[Callable[[str], Union[dict, None]], None] = None,
+        interval: float = 2.0,
+    ):
+        self.sender = sender
+        self.stage_times = stage_times
+        self.conf_args = conf_args
+        self.device_info = device_info
+        self.interval = interval
+        self.rates: dict[str, DeviceRate] = {}
+        self.pipeline_ceiling = float(conf_args.max_fps)
+        self.frames = stage_times.count
+        self.last_update = time.monotonic()
+
+    async def run(self, stop_event):
+        while not stop_event.is_set():
+            await asyncio.sleep(self.interval)
+            device_fps = {}
+            if self.device_info is not None:
+                for device in self.sender.devices:
+                    info = self.device_info(device.host) or {}
+                    device_fps[device.host] = info.get("leds", {}).get("fps")
+            self.update(device_fps)
+
+    def capacity(self) -> Union[float, None]:
+        # Frames per second the pipeline can produce, from how long recent frames took in it.
+        # What it did produce is no measure: frames are also missing while the picture is
+        # static, the damage watcher has nothing new or the followed window is hidden.
+        summary = self.stage_times.summary()
+        capture, process = summary["capture"]["p50"], summary["process"]["p50"]
+        workers = max(1, self.conf_args.workers)
+        if self.conf_args.executor == "thread":
+            # One thread captures, the workers process
+            seconds = max(capture, process / workers)
+        else:
+            # Each worker captures and processes its own frames
+            seconds = (capture + process) / workers
+        return 1 / seconds if seconds > 0 else None
+
+    def update(self, device_fps: dict[str, Union[float, None]]):
+        now = time.monotonic()
+        elapsed, self.last_update = now - self.last_update, now
+        target = self.conf_args.fps
+        min_fps, max_fps = self.conf_args.min_fps, self.conf_args.max_fps
+
+        for device in self.sender.devices:
+            if device.host not in self.rates:
+                self.rates[device.host] = DeviceRate(device.host, device.fps or target)
+            if device.paused:
+                # Nothing is sent while a device is unreachable, keep its rate for when it's back
+                continue
+            self.rates[device.host].update(
+                device.stats,
+                elapsed,
+                device.fps or target,
+                device_fps.get(device.host),
+                min_fps,
+                max_fps,
+            )
+
+        # The pipeline is the bottleneck when it can't produce frames as fast as the devices
+        # take them. With no frames this period there is nothing new to go by.
+        frames, self.frames = self.stage_times.count - self.frames, self.stage_times.count
+        capacity = self.capacity() if frames else None
+        if capacity is not None:
+            self.pipeline_ceiling = max(min_fps, min(max_fps, capacity))
+
+        # Each device is sent frames at its own ceiling, unless it was given its own rate, and
+        # the capture runs at the highest of them, as far as the pipeline keeps up
+        for device in self.sender.devices:
+            if not device.explicit_fps:
+                device.fps = max(min_fps, round(self.rates[device.host].ceiling))
+        needed = max(
+            (device.fps for device in self.sender.devices if device.fps is not None),
+            default=target,
+        )
+        fps = max(min_fps, round(min(self.pipeline_ceiling, needed)))
+        if fps != target:
+            logger.info(f"Adaptive frame rate: {target} -> {fps}fps")
+            self.conf_args.fps = fps
+
+    def state(self) -> dict:
+        return {
+            "fps": self.conf_args.fps,
+            "pipeline_ceiling": round(self.pipeline_ceiling, 1),
+            "devices": {host: rate.as_dict() for host, rate in self.rates.items()},
+        }
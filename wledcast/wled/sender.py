@@ -0,0 +1,457 @@
+import asyncio
+import logging
+import socket
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Callable, Union
+
+import cv2
+import numpy as np
+
+from wledcast.wled.pixel_writer import PixelWriter, create_writer, ddp_timecode, protocols
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DeviceSpec:
+    host: str
+    # Frames per second sent to the device, None for the cast's frame rate, see AsyncSender
+    fps: Union[float, None] = None
+    # (width, height) frames are resized to, None to send them as captured
+    resolution: Union[tuple[int, int], None] = None
+    # (x, y, width, height) part of the output frame sent to the device, None for all of it
+    crop: Union[tuple[int, int, int, int], None] = None
+    # How frames are sent, one of wledcast.wled.pixel_writer.protocols
+    protocol: str = "ddp"
+    # First universe for e131 and artnet, None for the default of 1
+    universe: Union[int, None] = None
+
+
+def parse_device(spec: Union[str, dict, DeviceSpec]) -> DeviceSpec:
+    # "host", "host@20fps", "host@32x16", "host@20fps@32x16" or with a crop of the output,
+    # "host@0,0,16,8", and a protocol, "host@dnrgb" or "host@e131:3" with its first universe,
+    # on the command line, or {"host": ..., "fps": 20, "resolution": "32x16",
+    # "crop": [0, 0, 16, 8], "protocol": "e131", "universe": 3} in a profile
+    if isinstance(spec, DeviceSpec):
+        return spec
+    if isinstance(spec, dict):
+        parts = [spec["host"]]
+        if spec.get("fps") is not None:
+            parts.append(f"{spec['fps']}fps")
+        if spec.get("resolution") is not None:
+            parts.append(spec["resolution"])
+        if spec.get("crop") is not None:
+            parts.append(",".join(str(value) for value in spec["crop"]))
+        if spec.get("protocol") is not None:
+            universe = spec.get("universe")
+            parts.append(spec["protocol"] + (f":{universe}" if universe is not None else ""))
+        spec = "@".join(str(part) for part in parts)
+    host, *options = spec.split("@")
+    device = DeviceSpec(host)
+    for option in options:
+        if option.split(":")[0] in protocols:
+            device.protocol, _, universe = option.partition(":")
+            device.universe = int(universe) if universe else None
+        elif option.endswith("fps"):
+            fps = option[:-3]
+            device.fps = float(fps) if "." in fps else int(fps)
+        elif option.count(",") == 3:
+            device.crop = tuple(int(value) for value in option.split(","))
+        elif "x" in option:
+            width, height = option.split("x")
+            device.resolution = (int(width), int(height))
+        else:
+            raise ValueError(f"Can't parse {option} in device {spec}")
+    return device
+
+
+def median(values) -> float:
+    return sorted(values)[len(values) // 2] if values else 0.0
+
+
+class DeviceStats:
+    def __init__(self):
+        self.sent = 0  # frames sent
+        self.dropped = 0  # frames replaced by a newer one before they could be sent
+        self.decimated = 0  # frames skipped to keep to the device's own frame rate
+        self.errors = 0  # socket errors, eg. ICMP port unreachable
+        self.paused = 0  # frames not sent while the device was unreachable
+        self.keepalives = 0  # last frame resent to keep the device in realtime mode
+        self.reachable = True
+        self.send_times = deque(maxlen=20)
+        self.send_durations = deque(maxlen=20)  # seconds spent handing a frame's packets to the OS
+        # Seconds from a frame reaching the sender until the packet that makes the device show
+        # it was handed to the OS. Compared between devices this is the send skew.
+        self.latch_delays = deque(maxlen=20)
+
+    def rate(self) -> float:
+        if len(self.send_times) < 2 or self.send_times[-1] == self.send_times[0]:
+            return 0.0
+        return (len(self.send_times) - 1) / (self.send_times[-1] - self.send_times[0])
+
+    def as_dict(self) -> dict:
+        return {
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "decimated": self.decimated,
+            "errors": self.errors,
+            "paused": self.paused,
+            "keepalives": self.keepalives,
+            "reachable": self.reachable,
+            "fps": round(self.rate(), 1),
+            "send_seconds": median(self.send_durations),
+            "latch_seconds": median(self.latch_delays),
+        }
+
+
+class DeviceProtocol(asyncio.DatagramProtocol):
+    def __init__(self, host: str, stats: DeviceStats):
+        self.host = host
+        self.stats = stats
+
+    def error_received(self, exc):
+        self.stats.errors += 1
+        logger.info(f"Socket error sending to {self.host}: {exc}")
+
+
+class Device:
+    # Transport buffer above which the device is considered backed up and frames are dropped
+    MAX_WRITE_BUFFER = 64 * 1024
+
+    def __init__(
+        self,
+        host: str,
+        fps: Union[float, None] = None,
+        resolution: Union[tuple[int, int], None] = None,
+        crop: Union[tuple[int, int, int, int], None] = None,
+        protocol: str = "ddp",
+        universe: Union[int, None] = None,
+    ):
+        self.host = host
+        self.fps = fps
+        # Whether fps was given for this device, otherwise it follows the cast's frame rate
+        self.explicit_fps = fps is not None
+        self.resolution = resolution
+        self.crop = crop
+        # When the next frame is due, with fps set
+        self.next_due = 0.0
+        # Frames are resized into this when the device's resolution differs from the capture's
+        self.buffer: Union[np.ndarray, None] = None
+        self.protocol = protocol
+        self.universe = universe
+        self.writer = create_writer(host, protocol, universe)
+        self.stats = DeviceStats()
+        self.transport: Union[asyncio.DatagramTransport, None] = None
+        # At most one frame waits to be sent, a newer frame replaces it
+        self.pending: Union[np.ndarray, None] = None
+        self.pending_submitted = 0.0
+        self.ready = asyncio.Event()
+        self.task: Union[asyncio.Task, None] = None
+        # What the device was last sent, read by the live preview, and when
+        self.last_sent: Union[np.ndarray, None] = None
+        self.last_send_time = 0.0
+        # Set while the device is unreachable, see wledcast.wled.health
+        self.paused = False
+        # Gets every frame sent, see wledcast.recording.FrameRecorder
+        self.recorder = None
+
+    @property
+    def latchable(self) -> bool:
+        return self.writer.latchable
+
+    async def open(self, sending_task: bool = True):
+        # Without a sending task, frames are sent by the AsyncSender, see --sync
+        loop = asyncio.get_running_loop()
+        addresses = await loop.getaddrinfo(
+            self.host,
+            self.writer.port,
+            family=socket.AF_INET,
+            type=socket.SOCK_DGRAM,
+        )
+        address = addresses[0][4]
+        # Reuse the writer's socket; connecting it lets us see ICMP errors from the device
+        self.writer.socket.setblocking(False)
+        self.writer.socket.connect(address)
+        self.transport, _ = await loop.create_datagram_endpoint(
+            lambda: DeviceProtocol(self.host, self.stats), sock=self.writer.socket
+        )
+        if sending_task:
+            self.task = asyncio.create_task(self.run())
+
+    def due(self) -> bool:
+        # Frames come at the capture rate, which is the highest any device needs. Keep those
+        # that fall on this device's own schedule. Due times advance by the device interval,
+        # not from the arrival time, so the average rate is right even with capture jitter.
+        if self.fps is None:
+            return True
+        interval = 1 / self.fps
+        now = time.monotonic()
+        if now < self.next_due - interval / 4:
+            return False
+        if now - self.next_due > interval:
+            # Start over after a gap, eg. static frames that weren't sent, instead of bursting
+            self.next_due = now
+        self.next_due += interval
+        return True
+
+    def submit(self, rgb_array: np.ndarray, submitted: Union[float, None] = None):
+        if self.paused:
+            self.stats.paused += 1
+            return
+        if not self.due():
+            self.stats.decimated += 1
+            return
+        if self.pending is not None:
+            self.stats.dropped += 1
+        self.pending = rgb_array
+        self.pending_submitted = time.perf_counter() if submitted is None else submitted
+        self.ready.set()
+
+    def backed_up(self) -> bool:
+        if self.transport.get_write_buffer_size() > self.MAX_WRITE_BUFFER:
+            # The OS isn't taking our packets, don't queue up stale frames
+            self.stats.dropped += 1
+            return True
+        return False
+
+    async def run(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            rgb_array, self.pending = self.pending, None
+            if self.backed_up():
+                continue
+            self.send(rgb_array)
+            self.stats.latch_delays.append(time.perf_counter() - self.pending_submitted)
+
+    def send(self, rgb_array: np.ndarray, push: bool = True):
+        if self.crop is not None:
+            # Devices can each show their own part of a composed output, see --regions
+            x, y, width, height = self.crop
+            rgb_array = rgb_array[y : y + height, x : x + width]
+        if self.resolution is not None and rgb_array.shape[1::-1] != self.resolution:
+            rgb_array = self.resize(rgb_array)
+        if self.recorder is not None:
+            self.recorder.record(self.host, rgb_array)
+        send_started = time.perf_counter()
+        # The writer copies the pixels straight into its packet buffers
+        rgb_data = memoryview(np.ascontiguousarray(rgb_array).reshape(-1))
+        for packet in self.writer.packets(rgb_data, push):
+            self.transport.sendto(packet)
+        self.stats.send_durations.append(time.perf_counter() - send_started)
+        # A copy, the resize buffer is reused and the preview tells new frames by identity
+        self.last_sent = rgb_array.copy()
+        self.last_send_time = time.monotonic()
+        self.stats.sent += 1
+        self.stats.send_times.append(time.time())
+
+    def keepalive(self):
+        # Resend the last frame as it was sent, eg. while the picture is static
+        if self.last_sent is None or self.transport.get_write_buffer_size() > self.MAX_WRITE_BUFFER:
+            return
+        rgb_data = memoryview(np.ascontiguousarray(self.last_sent).reshape(-1))
+        for packet in self.writer.packets(rgb_data):
+            self.transport.sendto(packet)
+        self.last_send_time = time.monotonic()
+        self.stats.keepalives += 1
+
+    def push(self, timecode: Union[int, None] = None):
+        self.transport.sendto(self.writer.push_packet(timecode))
+
+    def resize(self, rgb_array: np.ndarray) -> np.ndarray:
+        # Only frames that are actually sent are resized, into a buffer reused between frames
+        width, height = self.resolution
+        if self.buffer is None or self.buffer.shape != (height, width, 3):
+            self.buffer = np.empty((height, width, 3), dtype=np.uint8)
+        cv2.resize(rgb_array, self.resolution, dst=self.buffer, interpolation=cv2.INTER_AREA)
+        return self.buffer
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.transport is not None:
+            # Closing the transport closes the writer's socket
+            self.transport.close()
+
+
+class AsyncSender:
+    # Owns one datagram endpoint per device on the main event loop. Frames from the capture
+    # workers are handed over with submit_threadsafe and never block them, and each device
+    # sends from its own task so a slow or unreachable one can't hold up the others.
+    # With sync set, one task sends every device's data instead and then latches them all
+    # at once, so panels showing parts of one picture don't tear between devices:
+    # push: a DDP push packet to each device, sent back to back after all the data
+    # broadcast: one DDP push packet to sync_address, latching every device in one go
+    # sync_delay is how far ahead, in seconds, push packets ask devices to show the frame,
+    # in a DDP timecode. Devices that don't support timecodes show it on arrival.
+    # fps is the frame rate of devices that don't give their own, None to send them every
+    # frame. resolve returns the resolution of hosts added by set_hosts that don't give one,
+    # called on an executor as it may ask the device.
+    def __init__(
+        self,
+        hosts: list[Union[str, DeviceSpec]],
+        sync: Union[str, None] = None,
+        sync_address: str = "255.255.255.255",
+        sync_delay: float = 0.0,
+        recorder=None,
+        fps: Union[float, None] = None,
+        resolve: Union[Callable[[str], tuple[int, int]], None] = None,
+    ):
+        self.recorder = recorder
+        self.fps = fps
+        self.resolve = resolve
+        self.devices = [self.create_device(parse_device(host)) for host in hosts]
+        # Devices dropped by set_hosts stay open, switching back to them is free
+        self.idle: dict[str, Device] = {}
+        self.loop: Union[asyncio.AbstractEventLoop, None] = None
+        self.sync = sync
+        self.sync_address = sync_address
+        self.sync_delay = sync_delay
+        self.broadcast: Union[PixelWriter, None] = None
+        # The latest frame and when it was submitted, with sync set
+        self.pending: Union[tuple[np.ndarray, float], None] = None
+        self.ready = asyncio.Event()
+        self.task: Union[asyncio.Task, None] = None
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        for device in self.devices:
+            await self.open_device(device)
+        if self.sync == "broadcast":
+            self.broadcast = PixelWriter(self.sync_address)
+            self.broadcast.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+            self.broadcast.socket.setblocking(False)
+        if self.sync is not None:
+            self.task = asyncio.create_task(self.run_synchronized())
+
+    async def open_device(self, device: Device):
+        await device.open(sending_task=self.sync is None)
+        if self.sync is not None and not device.latchable:
+            logger.info(f"Only DDP devices can be latched, {device.host} shows frames on arrival")
+
+    def create_device(self, spec: DeviceSpec) -> Device:
+        device = Device(spec.host, spec.fps, spec.resolution, spec.crop, spec.protocol, spec.universe)
+        if not device.explicit_fps:
+            device.fps = self.fps
+        device.recorder = self.recorder
+        return device
+
+    def set_fps(self, fps: float) -> float:
+        # Devices without their own frame rate follow the cast's. Returns the capture rate,
+        # the highest any device needs.
+        self.fps = fps
+        for device in [*self.devices, *self.idle.values()]:
+            if not device.explicit_fps:
+                device.fps = fps
+        return self.capture_fps()
+
+    def capture_fps(self) -> Union[float, None]:
+        return max(
+            (device.fps for device in self.devices if device.fps is not None), default=self.fps
+        )
+
+    async def resolution(self, host: str) -> Union[tuple[int, int], None]:
+        if self.resolve is None:
+            return None
+        try:
+            return tuple(await self.loop.run_in_executor(None, self.resolve, host))
+        except (Exception, SystemExit) as e:
+            # Discovery exits when a device can't be asked, which is meant for startup
+            logger.warning(f"Can't get the resolution of {host}, sending frames as captured: {e}")
+            return None
+
+    async def set_hosts(self, hosts: list[Union[str, DeviceSpec]]):
+        # Frames go to these hosts from now on, sockets are only opened for new ones
+        devices = {device.host: device for device in self.devices}
+        devices.update(self.idle)
+        active = []
+        for spec in map(parse_device, hosts):
+            if spec.resolution is None:
+                spec = replace(spec, resolution=await self.resolution(spec.host))
+            device = devices.get(spec.host)
+            if device is not None and (device.protocol, device.universe) != (spec.protocol, spec.universe):
+                # A different protocol needs a different socket and packets
+                await devices.pop(spec.host).close()
+            if spec.host not in devices:
+                devices[spec.host] = self.create_device(spec)
+                await self.open_device(devices[spec.host])
+            device = devices.pop(spec.host)
+            device.explicit_fps = spec.fps is not None
+            device.fps = spec.fps if device.explicit_fps else self.fps
+            device.resolution, device.crop = spec.resolution, spec.crop
+            active.append(device)
+        self.devices = active
+        self.idle = devices
+
+    def submit(self, rgb_array: np.ndarray):
+        submitted = time.perf_counter()
+        if self.sync is None:
+            for device in self.devices:
+                device.submit(rgb_array, submitted)
+            return
+        if self.pending is not None:
+            for device in self.devices:
+                device.stats.dropped += 1
+        self.pending = (rgb_array, submitted)
+        self.ready.set()
+
+    async def run_synchronized(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            (rgb_array, submitted), self.pending = self.pending, None
+            devices = []
+            for device in self.devices:
+                if device.paused:
+                    device.stats.paused += 1
+                elif not device.due():
+                    device.stats.decimated += 1
+                elif not device.backed_up():
+                    devices.append(device)
+            for device in devices:
+                device.send(rgb_array, push=not device.latchable)
+                if not device.latchable:
+                    device.stats.latch_delays.append(time.perf_counter() - submitted)
+            self.latch([device for device in devices if device.latchable], submitted)
+
+    def latch(self, devices: list[Device], submitted: float):
+        if not devices:
+            return
+        timecode = ddp_timecode(time.time() + self.sync_delay) if self.sync_delay else None
+        if self.broadcast is not None:
+            try:
+                self.broadcast.socket.sendto(
+                    self.broadcast.push_packet(timecode), (self.sync_address, self.broadcast.port)
+                )
+            except OSError as e:
+                logger.info(f"Couldn't broadcast push to {self.sync_address}: {e}")
+        latched = time.perf_counter()
+        for device in devices:
+            if self.broadcast is None:
+                device.push(timecode)
+                latched = time.perf_counter()
+            device.stats.latch_delays.append(latched - submitted)
+
+    def submit_threadsafe(self, rgb_array: np.ndarray):
+        self.loop.call_soon_threadsafe(self.submit, rgb_array)
+
+    def latest_frame(self) -> Union[np.ndarray, None]:
+        return self.devices[0].last_sent if self.devices else None
+
+    def stats(self) -> dict[str, dict]:
+        stats = {device.host: device.stats.as_dict() for device in self.devices}
+        # How much later each device shows frames than the first one to show them
+        first = min((device["latch_seconds"] for device in stats.values()), default=0.0)
+        for device in stats.values():
+            device["skew_seconds"] = device["latch_seconds"] - first
+        return stats
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        if self.broadcast is not None:
+            self.broadcast.close_socket()
+        for device in [*self.devices, *self.idle.values()]:
+            await device.close()